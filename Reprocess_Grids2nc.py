@@ -1,84 +1,57 @@
 """This file converts netCDF using a path and globbing on it for both transect and grids
 can be run from terminal
+    python Reprocess_Grids2nc.py [--jobs=N] [--profile] [path]
 """
 import sys, getopt, os
-import makenc, glob
-import netCDF4 as nc
-import numpy as np
-import sblib as sb
-import py2netCDF as p2nc
-import datetime as DT
-from surveyToNetCDF import fillFRFgridTemplate
-from surveyToNetCDF import preprocessGridFile
+import glob
+import batchConvert
 
-def convertText2NetCDF(globPath):
+
+def convertText2NetCDF(globPath, jobs=1, profile=False):
     """This function searches the given path for both grids and transect files present at the FRF to make the data into
     netCDF files.
     
     the below yaml's have to be in the same folder as the
+
+    files are converted across jobs worker processes, each file on its own so one bad file does not stop the rest.
+    A record for every file is written to Bathy_LOG.jsonl and the errors to Bathy_LOG.log in globPath
     
     :param globPath: a path to find the yaml files and the data
-    :return:
+    :param jobs: number of worker processes (default 1, None uses every core)
+    :param profile: profile every conversion, reports per file and the aggregate stacks (aggregate.folded) go to
+            globPath/profile (default False), see profiling
+    :return: list of records, see batchConvert.convertFile
     
     """
-    ## INPUTS
-    yamlPath = 'yamlFiles/'
-    gridGlobalYaml = yamlPath + 'grid_Global.yml'  # grid Global yaml
-    gridVarYaml = yamlPath + 'grid_variables.yml'  # grid yaml location
-    transectGlobalYaml = yamlPath + 'transect_Global.yml'
-    transectVarYaml = yamlPath + 'transect_variables.yml'
-
     gridList = glob.glob(os.path.join(globPath, 'FRF_*latlon.txt')) # searching for grid files
     filelist = glob.glob(os.path.join(globPath, 'FRF_*.csv')) # searching for transect Files
 
     logFile = os.path.join(globPath, 'Bathy_LOG.log')
 
-    errorFname, errors = [],[]
-    # creating a list of transect files to look for
-    print('Converting %d Transect (csv) file(s) to netCDF ' % len(filelist))
-    for transectFname in filelist:
-        try:
-            Tofname = transectFname[:-3] + 'nc'
-            print('  <II> Making %s ' % Tofname)
-            # first make transect
-            TransectDict = sb.import_FRF_Transect(transectFname)  # import frf Transect product
-            TransectDict['time'] = nc.date2num(TransectDict['time'], 'seconds since 1970-01-01')
-            makenc.makenc_FRFTransect(bathyDict=TransectDict, ofname=Tofname, globalYaml=transectGlobalYaml, varYaml=transectVarYaml)
-        except Exception as e:
-            print(e)
-            errors.append(e)
-            errorFname.append(transectFname)
-
-    print('Converting %d Grid (txt) file to netCDF ' % len(gridList))
-    for gridFname in gridList:
-        try:
-            # load text file
-            outDict = sb.importFRFgrid(gridFname)
-            
-            outDict, date = preprocessGridFile(outDict, gridFname)
-            ofname = 'FRF_geomorphology_DEMs_surveyDEM_{}.nc'.format(date)
-            print('  <II> Making %s ' %ofname)
-            p2nc.makenc_generic(ofname, gridGlobalYaml, gridVarYaml, data=outDict)
-
-        except Exception as e:
-            print(e)
-            errors.append(e)
-            errorFname.append(gridFname)
+    print('Converting %d Transect (csv) file(s) and %d Grid (txt) file(s) to netCDF ' % (len(filelist), len(gridList)))
+    records = batchConvert.runBatch(filelist + gridList, jobs=jobs, logFile=os.path.join(globPath, 'Bathy_LOG.jsonl'),
+                                    transectOptions={'ofname': '{base}.nc', 'sortSurvey': False},
+                                    gridOptions={'ofname': 'FRF_geomorphology_DEMs_surveyDEM_{date}.nc'},
+                                    profileDir=os.path.join(globPath, 'profile') if profile else None)
 
     # log errors
     # log errors that were encountered during file creation
     f = open(logFile, 'w+')  # opening file
     f.write('File, Error\n')  # writing headers
-    for aa in range(0, len(errorFname)):  # looping through errors
-            f.write('%s,\n %s\n----------------------------\n\n' %(errorFname[aa], errors[aa]))
+    for record in records:  # looping through errors
+        if record['status'] != 'ok':
+            f.write('%s,\n %s\n----------------------------\n\n' %(record['file'], record['error']))
     f.close()
 
+    return records
+
 if __name__ == "__main__":
-    opts, args = getopt.getopt(sys.argv[1:], "h", ["help"])
+    opts, args = getopt.getopt(sys.argv[1:], "hj:", ["help", "jobs=", "profile"])
+    opts = dict(opts)
     #  Location of where to look for files to convert
-    if len(args) is 0:
+    if len(args) == 0:
         globPath = '.'
     else:
         globPath = args[0]
 
-    convertText2NetCDF(globPath)
\ No newline at end of file
+    convertText2NetCDF(globPath, jobs=int(opts.get('--jobs', opts.get('-j', 1))), profile='--profile' in opts)
@@ -0,0 +1,364 @@
+"""Parallel batch conversion of FRF survey transect (csv) and grid (txt) files to netCDF.
+
+Each file is converted in its own task on a process pool, a failure in one file is recorded and never stops the
+others.  Every file gets a structured record (input, output, status, error, traceback, timing) that is written as
+one JSON line to the batch log as soon as the file finishes, with the timings of its conversion stages (see
+stageMetrics), which can also be summarised in a Prometheus textfile.
+
+With readers (--readers) the batch runs as a pipeline in this process instead: reader threads prefetch and parse the
+upcoming surveys, a transform thread places them on the FRF templates and this thread alone writes the netCDF files,
+so reading from the archive mount overlaps with compression while HDF5 is only ever used from one thread.
+
+can be run from terminal
+    python batchConvert.py [--jobs=N | --readers=N] [--log=batchLog.jsonl] [--prometheus=file.prom]
+                           [--index=surveyIndex.sqlite] [--rewrite-source] file_or_directory [...]
+"""
+import sys, getopt, os, glob
+import json
+import time
+import traceback
+import threading
+import queue
+import datetime as DT
+import stageMetrics
+import profiling
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# convertTransectFile/convertGridFile options used by the reading stage of the pipeline, the rest are for writing
+pipelineReadOptions = {'transect': ['rewriteSource', 'sortSurvey'], 'grid': []}
+
+
+def fileKind(fname):
+    """Decides how a file is converted from its extension.
+
+    Args:
+        fname: input file name
+
+    Returns:
+        'transect' for .csv, 'grid' for .txt, None for anything else
+
+    """
+    extension = fname.split('.')[-1].strip("'").lower()
+    if extension == 'csv':
+        return 'transect'
+    elif extension == 'txt':
+        return 'grid'
+    return None
+
+
+def findSurveyFiles(paths):
+    """Expands files, directories and glob patterns into the list of survey files to convert.
+
+    Args:
+        paths: list of file names, directories (searched for FRF_*.csv and FRF_*latlon.txt) or glob patterns
+
+    Returns:
+        sorted list of unique survey file names
+
+    """
+    fileList = []
+    for path in paths:
+        if os.path.isdir(path):
+            fileList.extend(glob.glob(os.path.join(path, 'FRF_*.csv')))        # searching for transect Files
+            fileList.extend(glob.glob(os.path.join(path, 'FRF_*latlon.txt')))  # searching for grid files
+        else:
+            fileList.extend(glob.glob(path) or [path])
+    return sorted(set(fileList))
+
+
+def convertFile(fname, transectOptions=None, gridOptions=None, profileDir=None):
+    """Converts one survey file, catching every error so a bad file is recorded instead of stopping the batch.
+
+    Args:
+        fname: transect (.csv) or grid (.txt) file
+        transectOptions: keyword arguments for surveyToNetCDF.convertTransectFile (default=None)
+        gridOptions: keyword arguments for surveyToNetCDF.convertGridFile (default=None)
+        profileDir: profile the conversion, writing its reports to this directory (default=None, not profiled)
+            see profiling.profiled
+
+    Returns:
+        record dictionary
+            'file': input file name
+
+            'kind': 'transect' or 'grid'
+
+            'status': 'ok' or 'error'
+
+            'output': netCDF file name written (None on error)
+
+            'error', 'traceback': error message and traceback (None when ok)
+
+            'started': ISO time the conversion started
+
+            'seconds': wall time of the conversion
+
+            'pid': worker process id
+
+            'stages': stage timing records of the conversion (see stageMetrics.stage)
+
+            'profile': profile report file name without extension (None when not profiled)
+
+    """
+    import surveyToNetCDF  # imported in the worker so the parent process stays light
+    record = _newRecord(fname)
+    stageMetrics.collectStages()  # drop anything left over in this worker
+    start = time.time()
+    try:
+        if profileDir is not None:
+            record['profile'] = os.path.join(profileDir, os.path.splitext(os.path.basename(fname))[0])
+            with profiling.profiled(record['profile']):
+                record['output'] = _convert(fname, record['kind'], transectOptions, gridOptions)
+        else:
+            record['output'] = _convert(fname, record['kind'], transectOptions, gridOptions)
+        record['status'] = 'ok'
+    except Exception as e:
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+        record['traceback'] = traceback.format_exc()
+    record['seconds'] = time.time() - start
+    record['stages'] = stageMetrics.collectStages()
+
+    return record
+
+
+def _convert(fname, kind, transectOptions, gridOptions):
+    """runs the surveyToNetCDF conversion for the kind of file, returns the output file name"""
+    import surveyToNetCDF  # imported in the worker so the parent process stays light
+    if kind == 'transect':
+        return surveyToNetCDF.convertTransectFile(fname, **(transectOptions or {}))
+    elif kind == 'grid':
+        return surveyToNetCDF.convertGridFile(fname, **(gridOptions or {}))
+    raise ValueError('do not know how to convert {}'.format(fname))
+
+
+def pipelineConvert(fileList, readers=2, queueSize=2, transectOptions=None, gridOptions=None):
+    """Converts survey files in a pipeline, overlapping reading the inputs with writing the netCDF files.
+
+    Reader threads take the files in order and parse them (readTransectFile/readGridFile of surveyToNetCDF), a
+    transform thread prepares them for writing (prepareTransectData/prepareGridData) and the calling thread writes
+    them (writeTransectFile/writeGridFile), so only one thread ever holds netCDF/HDF5 handles.  The queues between
+    the stages hold queueSize surveys each and readers never get further than readers + 2 * queueSize files ahead of
+    the writer, which bounds the memory used.  Files are written in the order of fileList (so appending to a cube
+    stays in time order), a file that fails in any stage is recorded and the pipeline carries on.
+
+    Args:
+        fileList: list of transect (.csv) and grid (.txt) files
+        readers: number of reader threads (default=2)
+        queueSize: surveys each queue between the stages holds (default=2)
+        transectOptions: keyword arguments of surveyToNetCDF.convertTransectFile (default=None)
+        gridOptions: keyword arguments of surveyToNetCDF.convertGridFile (default=None)
+
+    Yields:
+        record of each file (see convertFile) as it is written, in the order of fileList
+
+    """
+    import surveyToNetCDF
+    window = readers + 2 * queueSize  # most files between starting to read and being written
+    parsed, prepared = queue.Queue(maxsize=queueSize), queue.Queue(maxsize=queueSize)
+    done, stop = object(), threading.Event()
+    progress = {'next': 0, 'written': 0}
+    progressChanged = threading.Condition()
+    options = {'transect': dict(transectOptions or {}), 'grid': dict(gridOptions or {})}
+    readOptions = {kind: {key: value for key, value in options[kind].items() if key in pipelineReadOptions[kind]}
+                   for kind in options}
+    writeOptions = {kind: {key: value for key, value in options[kind].items() if key not in pipelineReadOptions[kind]}
+                    for kind in options}
+
+    def _put(q, item):  # gives up when the pipeline is stopped, so no thread is left blocked
+        while not stop.is_set():
+            try:
+                return q.put(item, timeout=0.5)
+            except queue.Full:
+                pass
+
+    def _get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                pass
+        return done
+
+    def _failed(item, e):
+        item['record']['error'] = '{}: {}'.format(type(e).__name__, e)
+        item['record']['traceback'] = traceback.format_exc()
+
+    def _read():
+        while True:
+            with progressChanged:
+                while not stop.is_set() and progress['next'] < len(fileList) and \
+                        progress['next'] >= progress['written'] + window:
+                    progressChanged.wait(0.5)
+                if stop.is_set() or progress['next'] >= len(fileList):
+                    break
+                index = progress['next']
+                progress['next'] += 1
+            fname = fileList[index]
+            item = {'index': index, 'record': _newRecord(fname), 'start': time.time(), 'data': None}
+            try:
+                kind = item['record']['kind']
+                if kind == 'transect':
+                    item['data'] = surveyToNetCDF.readTransectFile(fname, **readOptions[kind])
+                elif kind == 'grid':
+                    item['data'] = surveyToNetCDF.readGridFile(fname)
+                else:
+                    raise ValueError('do not know how to convert {}'.format(fname))
+            except Exception as e:
+                _failed(item, e)
+            _put(parsed, item)
+        _put(parsed, done)
+
+    def _transform():
+        finished = 0
+        while finished < readers:
+            item = _get(parsed)
+            if item is done:
+                finished += 1
+                continue
+            if item['record']['error'] is None:
+                try:
+                    if item['record']['kind'] == 'transect':
+                        item['data'] = (surveyToNetCDF.prepareTransectData(item['data']),)
+                    else:
+                        item['data'] = surveyToNetCDF.prepareGridData(item['data'], item['record']['file'])
+                except Exception as e:
+                    _failed(item, e)
+            _put(prepared, item)
+        _put(prepared, done)
+
+    threads = [threading.Thread(target=_read, name='surveyReader{}'.format(i), daemon=True) for i in range(readers)]
+    threads.append(threading.Thread(target=_transform, name='surveyTransform', daemon=True))
+    for thread in threads:
+        thread.start()
+    waiting, stages = {}, {}  # surveys prepared ahead of their turn, stage records not yet handed to a record
+    try:
+        for index in range(len(fileList)):
+            while index not in waiting:
+                item = _get(prepared)
+                if item is done:
+                    raise RuntimeError('pipeline stopped before {} was converted'.format(fileList[index]))
+                waiting[item['index']] = item
+            item = waiting.pop(index)
+            record = item['record']
+            if record['error'] is None:
+                try:
+                    if record['kind'] == 'transect':
+                        record['output'] = surveyToNetCDF.writeTransectFile(*item['data'], record['file'],
+                                                                            **writeOptions['transect'])
+                    else:
+                        record['output'] = surveyToNetCDF.writeGridFile(*item['data'], record['file'],
+                                                                        **writeOptions['grid'])
+                    record['status'] = 'ok'
+                except Exception as e:
+                    _failed(item, e)
+            item['data'] = None
+            with progressChanged:
+                progress['written'] += 1
+                progressChanged.notify_all()
+            for stage in stageMetrics.collectStages():
+                stages.setdefault(stage['file'], []).append(stage)
+            record['seconds'] = time.time() - item['start']
+            record['stages'] = stages.pop(record['file'], [])
+            yield record
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def _newRecord(fname):
+    """record of a file about to be converted, see convertFile"""
+    return {'file': fname, 'kind': fileKind(fname), 'status': 'error', 'output': None, 'error': None,
+            'traceback': None, 'started': DT.datetime.now().isoformat(), 'seconds': None, 'pid': os.getpid(),
+            'profile': None}
+
+
+def runBatch(fileList, jobs=1, logFile=None, callback=None, metricsFile=None, **kwargs):
+    """Converts a list of survey files across a pool of worker processes.
+
+    Args:
+        fileList: list of transect (.csv) and grid (.txt) files
+        jobs: number of worker processes, 1 converts in this process (default=1, None uses every core)
+        logFile: JSON lines file that gets one record per file as it finishes (default=None, no log written)
+        callback: function called with each record as its file finishes, in this process (default=None)
+        metricsFile: Prometheus textfile summarising the stage timings of the batch (default=None, not written)
+
+    Keyword Args:
+        'transectOptions': keyword arguments for surveyToNetCDF.convertTransectFile
+        'gridOptions': keyword arguments for surveyToNetCDF.convertGridFile
+        'profileDir': profile every conversion into this directory, the sampled stacks of the whole batch are added
+            up in profileDir/aggregate.folded (see profiling)
+        'readers': run the batch as a pipeline in this process with this many reader threads instead of on the
+            pool of jobs (default=0, not pipelined), see pipelineConvert
+        'queueSize': parsed surveys each pipeline queue holds (default=2)
+
+    Returns:
+        list of records (see convertFile) in the order the files finished
+
+    """
+    if jobs is None:
+        jobs = os.cpu_count()
+    readers, queueSize = kwargs.pop('readers', 0), kwargs.pop('queueSize', 2)
+    if readers and kwargs.get('profileDir', None) is not None:
+        raise ValueError('profileDir can not be combined with readers, profile with jobs instead')
+    records = []
+    log = open(logFile, 'w') if logFile is not None else None
+
+    def _finish(record):
+        records.append(record)
+        print('  <{}> {} {}'.format('II' if record['status'] == 'ok' else 'EE', record['file'],
+                                    record['output'] if record['status'] == 'ok' else record['error']))
+        if log is not None:
+            log.write(json.dumps(record) + '\n')
+            log.flush()
+        if callback is not None:
+            callback(record)
+
+    try:
+        if readers:
+            print('Converting %d file(s) to netCDF with %d reader(s)' % (len(fileList), readers))
+            for record in pipelineConvert(fileList, readers=readers, queueSize=queueSize, **kwargs):
+                _finish(record)
+        elif jobs <= 1:
+            print('Converting %d file(s) to netCDF with %d job(s)' % (len(fileList), jobs))
+            for fname in fileList:
+                _finish(convertFile(fname, **kwargs))
+        else:
+            print('Converting %d file(s) to netCDF with %d job(s)' % (len(fileList), jobs))
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = {pool.submit(convertFile, fname, **kwargs): fname for fname in fileList}
+                for future in as_completed(futures):
+                    try:
+                        _finish(future.result())
+                    except BrokenProcessPool as e:  # a worker died outright (eg. a crash in a C library)
+                        _finish({'file': futures[future], 'kind': fileKind(futures[future]), 'status': 'error',
+                                 'output': None, 'error': 'BrokenProcessPool: {}'.format(e), 'traceback': None,
+                                 'started': None, 'seconds': None, 'pid': None, 'stages': [], 'profile': None})
+    finally:
+        if log is not None:
+            log.close()
+        if metricsFile is not None:
+            stageMetrics.writePrometheus([stage for record in records for stage in record['stages']], metricsFile)
+        if kwargs.get('profileDir', None) is not None:
+            folded = [record['profile'] + '.folded' for record in records
+                      if record.get('profile') and os.path.isfile(record['profile'] + '.folded')]
+            print('  <II> profile reports in %s, aggregate stacks %s' % (kwargs['profileDir'], profiling.mergeFolded(
+                    folded, os.path.join(kwargs['profileDir'], 'aggregate.folded'))))
+
+    nErrors = sum(record['status'] != 'ok' for record in records)
+    print('Converted %d file(s), %d error(s)' % (len(records) - nErrors, nErrors))
+    return records
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "hj:", ["help", "jobs=", "readers=", "log=", "prometheus=",
+                                                      "index=", "rewrite-source"])
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts or len(args) == 0:
+        print(__doc__)
+        sys.exit(0)
+    jobs = int(opts.get('--jobs', opts.get('-j', 1)))
+    runBatch(findSurveyFiles(args), jobs=jobs, logFile=opts.get('--log', 'batchLog.jsonl'),
+             metricsFile=opts.get('--prometheus', None), readers=int(opts.get('--readers', 0)),
+             transectOptions={'rewriteSource': '--rewrite-source' in opts, 'indexFile': opts.get('--index', None)},
+             gridOptions={'indexFile': opts.get('--index', None)})
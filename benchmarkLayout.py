@@ -0,0 +1,209 @@
+"""Read pattern benchmark of netCDF storage layouts for the FRF survey DEM.
+
+Writes a synthetic survey DEM (a survey patch inside the fill of the FRF template, as the real files are) with each
+layout through py2netCDF.write_data_to_nc, then times the reads THREDDS clients make
+    point  - one node of every file, each read from a freshly opened file (time series at a location)
+    line   - a cross-shore profile (one yFRF row)
+    map    - the whole elevation field
+and reports them with the write time and file size.  The same surveys are then appended one at a time to a cube along
+an unlimited time dimension (as py2netCDF.appendnc_generic does) and the cube reads are timed
+    series - one node through every survey of the cube
+    survey - the whole elevation field of one survey
+so the time depth of the chunks is measured against both.  The layouts are the variable yaml layout keys (see
+py2netCDF.compileWritePlan), so a layout that wins here can be copied straight into grid_variables.yml.
+
+can be run from terminal
+    python benchmarkLayout.py [--dx=meters] [--reps=N] [--surveys=N] [--dir=path]
+"""
+import sys, getopt, os
+import time
+import tempfile
+import numpy as np
+import netCDF4 as nc
+import py2netCDF as p2nc
+
+# layout keys of elevation (yaml form) for each layout benchmarked
+layouts = {'default': {},
+           'contiguous': {'contiguous': True},
+           'tiles 1x100x100': {'chunksizes': [1, 100, 100], 'shuffle': True, 'complevel': 4},
+           'tiles 1x50x50': {'chunksizes': [1, 50, 50], 'shuffle': True, 'complevel': 4},
+           'tiles 16x50x50': {'chunksizes': [16, 50, 50], 'shuffle': True, 'complevel': 4},
+           'tiles 64x25x25': {'chunksizes': [64, 25, 25], 'shuffle': True, 'complevel': 4},
+           'rows': {'chunksizes': [1, 1, 100000], 'shuffle': True, 'complevel': 4},
+           'whole map': {'chunksizes': [1, 100000, 100000], 'shuffle': True, 'complevel': 4}}
+
+
+def makeSurvey(dx=1., gridXmin=50, gridXmax=950, gridYmin=-100, gridYmax=1100):
+    """synthetic survey DEM on the FRF template, a survey patch surrounded by fill (-999)"""
+    xFRF = np.linspace(gridXmin, gridXmax, num=int((gridXmax - gridXmin) / dx + 1))
+    yFRF = np.linspace(gridYmin, gridYmax, num=int((gridYmax - gridYmin) / dx + 1))
+    xx, yy = np.meshgrid(xFRF, yFRF)
+    elevation = np.round(5 - 0.012 * xx + 0.5 * np.sin(yy / 40.) * np.exp(-xx / 300.), 3)
+    elevation[(xx > 600) | (yy < 0) | (yy > 1000)] = -999.  # outside of the surveyed area
+    return {'time': np.array([0.]), 'xFRF': xFRF, 'yFRF': yFRF, 'elevation': elevation[np.newaxis]}
+
+
+def _writePlan(layout):
+    """write plan of the benchmark variables with the elevation layout"""
+    varMetaData = {'_variables': ['time', 'xFRF', 'yFRF', 'elevation'], '_dimensions': ['time', 'xFRF', 'yFRF'],
+                   'time': {'name': 'time', 'units': 'seconds since 1970-01-01', 'data_type': 'f8', 'dim': ['time']},
+                   'xFRF': {'name': 'xFRF', 'units': 'm', 'data_type': 'f8', 'dim': ['xFRF']},
+                   'yFRF': {'name': 'yFRF', 'units': 'm', 'data_type': 'f8', 'dim': ['yFRF']},
+                   'elevation': dict({'name': 'elevation', 'units': 'm', 'data_type': 'f8',
+                                      'dim': ['time', 'yFRF', 'xFRF'], 'fill_value': '-999'}, **layout)}
+    return p2nc.compileWritePlan(varMetaData)
+
+
+def writeLayout(fname, data, layout):
+    """writes the survey with the elevation layout, returns the write time (s)"""
+    plan = _writePlan(layout)
+    start = time.perf_counter()
+    fid = p2nc.init_nc_file(fname, {})
+    p2nc._createDimensions(fid, plan, data)
+    p2nc.write_data_to_nc(fid, plan, data)
+    fid.close()
+    return time.perf_counter() - start
+
+
+def writeCube(fname, data, layout, surveys=32):
+    """Appends surveys (the survey, shifted a little each time) to a cube with the elevation layout.
+
+    Each survey is written from a fresh open of the cube as py2netCDF.appendnc_generic does, so layouts more than one
+    survey deep pay for rewriting their partly filled chunks.
+
+    Returns:
+        write time (s) of all the surveys
+
+    """
+    plan = _writePlan(layout)
+    start = time.perf_counter()
+    fid = p2nc.init_nc_file(fname, {})
+    p2nc._createDimensions(fid, plan, data, unlimited=['time'])
+    p2nc.write_data_to_nc(fid, plan, data)
+    fid.close()
+    surveyed = data['elevation'][0] != -999.
+    for index in range(1, surveys):
+        with nc.Dataset(fname, 'a') as fid:
+            fid['time'][index] = index * 86400. * 30
+            fid['elevation'][index] = np.where(surveyed, data['elevation'][0] + 0.01 * index, -999.)
+    return time.perf_counter() - start
+
+
+def timeCubeReads(fname, reps=50, seed=0):
+    """Times the read patterns of a cube.
+
+    Args:
+        fname: cube written by writeCube
+        reps: number of reads of each pattern (default=50)
+        seed: random seed of the locations read (default=0)
+
+    Returns:
+        dictionary of mean seconds per read of 'series' and 'survey'
+
+    """
+    rng = np.random.default_rng(seed)
+    with nc.Dataset(fname) as fid:
+        nt, ny, nx = fid['elevation'].shape
+    times = {}
+    for pattern in ['series', 'survey']:
+        count = reps if pattern == 'series' else max(1, reps // 10)
+        start = time.perf_counter()
+        for _ in range(count):
+            j, i, t = rng.integers(0, ny), rng.integers(0, nx), rng.integers(0, nt)
+            with nc.Dataset(fname) as fid:
+                if pattern == 'series':
+                    fid['elevation'][:, j, i]
+                else:
+                    fid['elevation'][t]
+        times[pattern] = (time.perf_counter() - start) / count
+    return times
+
+
+def timeReads(fname, reps=50, seed=0):
+    """Times the read patterns of one file.
+
+    Args:
+        fname: netCDF file written by writeLayout
+        reps: number of reads of each pattern (default=50)
+        seed: random seed of the locations read (default=0)
+
+    Returns:
+        dictionary of mean seconds per read of 'point', 'line' and 'map'
+
+    """
+    rng = np.random.default_rng(seed)
+    with nc.Dataset(fname) as fid:
+        ny, nx = fid['elevation'].shape[1:]
+    times = {}
+    for pattern in ['point', 'line', 'map']:
+        start = time.perf_counter()
+        for _ in range(reps if pattern != 'map' else max(1, reps // 10)):
+            j, i = rng.integers(0, ny), rng.integers(0, nx)
+            with nc.Dataset(fname) as fid:  # a fresh open every read, as a client aggregating many files does
+                if pattern == 'point':
+                    fid['elevation'][0, j, i]
+                elif pattern == 'line':
+                    fid['elevation'][0, j, :]
+                else:
+                    fid['elevation'][:]
+        times[pattern] = (time.perf_counter() - start) / (reps if pattern != 'map' else max(1, reps // 10))
+    return times
+
+
+def runBenchmark(dx=1., reps=50, surveys=32, outDir=None):
+    """Writes and reads the survey and a cube of surveys with every layout, printing a table of the results.
+
+    Args:
+        dx: template resolution (m) (default=1)
+        reps: number of reads of each pattern (default=50)
+        surveys: number of surveys in the cube (default=32)
+        outDir: directory for the benchmark files (default=None, a temporary directory removed afterwards)
+
+    Returns:
+        dictionary of layout name: dictionary of 'write', 'size', 'point', 'line', 'map' (single survey file) and
+        'cubeWrite', 'cubeSize', 'series', 'survey' (cube, not for contiguous layouts)
+
+    """
+    data = makeSurvey(dx)
+    tmp = None
+    if outDir is None:
+        tmp = tempfile.TemporaryDirectory()
+        outDir = tmp.name
+    print('elevation %d x %d (dx=%g m), %d reads per pattern, %d surveys in the cube' % (
+            data['elevation'].shape[1], data['elevation'].shape[2], dx, reps, surveys))
+    print('%-16s %8s %8s %9s %8s %8s | %10s %8s %10s %10s' % ('layout', 'write s', 'size MB', 'point ms', 'line ms',
+                                                            'map ms', 'cube wr s', 'cube MB', 'series ms',
+                                                            'survey ms'))
+    results = {}
+    try:
+        for name, layout in layouts.items():
+            fname = os.path.join(outDir, 'layout_{}.nc'.format(name.replace(' ', '_')))
+            result = {'write': writeLayout(fname, data, layout), 'size': os.path.getsize(fname)}
+            result.update(timeReads(fname, reps))
+            results[name] = result
+            line = '%-16s %8.3f %8.2f %9.3f %8.3f %8.1f |' % (name, result['write'], result['size'] / 1e6,
+                                                              result['point'] * 1e3, result['line'] * 1e3,
+                                                              result['map'] * 1e3)
+            if layout.get('contiguous', False):  # an unlimited dimension has to be chunked, there is no such cube
+                print(line + ' %10s' % 'no cube')
+                continue
+            cubeFname = os.path.join(outDir, 'cube_{}.nc'.format(name.replace(' ', '_')))
+            result.update({'cubeWrite': writeCube(cubeFname, data, layout, surveys),
+                           'cubeSize': os.path.getsize(cubeFname)})
+            result.update(timeCubeReads(cubeFname, reps))
+            print(line + ' %10.2f %8.1f %10.2f %10.1f' % (result['cubeWrite'], result['cubeSize'] / 1e6,
+                                                          result['series'] * 1e3, result['survey'] * 1e3))
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+    return results
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "dx=", "reps=", "surveys=", "dir="])
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts:
+        print(__doc__)
+        sys.exit(0)
+    runBenchmark(dx=float(opts.get('--dx', 1.)), reps=int(opts.get('--reps', 50)),
+                 surveys=int(opts.get('--surveys', 32)), outDir=opts.get('--dir', None))
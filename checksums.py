@@ -0,0 +1,15 @@
+"""Checksums of the survey files, templates and products.
+
+Kept free of the conversion modules so the reprocessing manifest (reprocessSurvey) and the inventory index
+(surveyIndex) can both hash files without importing each other.
+"""
+import hashlib
+
+
+def fileHash(fname, blockSize=1 << 20):
+    """sha256 hex digest of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            digest.update(block)
+    return digest.hexdigest()
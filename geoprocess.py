@@ -1,7 +1,53 @@
 'documented SB 12/2/17/'
+import functools
+from collections.abc import Mapping
 import numpy as np
 import pyproj
-import pandas as pd
+
+spEPSG = 3358  # NC stateplane NAD83 (meters) taken from https://epsg.io/3358
+llEPSG = 6318  # geographic NAD83(2011)
+wgsEPSG = 4326  # geographic WGS84, UTM conversions are done on this ellipsoid (same as the utm library)
+utmLetters = 'CDEFGHJKLMNPQRSTUVWXX'  # UTM latitude bands, 8 degrees each from 80S
+# names accepted by the coordType argument, mapped to the coordinate system they describe
+coordTypes = {'LL': 'LL', 'geographic': 'LL', 'LatLon': 'LL',
+              'spnc': 'ncsp', 'ncsp': 'ncsp',
+              'utm': 'utm', 'UTM': 'utm',
+              'FRF': 'FRF'}
+# output keys of FRFcoord/convertCoords, with the coordinate system and the position (p1/p2) each comes from
+coordOutputs = {'xFRF': ('FRF', 0), 'yFRF': ('FRF', 1),
+                'StateplaneE': ('ncsp', 0), 'StateplaneN': ('ncsp', 1),
+                'Lon': ('LL', 0), 'Lat': ('LL', 1),
+                'utmE': ('utm', 0), 'utmN': ('utm', 1)}
+
+
+@functools.lru_cache(maxsize=None)
+def _getTransformer(epsgFrom, epsgTo):
+    """Builds a pyproj transformer once for each pair of EPSG codes, every later call reuses the same object.
+
+    Args:
+      epsgFrom: EPSG code of the input coordinate system
+      epsgTo: EPSG code of the output coordinate system
+
+    Returns:
+      pyproj.Transformer
+
+    """
+    return pyproj.Transformer.from_crs(epsgFrom, epsgTo)
+
+
+@functools.lru_cache(maxsize=None)
+def _getProjection(epsg):
+    """Builds a pyproj projection once for each EPSG code, every later call reuses the same object.
+
+    Args:
+      epsg: EPSG code of the projected coordinate system
+
+    Returns:
+      pyproj.Proj that converts lon/lat to projected easting/northing
+
+    """
+    return pyproj.Proj('epsg:{}'.format(epsg))
+
 
 def FRF2ncsp(xFRF, yFRF):
     """this function makes NC stateplane out of X and Y FRF coordinates,
@@ -190,9 +236,7 @@ def ncsp2LatLon(spE, spN):
     # >>> "%s  %s" % (str(x2)[:9],str(y2)[:9])
     # '1402291.0  5076289.5'
 
-    EPSGfrom = 3358  # taken from https://epsg.io/3358
-    EPSGto = 6318
-    trans = pyproj.Transformer.from_crs(EPSGfrom, EPSGto)
+    trans = _getTransformer(spEPSG, llEPSG)  # built once and reused for every call
     lat, lon = trans.transform(spE, spN)
     # NC stateplane NAD83
     # spNC = pyproj.Proj("epsg:{}".format(EPSG))
@@ -233,10 +277,9 @@ def LatLon2ncsp(lon, lat):
         'StateplaneN': NC stateplane
 
     """
-    EPSG = 3358  # taken from spatialreference.org/ref/epsg/3358
-    # NC stateplane NAD83
-    spNC = pyproj.Proj(init="epsg:{}".format(EPSG))
-    spE, spN = spNC(lon,lat)
+    # NC stateplane NAD83, built once and reused for every call
+    spNC = _getProjection(spEPSG)
+    spE, spN = spNC(lon, lat)
 
     # epsgLL =  4269 # 4326
     # LL = pyproj.Proj('epsg:{}'.format(epsgLL))  # epsg for NAD83 projection
@@ -245,21 +288,28 @@ def LatLon2ncsp(lon, lat):
     ans = {'lon': lon, 'lat': lat, 'StateplaneE': spE, 'StateplaneN': spN}
     return ans
 
-def FRFcoord(p1, p2, coordType=None):
+def FRFcoord(p1, p2, coordType=None, outputs=None):
     """Updated FRF coord in python, using kent's original code as guide but converting pyproj for all
     conversions between state plane and Lat Lon,  Then all conversions between stateplane and
     FRF coordinates are done using kents original geometry.  Can force input to specfic coordinate type using coordType
     argument. Default will guess
 
+    Output systems are computed lazily: the returned FRFcoordResult only converts to a system when one of its keys is
+    first accessed, so asking FRF input for 'Lat'/'Lon' never computes UTM.
+
     Args:
       p1: input any of the following to convert [lon, easting, xFRF]
 
       p2: input any of the following to convert [lat, northing, yFRF]
 
-      coordType: valid values are ['LL', 'geographic', 'LatLon', 'spnc', 'ncsp', 'FRF'] (Default value = None)
+      coordType: valid values are ['LL', 'geographic', 'LatLon', 'spnc', 'ncsp', 'utm', 'UTM', 'FRF'], skips the
+        guess of input type when given (Default value = None)
+
+      outputs: list of output keys to compute now, returns a plain dictionary of only these keys (Default value =
+        None, returns the lazy FRFcoordResult)
 
     Returns:
-        dictionary with appropriate data in it
+        dictionary like FRFcoordResult (or dictionary of the selected outputs) with appropriate data in it
             'xFRF': cross-shore FRF local coordinate system,
 
             'yFRF': along shore FRF local coordinte system,
@@ -323,65 +373,336 @@ def FRFcoord(p1, p2, coordType=None):
         p1 = np.asarray(p1)
     if isinstance(p2, list):
         p2 = np.asarray(p2)
-    # now run checks to see what version of input we have!
-    if np.size(p1) > 1:
-        LL1 = (np.floor(np.absolute(p1)) == 75).all()
-        LL2 = (np.floor(p2) == 36).all()
-        SP1 = (p1 > 800000).all()
-        SP2 = (p2 > 200000).all()
-        UTM1 = (p1 > 300000).all()
-        UTM2 = (p2 > 1000000).all()
-        FRF1 = (p1 > -10000).all() and (p1 < 10000).all()
-        FRF2 = (p2 > -10000).all() and (p2 < 10000).all()
+    # now figure out what version of input we have, unless told
+    if coordType is None:
+        coordType = guessCoordType(p1, p2)
+    if coordType is None:
+        print('<<ERROR>> testbedUtils Geoprocess FRF coord Cound not determine input type, returning NaNs')
+        return {'xFRF': float('NaN'), 'yFRF': float('NaN'), 'StateplaneE': float('NaN'),
+                'StateplaneN': float('NaN'), 'Lat': float('NaN'), 'Lon': float('NaN')}
+
+    coordsOut = FRFcoordResult(p1, p2, coordType)
+    if outputs is not None:  # compute only the selected systems now
+        coordsOut = {key: coordsOut[key] for key in outputs}
+
+    return coordsOut
+
+def guessCoordType(p1, p2):
+    """Guesses the coordinate system of input points from their values.
+
+    The extents of each input are found once, then every test (lat/lon, state plane, UTM, FRF) is made on the
+    extents instead of scanning the whole input again for each one.
+
+    Args:
+      p1: input any of the following [lon, easting, xFRF, utm easting]
+      p2: input any of the following [lat, northing, yFRF, utm northing]
+
+    Returns:
+      one of 'LL', 'ncsp', 'utm', 'FRF' or None if the type could not be determined
+
+    """
+    p1min, p1max = np.min(p1), np.max(p1)
+    p2min, p2max = np.min(p2), np.max(p2)
+
+    LL1 = (-76 < p1min and p1max <= -75) or (75 <= p1min and p1max < 76)  # floor(abs(lon)) == 75
+    LL2 = 36 <= p2min and p2max < 37  # floor(lat) == 36
+    SP1 = p1min > 800000
+    SP2 = p2min > 200000
+    UTM1 = p1min > 300000
+    UTM2 = p2min > 1000000
+    FRF1 = p1min > -10000 and p1max < 10000
+    FRF2 = p2min > -10000 and p2max < 10000
+
+    if LL1 and LL2:
+        return 'LL'
+    elif SP1 and SP2:
+        return 'ncsp'
+    elif UTM1 and UTM2:
+        return 'utm'
+    elif FRF1 and FRF2:
+        return 'FRF'
+    return None
+
+class FRFcoordResult(Mapping):
+    """Coordinates of a set of points in every system, each system is computed when first accessed then cached.
+
+    Behaves as a read only dictionary with the keys in coordOutputs ('xFRF', 'yFRF', 'StateplaneE', 'StateplaneN',
+    'Lat', 'Lon', 'utmE', 'utmN').  Accessing 'Lat' of FRF input only converts to state plane and lat/lon, UTM is
+    never computed unless asked for.
+
+    Args:
+      p1: array of any shape of [lon, easting, xFRF, utm easting]
+      p2: array with the same shape as p1 of [lat, northing, yFRF, utm northing]
+      coordType: coordinate system of the input, any of the keys in coordTypes
+
+    """
+    def __init__(self, p1, p2, coordType):
+        if coordType not in coordTypes:
+            raise ValueError('FRFcoordResult does not understand coordType {}, use one of {}'.format(
+                coordType, list(coordTypes.keys())))
+        if isinstance(p1, (list, tuple)):
+            p1 = np.asarray(p1)
+        if isinstance(p2, (list, tuple)):
+            p2 = np.asarray(p2)
+        assert np.shape(p1) == np.shape(p2), 'FRFcoordResult error: p1 and p2 must be the same shape'
+        self.inSystem = coordTypes[coordType]
+        self._points = {self.inSystem: (p1, p2)}  # each system is held as the (p1, p2) pair in coordOutputs order
+
+    def __getitem__(self, key):
+        if key not in coordOutputs:
+            raise KeyError(key)
+        system, position = coordOutputs[key]
+        return self.points(system)[position]
+
+    def __iter__(self):
+        return iter(coordOutputs)
+
+    def __len__(self):
+        return len(coordOutputs)
+
+    def __contains__(self, key):
+        return key in coordOutputs  # without computing the system
+
+    def __repr__(self):
+        return 'FRFcoordResult(input={}, computed={})'.format(self.inSystem, list(self._points.keys()))
+
+    def points(self, system):
+        """Returns the (p1, p2) pair of a coordinate system, converting through state plane/lat lon when first needed.
+
+        Args:
+          system: one of 'FRF', 'ncsp', 'LL', 'utm'
+
+        Returns:
+          tuple of arrays in coordOutputs order: FRF (x, y), ncsp (E, N), LL (lon, lat), utm (E, N)
+
+        """
+        if system in self._points:
+            return self._points[system]
+        if system == 'ncsp':
+            if self.inSystem == 'FRF':
+                sp = FRF2ncsp(*self._points['FRF'])
+            else:
+                sp = LatLon2ncsp(*self.points('LL'))
+            self._points['ncsp'] = (sp['StateplaneE'], sp['StateplaneN'])
+        elif system == 'FRF':
+            frf = ncsp2FRF(*self.points('ncsp'))
+            self._points['FRF'] = (frf['xFRF'], frf['yFRF'])
+        elif system == 'LL':
+            if self.inSystem == 'utm':
+                lat, lon = utm2LatLonArray(*self._points['utm'], zn=18, zl='S')
+            else:
+                ll = ncsp2LatLon(*self.points('ncsp'))
+                lat, lon = ll['lat'], ll['lon']
+            self._points['LL'] = (lon, lat)
+        elif system == 'utm':
+            lon, lat = self.points('LL')
+            self._points['utm'] = latLon2utmArray(lat, lon)[:2]
+        else:
+            raise KeyError(system)
+        return self._points[system]
+
+def convertCoords(p1, p2, coordType, outputs=None):
+    """Batch converts whole arrays of points between the FRF, NC state plane, lat/lon and UTM coordinate systems.
+
+    Unlike FRFcoord the input type is not guessed, so arrays of any shape (eg. a full meshgrid of template nodes) are
+    converted in one vectorized pass.  Only the systems needed for the requested outputs are computed and all pyproj
+    transformers are built once per session.
+
+    Args:
+      p1: array of any shape of [lon, easting, xFRF, utm easting]
+      p2: array with the same shape as p1 of [lat, northing, yFRF, utm northing]
+      coordType: coordinate system of the input, any of the keys in coordTypes
+      outputs: list of output keys to compute (Default value = None, computes all in coordOutputs)
+
+    Returns:
+        dictionary with the requested keys of coordOutputs, each with the same shape as the input
+            'xFRF', 'yFRF', 'StateplaneE', 'StateplaneN', 'Lat', 'Lon', 'utmE', 'utmN'
+
+    """
+    if outputs is None:
+        outputs = list(coordOutputs.keys())
+    coords = FRFcoordResult(p1, p2, coordType)
+
+    return {key: coords[key] for key in outputs}
+
+def iterChunks(p1, p2, chunkSize=1000000):
+    """Slices two (possibly memory-mapped) point arrays into chunks for convertCoordsChunked.
+
+    Args:
+      p1: 1D array of [lon, easting, xFRF, utm easting], np.memmap/np.load(mmap_mode='r') arrays are not read in full
+      p2: 1D array with the same length as p1 of [lat, northing, yFRF, utm northing]
+      chunkSize: number of points in each chunk (Default value = 1000000)
+
+    Returns:
+      generator of (p1, p2) chunk pairs
+
+    """
+    assert np.shape(p1) == np.shape(p2), 'iterChunks error: p1 and p2 must be the same shape'
+    for start in range(0, len(p1), chunkSize):
+        yield p1[start:start + chunkSize], p2[start:start + chunkSize]
+
+def _convertChunk(p1, p2, coordType, outputs):
+    """converts one chunk, module level so it can be sent to worker processes"""
+    return convertCoords(np.ascontiguousarray(p1, dtype=float), np.ascontiguousarray(p2, dtype=float), coordType,
+                         outputs=outputs)
+
+def convertCoordsChunked(points, coordType=None, outputs=None, chunkSize=1000000, processes=None):
+    """Streams very large point clouds through convertCoords one chunk at a time to keep memory bounded.
+
+    Each chunk gives exactly what convertCoords gives for the same points, so concatenating the yielded chunks is
+    identical to the single call path.  When coordType is not given it is guessed once from the first chunk and then
+    used for every chunk so all chunks are treated the same.
+
+    Args:
+      points: either an (N, 2) array of [p1, p2] columns (eg. an np.memmap of a lidar pass), or an iterable of
+        (p1, p2) chunk pairs (see iterChunks)
+      coordType: coordinate system of the input, any of the keys in coordTypes (Default value = None, guessed)
+      outputs: list of output keys to compute (Default value = None, computes all in coordOutputs)
+      chunkSize: points per chunk when points is an (N, 2) array (Default value = 1000000)
+      processes: number of worker processes, None or 1 converts in this process (Default value = None)
+
+    Returns:
+      generator of dictionaries, one per chunk in input order, see convertCoords
+
+    """
+    if isinstance(points, np.ndarray):
+        assert points.ndim == 2 and points.shape[1] == 2, 'convertCoordsChunked error: array points must be (N, 2)'
+        points = iterChunks(points[:, 0], points[:, 1], chunkSize=chunkSize)
+    chunks = iter(points)
+
+    if processes is None or processes <= 1:
+        for p1, p2 in chunks:
+            if coordType is None:
+                coordType = _guessChunkType(p1, p2)
+            yield _convertChunk(p1, p2, coordType, outputs)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    from collections import deque
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        pending = deque()  # at most 2 chunks per worker are read and in flight at a time
+        for p1, p2 in chunks:
+            if coordType is None:
+                coordType = _guessChunkType(p1, p2)
+            pending.append(pool.submit(_convertChunk, p1, p2, coordType, outputs))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def _guessChunkType(p1, p2):
+    """guesses the input type from the first chunk, raising when it cannot be determined"""
+    coordType = guessCoordType(p1, p2)
+    if coordType is None:
+        raise ValueError('convertCoordsChunked could not determine input type from the first chunk, give coordType')
+    return coordType
+
+def utmZone(lat, lon):
+    """Infers the UTM zone number and latitude band letter of every point, the same zones as the utm library.
+
+    Args:
+      lat: latitude (decimal degrees), array of any shape
+      lon: longitude (decimal degrees), same shape as lat
+
+    Returns:
+      zn: array of zone numbers
+      zl: array of zone letters
+
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    lon = (lon + 180) % 360 - 180  # wrap to [-180, 180)
+    zn = (np.floor((lon + 180) / 6) + 1).astype(int)
+    # Norway and Svalbard exceptions to the 6 degree zones
+    zn = np.where((lat >= 56) & (lat < 64) & (lon >= 3) & (lon < 12), 32, zn)
+    svalbard = (lat >= 72) & (lat <= 84) & (lon >= 0) & (lon < 42)
+    zn = np.where(svalbard, np.select([lon < 9, lon < 21, lon < 33], [31, 33, 35], 37), zn)
+    zl = np.asarray(list(utmLetters))[np.clip(((lat + 80) // 8).astype(int), 0, len(utmLetters) - 1)]
+
+    return zn, zl
+
+def _utmEPSG(zn, north):
+    """EPSG codes of WGS84 / UTM zone zn, north (326xx) where north is True, south (327xx) elsewhere"""
+    return np.where(north, 32600, 32700) + np.asarray(zn, dtype=int)
+
+def _uniqueZones(epsg):
+    """unique EPSG codes, without sorting the array in the usual case of every point in one zone"""
+    if epsg.size and epsg.min() == epsg.max():
+        return epsg.ravel()[:1]
+    return np.unique(epsg)
+
+def latLon2utmArray(lat, lon, zn=None):
+    """Vectorized conversion of lat/lon to UTM with cached pyproj transformers, replaces the per point utm library.
+
+    Points are grouped by UTM zone so each zone is converted in one call, millions of points in the same zone take a
+    single pyproj call.
+
+    Args:
+      lat: latitude (decimal degrees), array of any shape
+      lon: longitude (decimal degrees), same shape as lat
+      zn: force every point into this zone number (Default value = None, infers the zone of every point)
+
+    Returns:
+      utmE: UTM easting, same shape as input
+      utmN: UTM northing, same shape as input
+      zn: zone numbers
+      zl: zone letters
+
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    assert lat.shape == lon.shape, 'latLon2utmArray error: lat lon coordinate arrays must be the same shape'
+    zoneNumber, zl = utmZone(lat, lon)
+    if zn is not None:
+        zoneNumber = np.broadcast_to(np.asarray(zn, dtype=int), lat.shape)
+    epsg = _utmEPSG(zoneNumber, lat >= 0)  # bands N and above are the northern hemisphere
+
+    utmE = np.empty(lat.shape)
+    utmN = np.empty(lat.shape)
+    zones = _uniqueZones(epsg)
+    if zones.size == 1:  # typical case, all points in one zone, no masking needed
+        utmE[...], utmN[...] = _getTransformer(wgsEPSG, int(zones[0])).transform(lat, lon)
     else:
-        LL1 = np.floor(np.absolute(p1)) == 75
-        LL2 = np.floor(p2) == 36
-        SP1 = p1 > 800000
-        SP2 = p2 > 200000
-        UTM1 = p1 > 300000
-        UTM2 = p2 > 1000000
-        FRF1 = (p1 > -10000) and (p1 < 10000)
-        FRF2 = (p2 > -10000) and (p2 < 10000)
-
-    # Determine Data type
-    if LL1 and LL2 or coordType in ['LL', 'geographic', 'LatLon']:  # lat/lon input
-        sp = LatLon2ncsp(p1, p2)  # convert from lon/lat to state plane
-        frf = ncsp2FRF(sp['StateplaneE'], sp['StateplaneN'])  # convert from nc state plane to FRF coords
-        utm = LatLon2utm(p2, p1)  # convert to utm from lon/lat
-        coordsOut = {'xFRF': frf['xFRF'], 'yFRF': frf['yFRF'], 'StateplaneE': sp['StateplaneE'],
-                     'StateplaneN': sp['StateplaneN'], 'Lat': p2, 'Lon': p1, 'utmE': utm['utmE'], 'utmN': utm['utmN']}
-
-    elif SP1 and SP2 or coordType in ['spnc', 'ncsp']:  # state plane input
-        frf = ncsp2FRF(p1, p2)     # convert state plane to FRF
-        ll = ncsp2LatLon(p1, p2)  # convert state plane to Lat Lon
-        utm = LatLon2utm(ll['lat'], ll['lon'])
-        coordsOut = {'xFRF': frf['xFRF'], 'yFRF': frf['yFRF'], 'StateplaneE': p1,
-                     'StateplaneN': p2, 'Lat': ll['lat'], 'Lon': ll['lon'], 'utmE': utm['utmE'], 'utmN': utm['utmN']}
-
-    elif UTM1 and UTM2:  # UTM input
-        ll = utm2LatLon(p1, p2, 18, 'S')
-        sp = LatLon2ncsp(ll['lon'], ll['lat'])
-        frf = ncsp2FRF(sp['StateplaneE'], sp['StateplaneN'])
-        coordsOut = {'xFRF': frf['xFRF'], 'yFRF': frf['yFRF'], 'StateplaneE': sp['StateplaneE'],
-                     'StateplaneN': sp['StateplaneN'], 'Lat': ll['lat'], 'Lon': ll['lon'], 'utmE': p1, 'utmN': p2}
-
-    elif (FRF1 and FRF2) or coordType in ['FRF']:  # FRF input
-        # this is FRF in
-        sp = FRF2ncsp(p1, p2)
-        ll = ncsp2LatLon(sp['StateplaneE'], sp['StateplaneN'])
-        utm = LatLon2utm(ll['lat'], ll['lon'])
-        coordsOut = {'xFRF': p1, 'yFRF': p2, 'StateplaneE': sp['StateplaneE'],
-                     'StateplaneN': sp['StateplaneN'], 'Lat': ll['lat'], 'Lon': ll['lon'], 'utmE': utm['utmE'], 'utmN': utm['utmN']}
+        for zone in zones:
+            idx = epsg == zone
+            utmE[idx], utmN[idx] = _getTransformer(wgsEPSG, int(zone)).transform(lat[idx], lon[idx])
+
+    return utmE, utmN, zoneNumber, zl
+
+def utm2LatLonArray(utmE, utmN, zn=18, zl='S'):
+    """Vectorized conversion of UTM to lat/lon with cached pyproj transformers, replaces the per point utm library.
 
+    Args:
+      utmE: UTM easting, array of any shape
+      utmN: UTM northing, same shape as utmE
+      zn: zone number, single value or same shape as utmE (Default value = 18)
+      zl: zone letter, single value or same shape as utmE (Default value = 'S', zone 18N at the FRF)
+
+    Returns:
+      lat: latitude, same shape as input
+      lon: longitude, same shape as input
+
+    """
+    utmE = np.asarray(utmE, dtype=float)
+    utmN = np.asarray(utmN, dtype=float)
+    assert utmE.shape == utmN.shape, 'utm2LatLonArray error: UTM point arrays must be the same shape'
+    north = np.char.upper(np.asarray(zl, dtype=str)) >= 'N'
+    epsg = np.broadcast_to(_utmEPSG(zn, north), utmE.shape)
+
+    lat = np.empty(utmE.shape)
+    lon = np.empty(utmE.shape)
+    zones = _uniqueZones(epsg)
+    if zones.size == 1:
+        lat[...], lon[...] = _getTransformer(int(zones[0]), wgsEPSG).transform(utmE, utmN)
     else:
-        print('<<ERROR>> testbedUtils Geoprocess FRF coord Cound not determine input type, returning NaNs')
-        coordsOut = {'xFRF': float('NaN'), 'yFRF': float('NaN'), 'StateplaneE': float('NaN'),
-             'StateplaneN': float('NaN'), 'Lat': float('NaN'), 'Lon':float('NaN')}
+        for zone in zones:
+            idx = epsg == zone
+            lat[idx], lon[idx] = _getTransformer(int(zone), wgsEPSG).transform(utmE[idx], utmN[idx])
 
-    return coordsOut
+    return lat, lon
 
 def utm2LatLon(utmE, utmN, zn, zl):
-    """uses utm library to convert utm points to lat/lon
+    """converts utm points to lat/lon, thin wrapper around utm2LatLonArray
 
     Args:
       utmE: utm easting
@@ -395,7 +716,6 @@ def utm2LatLon(utmE, utmN, zn, zl):
         lon:  coordinates of the utm input points
 
     """
-
     # check to see if points are...
     assert np.size(utmE) == np.size(utmN), 'utm2LatLon error: UTM point vectors must be equal lengths'
 
@@ -405,31 +725,16 @@ def utm2LatLon(utmE, utmN, zn, zl):
     else:
         assert np.size(zn) == np.size(zl) == np.size(utmE), 'utm2LatLon error: UTM zone number and letter must both be of length 1 or length of UTM point vectors'
 
-    columns = ['utmE', 'utmN', 'zn', 'zl']
-
-    df = pd.DataFrame(index=list(range(0, np.size(utmE))), columns=columns)
-
-    if np.size(utmE) > len(utmE):
-        utmE = utmE[0]
-        utmN = utmN[0]
-
-    df['utmE'] = utmE
-    df['utmN'] = utmN
-    df['zn'] = zn
-    df['zl'] = zl
-
-    df['ll'] = df.apply(lambda x: utm.to_latlon(x.utmE, x.utmN, x.zn, x.zl), axis=1)
-
-    L1, L2 = list(zip(*np.asarray(df['ll'])))
+    lat, lon = utm2LatLonArray(utmE, utmN, zn, zl)
 
     return_dict = {}
-    return_dict['lat'] = np.asarray(L1)
-    return_dict['lon'] = np.asarray(L2)
+    return_dict['lat'] = lat
+    return_dict['lon'] = lon
 
     return return_dict
 
 def LatLon2utm(lat, lon):
-    """uses utm library to convert lat lon to UTM
+    """converts lat lon to UTM, thin wrapper around latLon2utmArray
 
     Args:
       lat: input value
@@ -443,34 +748,21 @@ def LatLon2utm(lat, lon):
          zl - zone letter of each point
 
     """
-    import utm
-
     # check to see if points are...
     assert np.size(lat) == np.size(lon), 'LatLon2utm error: lat lon coordinate vectors must be equal lengths'
 
-    columns = ['lat', 'lon']
-
-    df = pd.DataFrame(index=list(range(0, np.size(lat))), columns=columns)
-
-    df['lat'] = lat
-    df['lon'] = lon
-    try:
-        df['utm'] = df.apply(lambda x: utm.from_latlon(x.lat, x.lon), axis=1)
-    except:
-        df['utm'] = utm.from_latlon(df.lat.values, df.lon.values)
-
-    utmE, utmN, zn, zl = list(zip(*np.asarray(df['utm'])))
+    utmE, utmN, zn, zl = latLon2utmArray(lat, lon)
 
     return_dict = {}
-    return_dict['utmE'] = np.asarray(utmE)
-    return_dict['utmN'] = np.asarray(utmN)
-    return_dict['zn'] = np.asarray(zn)
-    return_dict['zl'] = np.asarray(zl)
+    return_dict['utmE'] = utmE
+    return_dict['utmN'] = utmN
+    return_dict['zn'] = zn
+    return_dict['zl'] = zl
 
     return return_dict
 
 def utm2ncsp(utmE, utmN, zn, zl):
-    """uses utm library converts from utm to north carolina state plane
+    """converts from utm to north carolina state plane, thin wrapper around utm2LatLonArray and LatLon2ncsp
 
     Args:
       utmE: utm easting
@@ -485,12 +777,10 @@ def utm2ncsp(utmE, utmN, zn, zl):
           northing - ncsp northing
 
     """
-    import utm
-
     # so, all this does it go through Lat/Lon to get to ncsp..
 
     # check to see if points are...
-    assert np.size(utmE) == np.size(utmE), 'utm2ncsp error: UTM point vectors must be equal lengths'
+    assert np.size(utmE) == np.size(utmN), 'utm2ncsp error: UTM point vectors must be equal lengths'
 
     #check to see if zn, zl are either both length 1 or the same length as p1, p2
     if np.size(zn) == 1:
@@ -498,20 +788,8 @@ def utm2ncsp(utmE, utmN, zn, zl):
     else:
         assert np.size(zn) == np.size(zl) == np.size(utmE), 'utm2ncsp error: UTM zone number and letter must both be of length 1 or length of UTM point vectors'
 
-    columns = ['utmE', 'utmN', 'zn', 'zl']
-
-    df = pd.DataFrame(index=list(range(0, np.size(utmE))), columns=columns)
-
-    df['utmE'] = utmE
-    df['utmN'] = utmN
-    df['zn'] = zn
-    df['zl'] = zl
-
-    df['ll'] = df.apply(lambda x: utm.to_latlon(x.utmE, x.utmN, x.zn, x.zl), axis=1)
-
-    L1, L2 = list(zip(*np.asarray(df['ll'])))
-
-    ncsp_dict = LatLon2ncsp(np.asarray(L2), np.asarray(L1))
+    lat, lon = utm2LatLonArray(utmE, utmN, zn, zl)
+    ncsp_dict = LatLon2ncsp(lon, lat)
 
     return_dict = {}
     return_dict['easting'] = np.asarray(ncsp_dict['StateplaneE'])
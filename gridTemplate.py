@@ -0,0 +1,177 @@
+"""Registry of the standard FRF grid template coordinates.
+
+The template node locations (xFRF/yFRF) and their lat/lon and state plane coordinates depend only on the template
+bounds and resolution, so they are computed once per (bounds, resolution) key, saved to disk as .npy files and loaded
+memory-mapped for every grid conversion after the first.
+"""
+import os
+import shutil
+import tempfile
+import numpy as np
+import geoprocess as gp
+
+templateVersion = 1  # bump when the coordinate math changes so stale caches are not reused
+templateKeys = ['xFRF', 'yFRF', 'latitude', 'longitude', 'easting', 'northing']
+resolutionDecimals = 3  # template resolutions are snapped to mm, survey coordinate jitter is far below that
+_templates = {}  # templates already loaded by this process, keyed by bounds and resolution
+
+
+def defaultCacheDir():
+    """Location of the on disk template cache, can be set with the FRF_TEMPLATE_CACHE environment variable.
+
+    Returns:
+        path of the cache directory (not created here)
+
+    """
+    return os.environ.get('FRF_TEMPLATE_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'frfGridTemplates'))
+
+
+def canonicalResolution(d):
+    """Snaps a grid resolution to the resolution templates are keyed and built with.
+
+    Args:
+        d: grid resolution (m), eg. estimated from survey node spacing
+
+    Returns:
+        resolution rounded to resolutionDecimals
+
+    """
+    return float(np.round(d, resolutionDecimals))
+
+
+def nodeCount(gridMin, gridMax, d):
+    """number of template nodes from gridMin to gridMax (inclusive) at resolution d"""
+    return int(np.rint((gridMax - gridMin) / d)) + 1
+
+
+def templateName(dx, dy, gridXmin=50, gridXmax=950, gridYmin=-100, gridYmax=1100):
+    """Makes the registry key (and cache directory name) for a template of given bounds and resolution.
+
+    Args:
+        dx: template resolution in x (m)
+        dy: template resolution in y (m)
+        gridXmin: minimum FRF x of the template (default=50)
+        gridXmax: maximum FRF x of the template (default=950)
+        gridYmin: minimum FRF y of the template (default=-100)
+        gridYmax: maximum FRF y of the template (default=1100)
+
+    Returns:
+        string key unique to the bounds and resolution
+
+    """
+    return 'frfTemplate_v{}_x{:g}_{:g}_y{:g}_{:g}_dx{:g}_dy{:g}'.format(templateVersion, gridXmin, gridXmax, gridYmin,
+                                                                       gridYmax, dx, dy)
+
+
+def makeFRFgridTemplate(dx, dy, gridXmin=50, gridXmax=950, gridYmin=-100, gridYmax=1100):
+    """Computes the template node locations and their coordinates in every system used by the netCDF files.
+
+    Args:
+        dx: template resolution in x (m)
+        dy: template resolution in y (m)
+        gridXmin: minimum FRF x of the template (default=50)
+        gridXmax: maximum FRF x of the template (default=950)
+        gridYmin: minimum FRF y of the template (default=-100)
+        gridYmax: maximum FRF y of the template (default=1100)
+
+    Returns:
+        dictionary
+            'xFRF': 1D template cross-shore node locations
+
+            'yFRF': 1D template alongshore node locations
+
+            'latitude', 'longitude': 2D [yFRF, xFRF] geographic coordinates of each node
+
+            'easting', 'northing': 2D [yFRF, xFRF] NC state plane coordinates of each node
+
+    """
+    xFRF = np.linspace(gridXmin, gridXmax, num=nodeCount(gridXmin, gridXmax, dx), endpoint=True)
+    yFRF = np.linspace(gridYmin, gridYmax, num=nodeCount(gridYmin, gridYmax, dy), endpoint=True)
+    xx, yy = np.meshgrid(xFRF, yFRF)
+    coords = gp.convertCoords(xx, yy, 'FRF', outputs=['Lat', 'Lon', 'StateplaneE', 'StateplaneN'])
+
+    return {'xFRF': xFRF,
+            'yFRF': yFRF,
+            'latitude': np.asarray(coords['Lat']),
+            'longitude': np.asarray(coords['Lon']),
+            'easting': np.asarray(coords['StateplaneE']),
+            'northing': np.asarray(coords['StateplaneN'])}
+
+
+def getFRFgridTemplate(dx, dy, gridXmin=50, gridXmax=950, gridYmin=-100, gridYmax=1100, **kwargs):
+    """Returns the template coordinates for given bounds and resolution, computing them only the first time.
+
+    Templates are looked up in this process first, then in the on disk cache (loaded memory-mapped, read only), and
+    only computed with makeFRFgridTemplate when neither has them.  Newly computed templates are written to the cache
+    through a temporary directory so concurrent conversions never read a partial template.  dx and dy are snapped with
+    canonicalResolution first, so the key and the template arrays always come from the same resolution, and a cached
+    template whose shape does not match its key is rebuilt.
+
+    Args:
+        dx: template resolution in x (m)
+        dy: template resolution in y (m)
+        gridXmin: minimum FRF x of the template (default=50)
+        gridXmax: maximum FRF x of the template (default=950)
+        gridYmin: minimum FRF y of the template (default=-100)
+        gridYmax: maximum FRF y of the template (default=1100)
+
+    Keyword Args:
+        'cacheDir': directory of the on disk cache (default=defaultCacheDir()), None turns off the disk cache
+
+    Returns:
+        dictionary with templateKeys, see makeFRFgridTemplate
+
+    """
+    cacheDir = kwargs.get('cacheDir', defaultCacheDir())
+    dx, dy = canonicalResolution(dx), canonicalResolution(dy)
+    key = templateName(dx, dy, gridXmin, gridXmax, gridYmin, gridYmax)
+    if key in _templates:
+        return _templates[key]
+
+    template = None
+    shape = (nodeCount(gridYmin, gridYmax, dy), nodeCount(gridXmin, gridXmax, dx))
+    if cacheDir is not None:
+        template = _loadTemplate(os.path.join(cacheDir, key), shape)
+    if template is None:
+        template = makeFRFgridTemplate(dx, dy, gridXmin, gridXmax, gridYmin, gridYmax)
+        if cacheDir is not None:
+            try:
+                _saveTemplate(template, cacheDir, key)
+            except OSError as e:  # a read only cache should not stop a conversion
+                print('<<WARNING>> could not cache grid template {}: {}'.format(key, e))
+
+    _templates[key] = template
+    return template
+
+
+def _loadTemplate(templateDir, shape):
+    """loads every array of a cached template memory-mapped, returns None if the template is not (fully) cached
+
+    A cached template whose arrays do not have shape (yFRF, xFRF) nodes is stale (written by an older version from an
+    unsnapped resolution) and is removed from the cache so it is rebuilt.
+    """
+    if not all(os.path.isfile(os.path.join(templateDir, var + '.npy')) for var in templateKeys):
+        return None
+    template = {var: np.load(os.path.join(templateDir, var + '.npy'), mmap_mode='r') for var in templateKeys}
+    shapes = {'xFRF': shape[1:], 'yFRF': shape[:1]}
+    if any(template[var].shape != tuple(shapes.get(var, shape)) for var in templateKeys):
+        print('<<WARNING>> cached grid template {} does not match its resolution, rebuilding it'.format(templateDir))
+        shutil.rmtree(templateDir, ignore_errors=True)
+        return None
+    return template
+
+
+def _saveTemplate(template, cacheDir, key):
+    """writes the template arrays to a temporary directory then renames it into place in the cache"""
+    os.makedirs(cacheDir, exist_ok=True)
+    tmpDir = tempfile.mkdtemp(prefix='.' + key, dir=cacheDir)
+    try:
+        for var in templateKeys:
+            np.save(os.path.join(tmpDir, var + '.npy'), template[var])
+        os.rename(tmpDir, os.path.join(cacheDir, key))
+    except OSError:
+        if not os.path.isdir(os.path.join(cacheDir, key)):
+            raise
+    finally:
+        if os.path.isdir(tmpDir):  # another process finished the same template first
+            shutil.rmtree(tmpDir, ignore_errors=True)
@@ -0,0 +1,200 @@
+"""Watch-folder ingestion service, converts surveys to netCDF as they are delivered to a drop directory.
+
+The drop directory is polled for transect (FRF_*.csv) and grid (FRF_*latlon.txt) files.  A file is only queued once
+its size and modification time have stopped changing for the settle time, so files still being copied are left alone.
+Queued files are converted on a bounded pool of worker processes (at most jobs conversions at a time, the rest wait
+in the queue) into a staging directory and then renamed into the output directory, so the catalog never sees a partly
+written netCDF file.  What has been converted is kept in a reprocessing manifest (see reprocessSurvey), so a restart
+does not convert the drop directory again.  Published files are added to the inventory index (see surveyIndex) when
+one is given.
+
+can be run from terminal
+    python ingestDaemon.py [--out=dir] [--jobs=N] [--poll=seconds] [--settle=seconds] [--manifest=file]
+                           [--prometheus=file.prom] [--index=file] [--once] dropDirectory
+"""
+import sys, getopt, os
+import time
+import signal
+import collections
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import batchConvert
+import checksums
+import reprocessSurvey
+import stageMetrics
+import surveyIndex
+
+
+def _workerSignals():
+    """workers leave ctrl-c to the daemon, which lets the running conversions finish"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+class IngestDaemon(object):
+    """Polls a drop directory and converts newly delivered surveys to netCDF."""
+
+    def __init__(self, dropDir, outDir, jobs=1, pollInterval=5, settleTime=10, manifestFile=None, metricsFile=None,
+                 indexFile=None):
+        """
+        Args:
+            dropDir: directory surveys are delivered to
+            outDir: directory the netCDF files are published to
+            jobs: maximum number of conversions running at once (default=1)
+            pollInterval: seconds between scans of the drop directory (default=5)
+            settleTime: seconds a file's size and modification time must be unchanged before it is converted
+                (default=10)
+            manifestFile: manifest of converted files (default=ingestManifest.json in outDir)
+            metricsFile: Prometheus textfile of the stage timings, rewritten after every file (default=None)
+            indexFile: inventory index every published file is added to (default=None, no index)
+
+        """
+        self.dropDir = dropDir
+        self.outDir = outDir
+        self.stagingDir = os.path.join(outDir, '.staging')  # same file system as outDir so publishing is a rename
+        self.jobs = max(1, jobs)
+        self.pollInterval = pollInterval
+        self.settleTime = settleTime
+        self.manifestFile = manifestFile or os.path.join(outDir, 'ingestManifest.json')
+        self.manifest = reprocessSurvey.loadManifest(self.manifestFile)
+        self.version = reprocessSurvey.codeVersion()
+        self.yamlHashes = {kind: [checksums.fileHash(yaml) for yaml in yamls]
+                           for kind, yamls in reprocessSurvey.templateYamls.items()}
+        self.seen = {}                      # file: (size, mtime, time first seen with that size and mtime)
+        self.queue = collections.deque()    # files settled and waiting for a worker
+        self.running = {}                   # future: (file, file state)
+        self.stopping = False
+        self.metricsFile = metricsFile
+        self.stageTotals = {}               # running per stage totals of every conversion, see stageMetrics
+        self.indexFile = indexFile
+
+    def scan(self):
+        """Looks through the drop directory once, queueing every file that has settled and needs converting."""
+        now = time.time()
+        present = set()
+        for fname in batchConvert.findSurveyFiles([self.dropDir]):
+            fname = os.path.abspath(fname)
+            present.add(fname)
+            try:
+                stat = os.stat(fname)
+            except OSError:  # removed between listing and stat
+                continue
+            size, mtime, since = self.seen.get(fname, (None, None, now))
+            if (size, mtime) != (stat.st_size, stat.st_mtime):  # new or still being written, start the clock over
+                self.seen[fname] = (stat.st_size, stat.st_mtime, now)
+                continue
+            if now - since < self.settleTime or fname in self.queue or self._isRunning(fname):
+                continue
+            entry = self.manifest['files'].get(fname)
+            state = reprocessSurvey.fileState(fname, entry)
+            if reprocessSurvey.needsConversion(entry, state, self.yamlHashes[batchConvert.fileKind(fname)],
+                                               self.version) is not None:
+                print('  <II> queueing %s' % fname)
+                self.queue.append(fname)
+        for fname in set(self.seen) - present:  # forget files that were taken away
+            del self.seen[fname]
+
+    def _isRunning(self, fname):
+        return any(fname == running[0] for running in self.running.values())
+
+    def _submit(self, pool):
+        """hands queued files to the pool until jobs conversions are running"""
+        while self.queue and len(self.running) < self.jobs:
+            fname = self.queue.popleft()
+            options = {'ofname': '{base}.nc', 'outDir': self.stagingDir}
+            future = pool.submit(batchConvert.convertFile, fname, transectOptions=options, gridOptions=options)
+            self.running[future] = (fname, reprocessSurvey.fileState(fname, rehash=True))
+
+    def _finish(self, future):
+        """publishes the output of a finished conversion and checkpoints the manifest"""
+        fname, state = self.running.pop(future)
+        try:
+            record = future.result()
+        except Exception as e:  # a worker died outright
+            record = {'file': fname, 'kind': batchConvert.fileKind(fname), 'status': 'error', 'output': None,
+                      'error': '{}: {}'.format(type(e).__name__, e), 'started': None, 'stages': []}
+        if record['status'] == 'ok':
+            try:
+                record['output'] = self.publish(record['output'])
+                print('  <II> published %s' % record['output'])
+            except OSError as e:
+                record.update({'status': 'error', 'output': None, 'error': '{}: {}'.format(type(e).__name__, e)})
+        if record['status'] == 'ok' and self.indexFile is not None:  # indexed once published, under its final name
+            try:
+                surveyIndex.updateFile(record['output'], self.indexFile, sourceFile=fname)
+            except Exception as e:
+                print('<<ERROR>> indexing %s: %s' % (record['output'], e))
+        if record['status'] != 'ok':
+            print('<<ERROR>> %s %s' % (fname, record['error']))
+        entry = dict(state)
+        entry.update({'kind': record['kind'], 'yamlHashes': self.yamlHashes[record['kind']],
+                      'codeVersion': self.version, 'output': record['output'], 'status': record['status'],
+                      'error': record['error'], 'converted': record['started']})
+        self.manifest['files'][fname] = entry
+        reprocessSurvey.saveManifest(self.manifest, self.manifestFile)
+        if self.metricsFile is not None:
+            stageMetrics.stageTotals(record['stages'], self.stageTotals)
+            stageMetrics.writePrometheusTotals(self.stageTotals, self.metricsFile)
+
+    def publish(self, stagedFname):
+        """Moves a converted file from the staging directory into the output directory in one rename.
+
+        Args:
+            stagedFname: netCDF file in the staging directory
+
+        Returns:
+            published file name
+
+        """
+        outFname = os.path.abspath(os.path.join(self.outDir, os.path.basename(stagedFname)))
+        os.replace(stagedFname, outFname)
+        return outFname
+
+    def stop(self, *args):
+        """Stops taking new files, the conversions already running are finished first."""
+        print('  <II> stopping, waiting for %d running conversion(s)' % len(self.running))
+        self.stopping = True
+
+    def run(self, once=False):
+        """Polls the drop directory until stopped (SIGINT/SIGTERM).
+
+        Args:
+            once: convert what is in the drop directory now (ignoring the settle time) and return (default=False)
+
+        """
+        for directory in [self.outDir, self.stagingDir]:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        if once:
+            self.settleTime = 0
+        print('Watching %s, publishing to %s with %d job(s)' % (self.dropDir, self.outDir, self.jobs))
+        with ProcessPoolExecutor(max_workers=self.jobs, initializer=_workerSignals) as pool:
+            while not self.stopping or self.running:
+                if not self.stopping:
+                    self.scan()
+                    if once:  # a file needs two scans to be seen as settled
+                        self.scan()
+                    self._submit(pool)
+                if once and not self.queue and not self.running:
+                    break
+                if self.running:
+                    done, _ = wait(list(self.running), timeout=self.pollInterval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._finish(future)
+                else:
+                    time.sleep(self.pollInterval)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "hj:", ["help", "out=", "jobs=", "poll=", "settle=", "manifest=",
+                                                      "prometheus=", "index=", "once"])
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts or len(args) != 1:
+        print(__doc__)
+        sys.exit(0)
+    daemon = IngestDaemon(args[0], opts.get('--out', '.'), jobs=int(opts.get('--jobs', opts.get('-j', 1))),
+                          pollInterval=float(opts.get('--poll', 5)), settleTime=float(opts.get('--settle', 10)),
+                          manifestFile=opts.get('--manifest', None), metricsFile=opts.get('--prometheus', None),
+                          indexFile=opts.get('--index', None))
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run(once='--once' in opts)
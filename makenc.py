@@ -13,7 +13,12 @@ import csv
 import datetime as DT
 import yaml
 import time as ttime
-import sblib as sb
+import gridTemplate
+import py2netCDF as p2nc
+
+# variable attributes written from the yaml (units and short_name are always written), see write_data_to_nc
+possible_var_attr = ['standard_name', 'long_name', 'coordinates', 'flag_values', 'flag_meanings',
+                     'positive', 'valid_min', 'valid_max', 'calendar', 'description', 'cf_role', 'missing_value']
 
 
 def readflags(flagfname, header=1):
@@ -112,56 +117,36 @@ def write_data_to_nc(ncfile, template_vars, data_dict, write_vars='_variables'):
     This function actually writes the variables and the variable attributes to
     the netCDF file
     ncfile is an open fid
+    template_vars is a write plan from py2netCDF.getWritePlan (attributeNames=possible_var_attr, compress=False) or
+    the variable yaml dictionary, which is then compiled for this call
 
     written by: ASA
     in the yaml, the "[variable]:" needs to be in the data dictionary,
      the output netcdf variable will take the name "name:"
     '''
+    if not isinstance(template_vars, p2nc.WritePlan):
+        template_vars = p2nc.compileWritePlan(template_vars, attributeNames=possible_var_attr, compress=False)
 
     # Keep track of any errors found
     num_errors = 0
     error_str = ''
 
     # write some more global attributes if present
-    if '_attributes' in template_vars:
-        for var in template_vars['_attributes']:
-            if var in data_dict:
-                setattr(ncfile, var, data_dict[var])
-
-    # List all possible variable attributes in the template
-    possible_var_attr = ['standard_name', 'long_name', 'coordinates', 'flag_values', 'flag_meanings',
-                         'positive', 'valid_min', 'valid_max', 'calendar', 'description', 'cf_role', 'missing_value']
+    for var in template_vars.dataAttributes:
+        if var in data_dict:
+            setattr(ncfile, var, data_dict[var])
 
     # Write variables to file
-    accept_vars = template_vars['_variables']
-
-    for var in accept_vars:
+    for varPlan in template_vars.variables:
+        var = varPlan.key
         if var in data_dict:
             try:
-                if "fill_value" in template_vars[var]:
-                    new_var = ncfile.createVariable(template_vars[var]["name"],
-                                                    template_vars[var]["data_type"],
-                                                    template_vars[var]["dim"],
-                                                    fill_value=template_vars[var]["fill_value"])
-                else:
-                    new_var = ncfile.createVariable(template_vars[var]["name"],
-                                                    template_vars[var]["data_type"],
-                                                    template_vars[var]["dim"])
-
-                new_var.units = template_vars[var]["units"]
-
-                # Write the attributes
-                for attr in possible_var_attr:
-                    if attr in template_vars[var]:
-                        if template_vars[var][attr] == 'NaN':
-                            setattr(new_var, attr, np.nan)
-                        else:
-                            setattr(new_var, attr, template_vars[var][attr])
-                # Write the short_name attribute as the variable name
-                if 'short_name' in template_vars[var]:
-                    new_var.short_name = template_vars[var]["short_name"]
-                else:
-                    new_var.short_name = template_vars[var]["name"]
+                new_var = ncfile.createVariable(varPlan.name, varPlan.dataType, varPlan.dims,
+                                                **p2nc.variableKwargs(ncfile, varPlan))
+                if 'units' not in varPlan.attributes:
+                    raise KeyError('units')
+                # Write the attributes, units, those in possible_var_attr and short_name (the variable name if not set)
+                new_var.setncatts(varPlan.attributes)
                 # _____________________________________________________________________________________
                 # Write the data (1D, 2D, or 3D)
                 #______________________________________________________________________________________
@@ -170,16 +155,16 @@ def write_data_to_nc(ncfile, template_vars, data_dict, write_vars='_variables'):
                     data = np.empty((1,), 'S'+repr(len(station_id)))
                     data[0] = station_id
                     new_var[:] = nc.stringtochar(data)
-                elif len(template_vars[var]["dim"]) == 0:
+                elif len(varPlan.dims) == 0:
                     try:
                         new_var[:] = data_dict[var]
                     except Exception as e:
                         new_var = data_dict[var]
 
-                elif len(template_vars[var]["dim"]) == 1:
+                elif len(varPlan.dims) == 1:
                     # catch some possible errors for frequency and direction arrays
-                    if template_vars[var]["data_type"] == 'str':
-                        for i, c in enumerate(template_vars[var]["data_type"]):
+                    if varPlan.dataType == 'str':
+                        for i, c in enumerate(varPlan.dataType):
                             new_var[i] = data_dict[var][i]
                     else:
                         try:
@@ -190,31 +175,22 @@ def write_data_to_nc(ncfile, template_vars, data_dict, write_vars='_variables'):
                             except Exception as e:
                                 raise e
 
-                elif len(template_vars[var]["dim"]) == 2:
-                    # create an empty 2d data set of the correct sizes
-                    try:
-                        # handles row vs col data, rather than transposing the array just figure out which it is
-                        length = data_dict[var][0].shape[1]
-                        if data_dict[var][0].shape[0] > length:
-                            length = data_dict[var][0].shape[0]
-
-                        x = np.empty([data_dict[var].shape[0], length], np.float64)
-                        for i in range(data_dict[var].shape[0]):
-                            # squeeze the 3d array in to 2d as dimension is not needed
-                            x[i] = np.squeeze(data_dict[var][i])
-                        new_var[:, :] = x
-                    except Exception as e:
+                elif len(varPlan.dims) == 2:
+                    data = np.asarray(data_dict[var])
+                    if data.dtype.kind in 'biuf':
+                        if data.ndim == 3 and 1 in data.shape[1:]:
+                            # squeeze the 3d array in to 2d as dimension is not needed (a view, not a copy)
+                            data = data.reshape(data.shape[0], -1)
+                        new_var[:, :] = p2nc.asVariableType(data, new_var)
+                    else:
                         # if the tuple fails must be right...right?
                         new_var[:] = data_dict[var]
 
-                elif len(template_vars[var]["dim"]) == 3:
-                    # create an empty 3d data set of the correct sizes
+                elif len(varPlan.dims) == 3:
                     # this portion was modified by Spicer Bak
                     assert data_dict[var].shape == new_var.shape, 'The data must have the Same Dimensions  (missing time?)'
-                    x = np.empty([data_dict[var].shape[0], data_dict[var].shape[1], data_dict[var].shape[2]], np.float64)
-                    for i in range(data_dict[var].shape[0]):
-                        x[i] = data_dict[var][i]
-                    new_var[:, :, :] = x[:, :, :]
+                    for i in range(data_dict[var].shape[0]):  # written a time step (hyperslab) at a time
+                        new_var[i] = p2nc.asVariableType(data_dict[var][i], new_var)
 
             except Exception as e:
                 num_errors += 1
@@ -278,24 +254,26 @@ def makenc_field(data_lib, globalyaml_fname, flagfname, ofname, griddata, var_ya
     # close file
     fid.close()
 
-def makenc_FRFTransect(bathyDict, ofname, globalYaml, varYaml):
+def makenc_FRFTransect(bathyDict, ofname, globalYaml, varYaml, sourceFile=None):
     """
     This function makes netCDF files from csv Transect data library created with sblib.load_FRF_transect
 
-    :
+    :param sourceFile: survey file the transect was read from, recorded in the file (default None), see
+            py2netCDF.recordSource
     :return:
     """
-    globalAtts = import_template_file(globalYaml)  # loading global meta data attributes from  yaml
-    varAtts = import_template_file(varYaml)  # loading variables to write and associated meta data
+    # loading global meta data attributes and variables to write from the yamls (compiled once, reused across files)
+    writePlan = p2nc.getWritePlan(globalYaml, varYaml, attributeNames=possible_var_attr, compress=False)
 
     # initializing output ncfile
-    fid =init_nc_file(ofname, globalAtts)
+    fid =init_nc_file(ofname, writePlan.globalAttributes)
 
     # creating dimensions of data
     tdim = fid.createDimension('time', np.shape(bathyDict['time'])[0])
 
     # write data to the ncfile
-    write_data_to_nc(fid, varAtts, bathyDict)
+    write_data_to_nc(fid, writePlan, bathyDict)
+    p2nc.recordSource(fid, sourceFile)
     # close file
     fid.close()
 
@@ -311,11 +289,10 @@ def makenc_FRFGrid(gridDict, ofname, globalYaml, varYaml):
     :param varYaml:
     :return: netCDF file with gridded data in it
     """
-    globalAtts = import_template_file(globalYaml)
-    varAtts = import_template_file(varYaml)
+    writePlan = p2nc.getWritePlan(globalYaml, varYaml, attributeNames=possible_var_attr, compress=False)
 
     # create netcdf file
-    fid = init_nc_file(ofname, globalAtts)
+    fid = init_nc_file(ofname, writePlan.globalAttributes)
 
     # creating dimensions of data
     xFRF = fid.createDimension('xFRF', np.shape(gridDict['xFRF'])[0])
@@ -323,7 +300,7 @@ def makenc_FRFGrid(gridDict, ofname, globalYaml, varYaml):
     time = fid.createDimension('time', np.size(gridDict['time']))
 
     # write data to file
-    write_data_to_nc(fid, varAtts, gridDict)
+    write_data_to_nc(fid, writePlan, gridDict)
     # close file
     fid.close()
 
@@ -416,8 +393,9 @@ def convert_FRFgrid(xyz, ofname, globalYaml, varYaml, plotFlag=False):
         plt.savefig(ofname[:-4] + '_RawGridTxt.png')
         plt.close()
     # making labels in FRF coords for the netCDF grid
-    ncXcoord = np.linspace(gridXmin, gridXmax, num=(gridXmax - gridXmin) / dx + 1, endpoint=True)
-    ncYcoord = np.linspace(gridYmin, gridYmax, num=(gridYmax - gridYmin) / dy + 1, endpoint=True)
+    template = gridTemplate.getFRFgridTemplate(dx, dy, gridXmin=gridXmin, gridXmax=gridXmax, gridYmin=gridYmin,
+                                               gridYmax=gridYmax)
+    ncXcoord, ncYcoord = template['xFRF'], template['yFRF']
     frame = np.full((np.shape(ncXcoord)[0], np.shape(ncYcoord)[0]), fill_value=fill_value, dtype=np.float64)
 
     # find the overlap locations between text file grid and the nodes used for the netCDF file
@@ -485,22 +463,11 @@ def convert_FRFgrid(xyz, ofname, globalYaml, varYaml, plotFlag=False):
                 'versionDate': versionDate,
                 'project': fields[3]
                 }
-    # creating lat/lon and state plane coords
-    # xgrid, ygrid = np.meshgrid(gridDict['xgrid'], gridDict['ygrid'])
-    xx, yy = np.meshgrid(gridDict['xgrid'], gridDict['ygrid'])
-    latGrid = np.zeros(np.shape(yy))
-    lonGrid = np.zeros(np.shape(xx))
-    statePlN = np.zeros(np.shape(yy))
-    statePlE = np.zeros(np.shape(xx))
-    for iy in range(0, np.size(gridDict['zgrid'], axis=0)):
-        for ix in range(0, np.size(gridDict['zgrid'], axis=1)):
-            coords = sb.FRFcoord(xx[iy, ix], yy[iy, ix])  # , grid[iy, ix]))
-            statePlE[iy, ix] = coords['StateplaneE']
-            statePlN[iy, ix] = coords['StateplaneN']
-            latGrid[iy, ix] = coords['Lat']
-            lonGrid[iy, ix] = coords['Lon']
-            assert xx[iy, ix] == coords['FRF_X']
-            assert yy[iy, ix] == coords['FRF_Y']
+    # lat/lon and state plane coords of the template nodes, computed once per resolution by the template registry
+    latGrid = template['latitude']
+    lonGrid = template['longitude']
+    statePlN = template['northing']
+    statePlE = template['easting']
 
     # put these data into the dictionary that matches the yaml
     gridDict['latitude'] = latGrid
@@ -1,14 +1,11 @@
-import os
-import surveyToNetCDF
+import os, sys
+import batchConvert
 
 dataDir = '/home/mikef/PycharmProjects/netcdf_Survey/data'
+jobs = int(sys.argv[1]) if len(sys.argv) > 1 else None  # number of worker processes, default every core
 
 fileList = os.listdir(dataDir)
 
-for file in fileList:
-    if file.endswith('.csv'):
-        surveyToNetCDF.convertText2NetCDF(dataDir + '/' + file)
-    #if file.endswith('.txt'):
-        #surveyToNetCDF.convertText2NetCDF(dataDir + '/' + file)
-
-
+# transects only, add '.txt' to convert grids too
+convertList = [os.path.join(dataDir, file) for file in sorted(fileList) if file.endswith('.csv')]
+batchConvert.runBatch(convertList, jobs=jobs, logFile=os.path.join(dataDir, 'Bathy_LOG.jsonl'))
@@ -0,0 +1,380 @@
+"""Persistent spatio-temporal index of the soundings of every transect survey.
+
+Points are bucketed on an xFRF/yFRF grid of cellSize meters and stored sorted by bucket and, within a bucket, by time,
+so a radius, box or time window query only reads the buckets it overlaps and, in each, the run of points in the time
+window.  The index is a directory of segments (one .npy file per column, memory mapped when queried) and a manifest;
+update() adds the surveys that are new or changed since the last update as a new segment (the points of a changed or
+removed file are dropped from every query at once) and compact() merges the segments back into one, which update()
+does by itself once there are more than maxSegments.
+
+    index = TransectPointIndex('/data/FRF/survey/pointIndex')
+    index.update(['/data/FRF/survey/transects'])
+    points = index.box(yMin=505, yMax=525, start=DT.datetime(1990, 1, 1), end=DT.datetime(2000, 1, 1))
+    points['xFRF'], points['elevation'], points['time'], points['source']
+
+Transect netCDF products (*elevationTransects*.nc) and raw transect files (FRF_*.csv) can both be indexed, a survey is
+only indexed from one of them (the product when there are both).
+
+can be run from terminal
+    python pointIndex.py [--index=dir] [--cell=meters] [--jobs=N] update file_directory_or_glob [...]
+    python pointIndex.py [--index=dir] query [--box=xmin,xmax,ymin,ymax] [--near=x,y,radius] [--start=YYYY-MM-DD]
+                                             [--end=YYYY-MM-DD] [--out=points.npz]
+    python pointIndex.py [--index=dir] compact
+"""
+import sys, getopt, os, glob
+import json
+import time
+import shutil
+import datetime as DT
+import numpy as np
+import netCDF4 as nc
+from concurrent.futures import ProcessPoolExecutor
+
+defaultIndexDir = 'transectPointIndex'
+indexVersion = 2  # version 1 indexes did not record the survey of each file
+# columns of every segment and their types, bucket is the sort key (see bucketKey)
+pointColumns = {'bucket': 'i8', 'time': 'f8', 'xFRF': 'f8', 'yFRF': 'f8', 'elevation': 'f8', 'surveyNumber': 'i4',
+                'profileNumber': 'i4', 'source': 'i4'}
+_bucketOffset, _bucketStride = 1 << 20, 1 << 21  # bucket column and row numbers packed into one integer
+
+
+def bucketKey(ix, iy):
+    """sort key of the bucket in column ix (xFRF // cellSize) and row iy (yFRF // cellSize)"""
+    return (np.asarray(ix, dtype='i8') + _bucketOffset) * _bucketStride + (np.asarray(iy, dtype='i8') + _bucketOffset)
+
+
+def readTransectPoints(fname):
+    """Reads the soundings of one transect survey.
+
+    Args:
+        fname: transect netCDF product (.nc) or raw transect file (.csv)
+
+    Returns:
+        dictionary of 'time' (seconds since 1970-01-01), 'xFRF', 'yFRF', 'elevation', 'surveyNumber' and
+        'profileNumber' arrays, points with no position or time left out
+
+    """
+    if fname.lower().endswith('.csv'):
+        import sblib as sb  # only needed for raw files
+        transect = sb.import_FRF_Transect(fname)
+        points = {'time': nc.date2num(list(transect['time']), 'seconds since 1970-01-01'), 'xFRF': transect['xFRF'],
+                  'yFRF': transect['yFRF'], 'elevation': transect['Elevation'],
+                  'surveyNumber': transect['Survey_number'], 'profileNumber': transect['Profile_number']}
+    else:
+        with nc.Dataset(fname) as fid:
+            times = fid.variables['time']
+            points = {'time': nc.date2num(nc.num2date(times[:], times.units), 'seconds since 1970-01-01')}
+            for var in ['xFRF', 'yFRF', 'elevation', 'surveyNumber', 'profileNumber']:
+                points[var] = fid.variables[var][:] if var in fid.variables else np.ma.masked_all(times.shape)
+    good = ~(np.ma.getmaskarray(points['time']) | np.ma.getmaskarray(points['xFRF']) |
+             np.ma.getmaskarray(points['yFRF']))
+    filled = {'elevation': np.nan, 'surveyNumber': -999, 'profileNumber': -999}
+    return {var: np.ma.filled(np.ma.asarray(values, dtype=pointColumns[var]), filled.get(var, 0))[good]
+            for var, values in points.items()}
+
+
+def _readPoints(fname):
+    """readTransectPoints for the update pool, a file that can not be read is returned with its error"""
+    try:
+        return fname, readTransectPoints(fname), None
+    except Exception as e:
+        return fname, None, '{}: {}'.format(type(e).__name__, e)
+
+
+def _surveyKey(points):
+    """survey numbers and day (of the first sounding) of the points of a file, the same for a survey in either form
+
+    The product and raw forms of a survey do not hold exactly the same soundings and times (the product is written
+    from the time sorted survey), so the survey is not keyed on its exact time span.
+    """
+    numbers = tuple(int(number) for number in np.unique(points['surveyNumber'][points['surveyNumber'] != -999]))
+    day = None if points['time'].size == 0 else int(points['time'].min() // 86400)
+    return numbers, day
+
+
+class TransectPointIndex(object):
+    """Spatio-temporal index of transect soundings, see the module documentation."""
+
+    def __init__(self, indexDir=defaultIndexDir, cellSize=10., maxSegments=16):
+        """
+        Args:
+            indexDir: index directory, created if it does not exist
+            cellSize: bucket size (m) of a new index, an existing index keeps its own (default=10)
+            maxSegments: segments update() lets build up before it compacts the index (default=16)
+
+        """
+        self.indexDir = indexDir
+        self.maxSegments = maxSegments
+        self.manifestFile = os.path.join(indexDir, 'manifest.json')
+        if os.path.isfile(self.manifestFile):
+            with open(self.manifestFile) as f:
+                self.manifest = json.load(f)
+            if self.manifest.get('version') != indexVersion:
+                raise ValueError('{} is a version {} index, rebuild it'.format(indexDir, self.manifest.get('version')))
+        else:
+            self.manifest = {'version': indexVersion, 'cellSize': float(cellSize), 'sources': [], 'segments': [],
+                             'nextSegment': 0}
+        self.cellSize = self.manifest['cellSize']
+        self._segments = {}  # segment name: dictionary of memory mapped columns
+
+    def _save(self):
+        """writes the manifest to a temporary file and renames it into place, queries never see it half written"""
+        if not os.path.isdir(self.indexDir):
+            os.makedirs(self.indexDir)
+        tmpFile = self.manifestFile + '.tmp'
+        with open(tmpFile, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmpFile, self.manifestFile)
+
+    def _columns(self, segment):
+        """memory mapped columns of a segment"""
+        if segment['name'] not in self._segments:
+            self._segments[segment['name']] = {
+                    column: np.load(os.path.join(self.indexDir, segment['name'], column + '.npy'), mmap_mode='r')
+                    for column in pointColumns}
+        return self._segments[segment['name']]
+
+    def _writeSegment(self, columns):
+        """sorts points by bucket and time and writes them as a new segment, returns its manifest entry"""
+        order = np.lexsort((columns['time'], columns['bucket']))
+        name = 'segment{:06d}'.format(self.manifest['nextSegment'])
+        self.manifest['nextSegment'] += 1
+        os.makedirs(os.path.join(self.indexDir, name))
+        for column, dtype in pointColumns.items():
+            np.save(os.path.join(self.indexDir, name, column + '.npy'), np.asarray(columns[column], dtype=dtype)[order])
+        ix, iy = columns['bucket'] // _bucketStride - _bucketOffset, columns['bucket'] % _bucketStride - _bucketOffset
+        return {'name': name, 'points': int(order.size), 'ixMin': int(ix.min()), 'ixMax': int(ix.max()),
+                'iyMin': int(iy.min()), 'iyMax': int(iy.max()), 'timeMin': float(columns['time'].min()),
+                'timeMax': float(columns['time'].max())}
+
+    def update(self, paths, jobs=1):
+        """Adds the transect surveys that are new or changed since the last update.
+
+        Files whose size and modification time are unchanged are skipped, the points of changed files are replaced
+        and those of indexed files that no longer exist are dropped.  Each survey is indexed from one file only: a file
+        with the same survey numbers and day as one already indexed is skipped, unless it is the netCDF product of a
+        survey indexed from its raw file, which it then replaces.
+
+        Args:
+            paths: list of files, directories (searched for *elevationTransects*.nc, or for FRF_*.csv when there are
+                no products in them) or glob patterns
+            jobs: number of worker processes reading the surveys (default=1, None uses every core)
+
+        Returns:
+            number of files added
+
+        """
+        fileList = []
+        for path in paths:
+            if os.path.isdir(path):
+                products = glob.glob(os.path.join(path, '*elevationTransects*.nc'))
+                fileList.extend(products if products else glob.glob(os.path.join(path, 'FRF_*.csv')))
+            else:
+                fileList.extend(glob.glob(path))
+        fileList = sorted(set(os.path.abspath(fname) for fname in fileList))
+        # latest entry of every file that is indexed or was skipped as a duplicate of an indexed file
+        known = {source['path']: source for source in self.manifest['sources']
+                 if source['active'] or source.get('duplicateOf')}
+        gone = set(fname for fname, source in known.items() if source['active'] and not os.path.isfile(fname))
+        for source in known.values():  # the duplicates of removed files are read again
+            if source.get('duplicateOf') in gone:
+                source['duplicateOf'] = None
+        todo = []
+        for fname in fileList:
+            stat = os.stat(fname)
+            source = known.get(fname)
+            if source is None or not (source['active'] or source.get('duplicateOf')) or \
+                    (source['size'], source['mtime']) != (stat.st_size, stat.st_mtime):
+                todo.append(fname)
+        for source in known.values():  # changed or gone, their points stop being returned
+            if source['path'] in todo or source['path'] in gone:
+                source['active'], source['duplicateOf'] = False, None
+        todo.sort(key=lambda fname: not fname.lower().endswith('.nc'))  # products first, they win over raw files
+        print('Indexing %d of %d transect file(s)' % (len(todo), len(fileList)))
+
+        start, columns = time.time(), {column: [] for column in pointColumns}
+        if jobs is None or jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(_readPoints, todo))
+        else:
+            results = map(_readPoints, todo)
+        surveys = {(tuple(source['survey'][0]), source['survey'][1]): source for source in self.manifest['sources']
+                   if source['active'] and 'survey' in source}  # the manifest keeps the survey as [[numbers], day]
+        added = 0
+        for fname, points, error in results:
+            if error is not None:
+                print('<<ERROR>> %s %s' % (fname, error))
+                continue
+            stat = os.stat(fname)
+            survey = _surveyKey(points)
+            source = {'path': fname, 'size': stat.st_size, 'mtime': stat.st_mtime,
+                      'survey': [list(survey[0]), survey[1]], 'points': int(points['time'].size), 'active': True}
+            indexed = surveys.get(survey)
+            if indexed is not None and (indexed['path'].lower().endswith('.nc') or not fname.lower().endswith('.nc')):
+                print('  <II> %s is survey %s already indexed from %s, skipped' % (fname, survey[0], indexed['path']))
+                source.update(points=0, active=False, duplicateOf=indexed['path'])
+                self.manifest['sources'].append(source)
+                continue
+            if indexed is not None:  # the product replaces the raw file
+                indexed['active'] = False
+                print('  <II> %s replaces %s' % (fname, indexed['path']))
+            surveys[survey] = source
+            sourceId = len(self.manifest['sources'])
+            self.manifest['sources'].append(source)
+            points['bucket'] = bucketKey(np.floor(points['xFRF'] / self.cellSize),
+                                         np.floor(points['yFRF'] / self.cellSize))
+            points['source'] = np.full(points['time'].size, sourceId, dtype='i4')
+            for column in pointColumns:
+                columns[column].append(points[column])
+            added += 1
+        if any(column.size for column in columns['time']):
+            self.manifest['segments'].append(self._writeSegment({column: np.concatenate(values)
+                                                                  for column, values in columns.items()}))
+        self._save()
+        print('  <II> indexed %d file(s) in %.1f s' % (added, time.time() - start))
+        if len(self.manifest['segments']) > self.maxSegments:
+            self.compact()
+        return added
+
+    def compact(self):
+        """Merges every segment into one, leaving out the points of changed and removed files.
+
+        All the points of the index are held in memory while they are merged.
+        """
+        active = np.array([source['active'] for source in self.manifest['sources']], dtype=bool)
+        keep = [source['active'] or bool(source.get('duplicateOf')) for source in self.manifest['sources']]
+        newId = np.cumsum(keep) - 1  # source numbers once the inactive ones are gone (skipped duplicates are kept)
+        columns = {column: [] for column in pointColumns}
+        for segment in self.manifest['segments']:
+            segmentColumns = self._columns(segment)
+            good = active[segmentColumns['source']]
+            for column in pointColumns:
+                columns[column].append(np.asarray(segmentColumns[column][good]))
+            columns['source'][-1] = newId[columns['source'][-1]]
+        oldSegments = self.manifest['segments']
+        self.manifest['sources'] = [source for source, kept in zip(self.manifest['sources'], keep) if kept]
+        self.manifest['segments'] = []
+        if any(column.size for column in columns['time']):
+            self.manifest['segments'].append(self._writeSegment({column: np.concatenate(values)
+                                                                  for column, values in columns.items()}))
+        self._save()
+        self._segments = {}
+        for segment in oldSegments:  # only once the manifest no longer points at them
+            shutil.rmtree(os.path.join(self.indexDir, segment['name']), ignore_errors=True)
+        print('  <II> compacted %d segment(s) into %d' % (len(oldSegments), len(self.manifest['segments'])))
+
+    def query(self, xMin=None, xMax=None, yMin=None, yMax=None, start=None, end=None, center=None, radius=None):
+        """Finds the soundings in a box (or circle) and time window.
+
+        Args:
+            xMin, xMax, yMin, yMax: FRF box the points are in, None for no limit (default=None)
+            start, end: time window, datetime or seconds since 1970-01-01, None for no limit (default=None)
+            center: (xFRF, yFRF) of a circle the points are in, with radius (default=None)
+            radius: circle radius (m) (default=None)
+
+        Returns:
+            dictionary of arrays sorted by time: 'time' (seconds since 1970-01-01), 'xFRF', 'yFRF', 'elevation',
+            'surveyNumber', 'profileNumber' and 'source' (the file each point was indexed from)
+
+        """
+        if center is not None:
+            xMin, xMax = _tighter(xMin, center[0] - radius, max), _tighter(xMax, center[0] + radius, min)
+            yMin, yMax = _tighter(yMin, center[1] - radius, max), _tighter(yMax, center[1] + radius, min)
+        start = -np.inf if start is None else _epoch(start)
+        end = np.inf if end is None else _epoch(end)
+        active = np.array([source['active'] for source in self.manifest['sources']], dtype=bool)
+        found = {column: [] for column in pointColumns}
+        for segment in self.manifest['segments']:
+            if segment['timeMax'] < start or segment['timeMin'] > end:
+                continue
+            ixRange = _bucketRange(xMin, xMax, self.cellSize, segment['ixMin'], segment['ixMax'])
+            iyRange = _bucketRange(yMin, yMax, self.cellSize, segment['iyMin'], segment['iyMax'])
+            if ixRange is None or iyRange is None:
+                continue
+            columns = self._columns(segment)
+            ix, iy = np.meshgrid(np.arange(ixRange[0], ixRange[1] + 1), np.arange(iyRange[0], iyRange[1] + 1))
+            keys = np.sort(bucketKey(ix.ravel(), iy.ravel()))
+            lows, highs = np.searchsorted(columns['bucket'], keys, 'left'), np.searchsorted(columns['bucket'], keys,
+                                                                                              'right')
+            runs = []
+            for low, high in zip(lows[highs > lows], highs[highs > lows]):  # a bucket, sorted by time
+                times = columns['time'][low:high]
+                runs.append((low + np.searchsorted(times, start, 'left'), low + np.searchsorted(times, end, 'right')))
+            if not runs:
+                continue
+            index = np.concatenate([np.arange(low, high) for low, high in runs])
+            points = {column: np.asarray(columns[column][index]) for column in pointColumns}
+            inside = active[points['source']]
+            inside &= _within(points['xFRF'], xMin, xMax) & _within(points['yFRF'], yMin, yMax)
+            if center is not None:
+                inside &= (points['xFRF'] - center[0]) ** 2 + (points['yFRF'] - center[1]) ** 2 <= radius ** 2
+            for column in pointColumns:
+                found[column].append(points[column][inside])
+        found = {column: np.concatenate(values) if values else np.array([], dtype=pointColumns[column])
+                 for column, values in found.items()}
+        order = np.argsort(found['time'], kind='stable')
+        paths = np.array([source['path'] for source in self.manifest['sources']] + [None], dtype=object)
+        points = {column: found[column][order] for column in pointColumns if column not in ['bucket', 'source']}
+        points['source'] = paths[found['source'][order]]
+        return points
+
+    def box(self, xMin=None, xMax=None, yMin=None, yMax=None, start=None, end=None):
+        """soundings in an FRF box and time window, see query"""
+        return self.query(xMin=xMin, xMax=xMax, yMin=yMin, yMax=yMax, start=start, end=end)
+
+    def near(self, xFRF, yFRF, radius, start=None, end=None):
+        """soundings within radius (m) of a location and in a time window, see query"""
+        return self.query(start=start, end=end, center=(xFRF, yFRF), radius=radius)
+
+
+def _tighter(limit, bound, pick):
+    return bound if limit is None else pick(limit, bound)
+
+
+def _bucketRange(low, high, cellSize, segmentLow, segmentHigh):
+    """bucket numbers of a coordinate range clipped to those of a segment, None if they do not overlap"""
+    first = segmentLow if low is None else max(segmentLow, int(np.floor(low / cellSize)))
+    last = segmentHigh if high is None else min(segmentHigh, int(np.floor(high / cellSize)))
+    return None if first > last else (first, last)
+
+
+def _within(values, low, high):
+    inside = np.ones(values.shape, dtype=bool)
+    if low is not None:
+        inside &= values >= low
+    if high is not None:
+        inside &= values <= high
+    return inside
+
+
+def _epoch(when):
+    """datetime (or seconds since 1970-01-01) to seconds since 1970-01-01"""
+    if isinstance(when, DT.datetime):
+        return float(nc.date2num(when, 'seconds since 1970-01-01'))
+    return float(when)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.gnu_getopt(sys.argv[1:], "hj:", ["help", "index=", "cell=", "jobs=", "box=", "near=",
+                                                          "start=", "end=", "out="])
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts or len(args) == 0 or args[0] not in ['update', 'query', 'compact']:
+        print(__doc__)
+        sys.exit(0)
+    index = TransectPointIndex(opts.get('--index', defaultIndexDir), cellSize=float(opts.get('--cell', 10)))
+    if args[0] == 'update':
+        index.update(args[1:], jobs=int(opts.get('--jobs', opts.get('-j', 1))))
+    elif args[0] == 'compact':
+        index.compact()
+    else:
+        toDate = lambda text: DT.datetime.strptime(text, '%Y-%m-%d')
+        box = [float(edge) for edge in opts['--box'].split(',')] if '--box' in opts else [None] * 4
+        near = [float(value) for value in opts['--near'].split(',')] if '--near' in opts else None
+        started = time.time()
+        points = index.query(*box, start=toDate(opts['--start']) if '--start' in opts else None,
+                             end=toDate(opts['--end']) if '--end' in opts else None,
+                             center=near[:2] if near else None, radius=near[2] if near else None)
+        print('%d point(s) from %d file(s) in %.1f ms' % (points['time'].size, len(set(points['source'])),
+                                                          (time.time() - started) * 1e3))
+        if '--out' in opts:
+            np.savez(opts['--out'], **points)
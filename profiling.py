@@ -0,0 +1,162 @@
+"""Profiling of survey conversions on production inputs.
+
+profiled() runs a block under cProfile and, at the same time, a stack sampler that records the full call stack of the
+converting thread every few milliseconds.  Per survey file it writes
+    <name>.prof    cProfile statistics (pstats, snakeviz etc.)
+    <name>.txt     report of the hottest functions overall and in each of the conversion modules
+    <name>.folded  sampled stacks in the collapsed format of flamegraph.pl / speedscope / inferno
+and mergeFolded() adds the stacks of many files into one aggregate flame graph input.
+"""
+import os
+import sys
+import io
+import time
+import threading
+import cProfile
+import pstats
+import collections
+from contextlib import contextmanager
+
+# modules the report ranks hot functions for
+profiledModules = ['sblib', 'geoprocess', 'py2netCDF', 'makenc', 'surveyToNetCDF', 'survey_SortTime', 'gridTemplate']
+
+
+class StackSampler(threading.Thread):
+    """Samples the call stack of one thread at a fixed interval, counting each distinct stack."""
+
+    def __init__(self, threadId, interval=0.005, skip=0):
+        """
+        Args:
+            threadId: ident of the thread to sample (threading.get_ident())
+            interval: seconds between samples (default=0.005)
+            skip: number of outermost frames left out of every stack (default=0)
+
+        """
+        super(StackSampler, self).__init__(daemon=True)
+        self.threadId = threadId
+        self.interval = interval
+        self.skip = skip
+        self.counts = collections.Counter()  # collapsed stack (root first, ';' separated): number of samples
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        while not self._stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            stack = []
+            while frame is not None:
+                stack.append('{}:{}'.format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+                frame = frame.f_back
+            stack = stack[::-1][self.skip:]
+            if stack:
+                self.counts[';'.join(stack)] += 1
+
+    def stop(self):
+        """stops sampling and waits for the sampler to finish"""
+        self._stopEvent.set()
+        self.join()
+
+
+@contextmanager
+def profiled(reportBase, interval=0.005):
+    """Profiles the block, writing reportBase.prof, reportBase.txt and reportBase.folded when it finishes.
+
+    Args:
+        reportBase: report file name without extension, its directory is created if needed
+        interval: seconds between stack samples (default=0.005)
+
+    """
+    reportDir = os.path.dirname(reportBase)
+    if reportDir and not os.path.isdir(reportDir):
+        os.makedirs(reportDir, exist_ok=True)
+    # stacks start at the function profiling the block, the frames above it (eg. the pool machinery of a worker
+    # process) are the same for every sample
+    caller, skip = sys._getframe(2), -1
+    while caller is not None:
+        caller, skip = caller.f_back, skip + 1
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), interval, skip=skip)
+    sampler.start()
+    start = time.time()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        profiler.dump_stats(reportBase + '.prof')
+        writeReport(profiler, reportBase + '.txt', title='{} ({:.2f} s)'.format(reportBase, time.time() - start))
+        writeFolded(sampler.counts, reportBase + '.folded')
+
+
+def writeReport(profiler, fname, top=25, title=''):
+    """Writes the ranked hot function report of a profile.
+
+    Args:
+        profiler: cProfile.Profile (or anything pstats.Stats takes)
+        fname: report file name
+        top: number of functions listed in each ranking (default=25)
+        title: first line of the report (default='')
+
+    """
+    text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=text)
+    stats.strip_dirs()
+    text.write('{}\n\n==== hottest functions overall (cumulative time) ====\n'.format(title))
+    stats.sort_stats('cumulative').print_stats(top)
+    text.write('\n==== hottest functions overall (own time) ====\n')
+    stats.sort_stats('tottime').print_stats(top)
+    for module in profiledModules:
+        text.write('\n==== hottest functions in {} (own time) ====\n'.format(module))
+        stats.sort_stats('tottime').print_stats(r'^{}\.py:'.format(module), top)
+    with open(fname, 'w') as f:
+        f.write(text.getvalue())
+
+
+def writeFolded(counts, fname):
+    """Writes sampled stacks in the collapsed format, one 'frame;frame;frame count' line per distinct stack.
+
+    Args:
+        counts: dictionary of collapsed stack: number of samples
+        fname: output file name
+
+    """
+    with open(fname, 'w') as f:
+        for stack, count in sorted(counts.items()):
+            f.write('{} {}\n'.format(stack, count))
+
+
+def readFolded(fname):
+    """Reads a collapsed stack file written by writeFolded.
+
+    Args:
+        fname: collapsed stack file
+
+    Returns:
+        collections.Counter of collapsed stack: number of samples
+
+    """
+    counts = collections.Counter()
+    with open(fname) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                counts[stack] += int(count)
+    return counts
+
+
+def mergeFolded(fnames, outFname):
+    """Adds up the sampled stacks of many profiles into one aggregate flame graph input.
+
+    Args:
+        fnames: list of collapsed stack files
+        outFname: aggregate collapsed stack file
+
+    Returns:
+        outFname
+
+    """
+    counts = collections.Counter()
+    for fname in fnames:
+        counts.update(readFolded(fname))
+    writeFolded(counts, outFname)
+    return outFname
@@ -6,15 +6,26 @@ part of the Coastal Model Test Bed (CMTB)
 @author: Spicer Bak
 @contact: Spicer.Bak@usace.army.mil
 """
+import os
+import shutil
 import numpy as np
 import netCDF4 as nc
 import csv, yaml
 import datetime as DT
 import time as ttime
 import datetime as DT
+from collections import namedtuple
+from types import MappingProxyType
 
+# compiled yaml templates, see compileWritePlan
+WritePlan = namedtuple('WritePlan', ['globalAttributes', 'variableNames', 'variables', 'dataAttributes', 'dimensions'])
+VariablePlan = namedtuple('VariablePlan', ['key', 'name', 'dataType', 'dims', 'createKwargs', 'attributes'])
+_writePlans = {}  # write plans compiled by this process, keyed by yaml files and options, see getWritePlan
+layoutKeys = ['chunksizes', 'shuffle', 'complevel', 'contiguous']  # yaml keys of the variable storage layout
+sourceAttribute = 'sourceFiles'  # global attribute of the survey file names a file was made from, one per time step
 
-def makenc_generic(inputfname, globalYaml, varYaml, data):
+
+def makenc_generic(inputfname, globalYaml, varYaml, data, append=False, sourceFile=None):
     """
     
     Args:
@@ -22,70 +33,286 @@ def makenc_generic(inputfname, globalYaml, varYaml, data):
         globalYaml:
         varYaml:
         data:
+        append: add data as a new time step of the cube file inputfname instead of writing a new file (default=False)
+            see appendnc_generic
+        sourceFile: survey file the data was read from, recorded in the sourceAttribute global attribute
+            (default=None, not recorded), see recordSource
         
     Returns:
 
     """
-    varMetData = import_template_file(varYaml)
-    globalMetaData = import_template_file(globalYaml)
-    fid = init_nc_file(inputfname, globalMetaData)
+    if append:
+        return appendnc_generic(inputfname, globalYaml, varYaml, data, sourceFile=sourceFile)
+    writePlan = getWritePlan(globalYaml, varYaml)  # compiled yaml, only re-read when the yaml files change
+    fid = init_nc_file(inputfname, writePlan.globalAttributes)
     # create dimensions
-    _createDimensions(fid, varMetData, data)
+    _createDimensions(fid, writePlan, data)
     # write variables and data
-    write_data_to_nc(fid, varMetData, data)
+    write_data_to_nc(fid, writePlan, data)
+    recordSource(fid, sourceFile)
     fid.close()
 
 
-def ncFile2ncFile(inputFile, globalYaml, varYaml, **kwargs):
-    """Updates inputFile with new variables in varYaml and global Meta data in global Yaml
-    
+def appendnc_generic(cubeFname, globalYaml, varYaml, data, unlimitedDim='time', sourceFile=None):
+    """Appends one survey to a cube file that stacks surveys along an unlimited time dimension.
+
+    The first survey creates the cube (with unlimitedDim unlimited).  After that only the variables along
+    unlimitedDim (eg. time, elevation, surveyNumber, project, versionDate) are written, at the new time index; the
+    shared coordinates (the other dimension variables, xFRF and yFRF) are checked against the cube and not rewritten,
+    a survey on a different grid raises a ValueError.  A survey whose time is already in the cube replaces that time
+    step (reprocessed survey), one older than the last time step raises a ValueError so time stays monotonic.
+
+    The cube is opened for writing, only one process may append to a cube at a time.
+
     Args:
-        globalYaml:
-        inputFile (object):
-        varYaml:
+        cubeFname: cube netCDF file name
+        globalYaml: global meta data yaml file
+        varYaml: variable meta data yaml file
+        data: dictionary of the survey data (as for makenc_generic)
+        unlimitedDim: dimension the surveys are stacked along (default='time')
+        sourceFile: survey file the data was read from, recorded for the time step written (default=None), see
+            recordSource
+
+    Returns:
+        index of the time step written
+
+    """
+    writePlan = getWritePlan(globalYaml, varYaml)
+    if not os.path.isfile(cubeFname):
+        fid = init_nc_file(cubeFname, writePlan.globalAttributes)
+        _createDimensions(fid, writePlan, data, unlimited=[unlimitedDim])
+        write_data_to_nc(fid, writePlan, data)
+        recordSource(fid, sourceFile)
+        fid.close()
+        return 0
+
+    with nc.Dataset(cubeFname, 'a') as fid:
+        index = _appendIndex(fid, writePlan, data, unlimitedDim)
+        for varPlan in writePlan.variables:
+            var = varPlan.key
+            if var not in data or varPlan.name not in fid.variables:
+                continue
+            new_var = fid.variables[varPlan.name]
+            if unlimitedDim not in varPlan.dims:
+                continue  # shared coordinates, checked in _appendIndex
+            try:
+                if new_var.dtype == np.dtype('S1') and isinstance(data[var], str):
+                    new_var[index] = _stringToChar(data[var], new_var.shape[-1])
+                else:
+                    new_var[index] = asVariableType(np.reshape(data[var], new_var.shape[1:]), new_var)
+            except Exception as e:
+                print(('ERROR WRITING VARIABLE: {} - {} \n'.format(var, str(e))))
+        recordSource(fid, sourceFile, step=index)
+        fid.date_issued = ttime.strftime("%Y-%m-%d")
+
+    return index
+
+
+def recordSource(fid, sourceFile, step=0):
+    """Records the survey file a time step of an open file was made from, in the sourceAttribute global attribute.
+
+    Args:
+        fid: netCDF file open for writing
+        sourceFile: survey file the time step was made from (only its name is kept), None records nothing
+        step: time step (default=0), cubes hold one name per time step
+
+    """
+    if sourceFile is None:
+        return
+    sourceFiles = readSourceFiles(fid)
+    sourceFiles.extend([''] * (step + 1 - len(sourceFiles)))
+    sourceFiles[step] = os.path.basename(sourceFile)
+    fid.setncattr(sourceAttribute, '\n'.join(sourceFiles))
+
+
+def readSourceFiles(fid):
+    """survey file names recorded in an open file, one per time step ('' where none was recorded)"""
+    if sourceAttribute not in fid.ncattrs():
+        return []
+    return str(fid.getncattr(sourceAttribute)).split('\n')
+
+
+def _appendIndex(fid, writePlan, data, unlimitedDim):
+    """checks the survey fits the cube and returns the time index it is written to"""
+    for varPlan in writePlan.variables:  # the shared dimension coordinates have to match the cube
+        if (varPlan.key in writePlan.dimensions and varPlan.key != unlimitedDim and varPlan.key in data and
+                varPlan.name in fid.variables and unlimitedDim not in varPlan.dims):
+            cubeCoordinate, coordinate = fid.variables[varPlan.name][:], np.asarray(data[varPlan.key])
+            if cubeCoordinate.shape != coordinate.shape or not np.allclose(cubeCoordinate, coordinate):
+                raise ValueError('{} of the survey does not match the cube {}'.format(varPlan.key, fid.filepath()))
+    times = np.ma.getdata(fid.variables[unlimitedDim][:])
+    time = float(np.squeeze(data[unlimitedDim]))
+    if np.isin(time, times):
+        print('  <II> replacing time step {} of {}'.format(time, fid.filepath()))
+        return int(np.flatnonzero(times == time)[0])
+    if times.size > 0 and time < times.max():
+        raise ValueError('survey time {} is older than the last time step of {}, rebuild the cube in time order'.format(
+                time, fid.filepath()))
+    return times.size
+
+
+def ncFile2ncFile(inputFile, globalYaml, varYaml, outputFile=None, **kwargs):
+    """Re-stamps the metadata of an existing netCDF file with the global and variable yaml templates.
+
+    The attributes of the file are combined with the templates (the templates win where both have an attribute, see
+    _combineGlobalMetaData and _combineVaribleMetaData).  When the templates only change attributes the file is
+    re-stamped in place, the data are not touched.  When they change how a variable is stored (name, dimensions,
+    data type, fill value, least_significant_digit, chunking or compression) the file is rewritten, every variable
+    copied a block at a time so memory stays bounded whatever the size of the file.  A file rewritten over itself is
+    written to a temporary name and renamed into place.  Variables of the templates that are not in the file are not
+    added, there are no data for them.
+
+    Args:
+        inputFile: netCDF file to re-stamp
+        globalYaml: global meta data yaml file
+        varYaml: variable meta data yaml file
+        outputFile: file written (default=None, inputFile is updated)
 
     Keyword Args:
-        'mesh data' a dictionary containing mesh topology
-        
+        'inPlace': re-stamp only the attributes, without rewriting the data, when that is all the templates change
+            (default=True), False always rewrites the file
+        'maxChunkBytes': largest block of a variable held in memory while copying (default=64 MB)
+        'attributeNames': template variable attributes written (default=None, every key of the template, as
+            makenc_generic writes them), eg. makenc.possible_var_attr for files written by makenc.  The attributes the
+            file already has are always kept
+
     Returns:
+        name of the file written
 
     """
-    meshData = kwargs.get('meshData', None)
-    dateCreated = DT.date.today()
-    dateIssued = dateCreated
-    geospatial_lon_min = None  # other spatial data
-    time_coverage_start = '2015-09-18T22:00:00Z'
-    time_coverage_end = '2015-09-18T22:00:00Z'
-    print('!!!! TODO: how to handle geospatial netCDF conventions')
-    print('!!!! TODO: how to handle time_coverage_start/end')
+    outputFile = inputFile if outputFile is None else outputFile
     globalMetaData = import_template_file(globalYaml)
-    # update global metaData with file write date
-    if 'dateCreated' not in globalMetaData:
-        globalMetaData.update({'dateCreated': dateCreated.strftime('%Y-%m-%d')})
-    else:
-        globalMetaData['dateCreated'] = dateCreated.strftime('%Y-%m-%d')
-    if 'dateIssued' not in globalMetaData:
-        globalMetaData.update({'dateIssued': dateIssued.strftime('%Y-%m-%d')})
-    else:
-        globalMetaData['dateIssued'] = dateIssued.strftime('%Y-%m-%d')
-    # read in variable metadata
-    varMetData = import_template_file(varYaml)
-    data_lib, dimensionLib, varMetaNetCDF, globalMetaNetCDF = readNetCDFfile(inputFile)
+    varMetaData = import_template_file(varYaml)
+    dimensionLib, varMetaNetCDF, globalMetaNetCDF = readNetCDFfile(inputFile)
+    attributeNames = kwargs.get('attributeNames', None)
+    if attributeNames is not None:
+        attributeNames = list(attributeNames) + sorted(set(att for var in varMetaNetCDF['_variables']
+                                                           for att in varMetaNetCDF['_fileAttributes'][var]))
     # now combine netCDF variable and global metaData
-    globalMetaData = _combineGlobalMetaData(globalMetaData, globalMetaNetCDF)
-    varMetData = _combineVaribleMetaData(varMetData, varMetaNetCDF)
-    
-    # begin File writing proceedure
-    ####### should this be its own function and the above be input specific (matlab, python, or netCDF file) ###########
-    # create file
-    fid = init_nc_file(inputFile, globalMetaData)
-    # create dimensions
-    inputFileDimensions = readDimensions(inputFile)
-    _createDimensions(varMetData, inputFileDimensions)
-    # write variables and data
-    write_data_to_nc(fid, varMetData, data_lib)
-    print('Write capability for compression to combine with significant digit attribute')
-    fid.close()
+    writePlan = compileWritePlan(_combineVaribleMetaData(varMetaData, varMetaNetCDF),
+                                 _combineGlobalMetaData(globalMetaData, globalMetaNetCDF),
+                                 attributeNames=attributeNames)
+
+    with nc.Dataset(inputFile) as src:
+        changes = _restampChanges(src, writePlan)
+    if kwargs.get('inPlace', True) and not changes:
+        if os.path.abspath(outputFile) != os.path.abspath(inputFile):
+            shutil.copyfile(inputFile, outputFile)
+        with nc.Dataset(outputFile, 'a') as fid:
+            fid.setncatts(dict(writePlan.globalAttributes))
+            for varPlan in writePlan.variables:
+                fid.variables[varPlan.key].setncatts(_restampAttributes(varPlan))
+            fid.date_issued = ttime.strftime("%Y-%m-%d")
+        print('  <II> re-stamped attributes of {}'.format(outputFile))
+        return outputFile
+
+    for change in changes:
+        print('  <II> {}, rewriting {}'.format(change, inputFile))
+    tmpFile = outputFile + '.tmp'
+    with nc.Dataset(inputFile) as src:
+        fid = init_nc_file(tmpFile, writePlan.globalAttributes)
+        try:
+            if 'date_created' in globalMetaNetCDF:  # a re-stamp is a new issue of the same file
+                fid.date_created = globalMetaNetCDF['date_created']
+            for dim, size in dimensionLib.items():
+                fid.createDimension(dim, size)
+            for varPlan in writePlan.variables:
+                new_var = fid.createVariable(varPlan.name, varPlan.dataType, varPlan.dims,
+                                             **variableKwargs(fid, varPlan))
+                new_var.setncatts(_restampAttributes(varPlan))
+                _copyVariable(src.variables[varPlan.key], new_var, kwargs.get('maxChunkBytes', 64 << 20))
+        finally:
+            fid.close()
+    os.replace(tmpFile, outputFile)
+    return outputFile
+
+
+def _restampAttributes(varPlan):
+    """attributes of a compiled variable that can be set once the variable exists"""
+    return {attr: value for attr, value in varPlan.attributes.items() if attr != '_FillValue'}
+
+
+def _restampChanges(src, writePlan):
+    """Lists what the write plan changes about how the variables of an open file are stored.
+
+    Args:
+        src: open netCDF file
+        writePlan: WritePlan of the combined file and template metadata
+
+    Returns:
+        list of change descriptions, empty when only attributes change
+
+    """
+    changes = []
+    for varPlan in writePlan.variables:
+        var = src.variables[varPlan.key]
+        kwargs = variableKwargs(src, varPlan)  # src has the dimensions the rewritten variable would have
+        filters = var.filters()
+        if varPlan.name != var.name:
+            changes.append('{} renamed {}'.format(var.name, varPlan.name))
+        if varPlan.dims != var.dimensions:
+            changes.append('{} dimensions {}'.format(var.name, list(varPlan.dims)))
+        if _dataType(varPlan.dataType) != _dataType(var.dtype):
+            changes.append('{} data type {}'.format(var.name, varPlan.dataType))
+        if 'fill_value' in kwargs and ('_FillValue' not in var.ncattrs() or not np.array_equal(
+                np.array(kwargs['fill_value']).astype(var.dtype), np.array(var.getncattr('_FillValue')))):
+            changes.append('{} fill value {}'.format(var.name, kwargs['fill_value']))
+        if kwargs.get('least_significant_digit') != (var.getncattr('least_significant_digit') if
+                                                      'least_significant_digit' in var.ncattrs() else None):
+            changes.append('{} least_significant_digit {}'.format(var.name, kwargs.get('least_significant_digit')))
+        if kwargs.get('contiguous', False) != (var.chunking() == 'contiguous') or (
+                'chunksizes' in kwargs and list(kwargs['chunksizes']) != var.chunking()):
+            changes.append('{} chunking {}'.format(var.name, kwargs.get('chunksizes', 'contiguous')))
+        zlib = kwargs.get('zlib', False)
+        if zlib != filters['zlib'] or (zlib and (kwargs.get('complevel', 4) != filters['complevel'] or
+                                                 kwargs.get('shuffle', True) != filters['shuffle'])):
+            changes.append('{} compression'.format(var.name))
+    return changes
+
+
+def _dataType(dataType):
+    """data type as its numpy code without byte order (eg. 'f8', 'i1', 'S1')"""
+    try:
+        return np.dtype(dataType).str[1:]
+    except TypeError:  # variable length types
+        return str(dataType)
+
+
+def _copyVariable(src, dst, maxChunkBytes):
+    """copies the raw values (packed, fill values and all) of a variable a block of at most maxChunkBytes at a time"""
+    src.set_auto_maskandscale(False)
+    dst.set_auto_mask(False)  # least_significant_digit (if new) is still applied as the data are written
+    if len(src.shape) == 0:
+        dst.assignValue(src.getValue())
+        return
+    for block in _blockSlices(src.shape, max(1, np.dtype(src.dtype).itemsize), maxChunkBytes):
+        dst[block] = src[block]
+
+
+def _blockSlices(shape, itemSize, maxBytes):
+    """Splits an array into blocks of at most maxBytes, cutting the leading dimensions first.
+
+    Args:
+        shape: shape of the array
+        itemSize: bytes per value
+        maxBytes: largest block (a block is never smaller than one value of every trailing dimension)
+
+    Returns:
+        list of tuples of slices, one per block
+
+    """
+    if 0 in shape:
+        return []
+    block, size = list(shape), itemSize * int(np.prod(shape))
+    for axis in range(len(shape)):
+        if size <= maxBytes:
+            break
+        size //= shape[axis]  # bytes of one index along axis
+        block[axis] = max(1, min(shape[axis], maxBytes // size))
+        size *= block[axis]
+    counts = [-(-length // step) for length, step in zip(shape, block)]
+    return [tuple(slice(i * step, min((i + 1) * step, length)) for i, step, length in zip(index, block, shape))
+            for index in np.ndindex(*counts)]
 
 
 def _combineGlobalMetaData(newGlobalMetaData, originalGlobalMetaData):
@@ -95,101 +322,153 @@ def _combineGlobalMetaData(newGlobalMetaData, originalGlobalMetaData):
     preference to the newGlobalMetaData values.
     
     Args:
-        newGlobalMetaData: data takes preference over original metadata below
+        newGlobalMetaData: data takes preference over original metadata below, None values are left out
         originalGlobalMetaData: files original metaData
 
     Returns:
         globalMetaData dictionary that can be used in this package for writing netCDF files
 
     """
-    return originalGlobalMetaData.update(newGlobalMetaData)
+    globalMetaData = dict(originalGlobalMetaData)
+    globalMetaData.update({key: value for key, value in newGlobalMetaData.items() if value is not None})
+    return globalMetaData
 
 
 def _combineVaribleMetaData(newVarMetaData, oldVarMetaData):
     """Combines metatdata dictionaries for variables.
     
     Function will combine two metadata dictionaries.  If there is a conflict with attribute name, function will take
-    preference to the newVarMetaData values.
+    preference to the newVarMetaData values.  The variables are those of the file (keyed on their name in the file), a
+    template variable is matched to a file variable by its name.  A template that sets any of the storage layout keys
+    (layoutKeys) replaces the layout of the file variable entirely.
     
     Args:
-        newVarMetaData: input metadata dictionary from readNetCDFfile function
-        oldVarMetaData: input metadata dictionary from import_template_file function
+        newVarMetaData: input metadata dictionary from import_template_file function
+        oldVarMetaData: input metadata dictionary from readNetCDFfile function
 
     Returns:
-        variableMetaData dictionary
+        variableMetaData dictionary (as import_template_file returns)
     """
-    print('do stuff')
-    
+    templates = {}
+    for var in newVarMetaData.get('_variables', []):
+        if var in newVarMetaData:
+            templates[newVarMetaData[var].get('name', var)] = newVarMetaData[var]
+    variableMetaData = {'_variables': list(oldVarMetaData['_variables']),
+                        '_dimensions': list(oldVarMetaData['_dimensions']),
+                        '_attributes': list(newVarMetaData.get('_attributes', []))}
+    for var in oldVarMetaData['_variables']:
+        meta = dict(oldVarMetaData[var])
+        template = templates.get(var, {})
+        if any(key in template for key in layoutKeys):
+            for key in layoutKeys:
+                meta.pop(key, None)
+        meta.update(template)
+        if 'fill_value' in template and not _fitsType(template['fill_value'], meta.get('data_type')):
+            print('<<WARNING>> fill_value {} does not fit {} {}, keeping the fill value of the file'.format(
+                    template['fill_value'], var, meta.get('data_type')))
+            meta.pop('fill_value')
+            if 'fill_value' in oldVarMetaData[var]:
+                meta['fill_value'] = oldVarMetaData[var]['fill_value']
+        variableMetaData[var] = meta
+
     return variableMetaData
 
 
+def _fitsType(value, dataType):
+    """True if value can be stored in a variable of dataType (eg. -999 does not fit i1)"""
+    try:
+        dtype = np.dtype(dataType)
+    except TypeError:
+        return True
+    if dtype.kind in 'iu':
+        try:
+            return np.iinfo(dtype).min <= float(value) <= np.iinfo(dtype).max
+        except (TypeError, ValueError):
+            return False
+    return True
+
+
 def readNetCDFfile(inputFile):
-    """Opens inputNetCDF file and creates dictionaries for data, dimensions, variable meta data and global metadata.
+    """Opens inputNetCDF file and creates dictionaries for dimensions, variable meta data and global metadata.
+
+    The variable meta data are in the form import_template_file returns for a variable yaml: the attributes of each
+    variable plus its name, dim, data_type, fill_value and storage layout (layoutKeys).  '_fileAttributes' lists the
+    names of the attributes each variable has in the file.  The data are not read.
     
     Args:
         inputFile: input netCDF file
 
     Returns:
-        data_lib, dimensionLib,  varMetaData, globalMetaData
+        dimensionLib, varMetaData, globalMetaData
         
     """
-    ncfile = nc.Dataset(inputFile)
-    dimensionLib = ncfile.dimensions
-    data_Lib = ncfile.variables
+    dimensionLib = readDimensions(inputFile)
     # now collect variables and metadata
-    varMetaData = {'_variables': [], '_attributes': [], '_dimensions': []}
+    varMetaData = {'_variables': [], '_attributes': [], '_dimensions': list(dimensionLib), '_fileAttributes': {}}
     globalMetaData = {}
-    
-    # First: get all global Metadata
-    for att in ncfile.ncattrs():
-        globalMetaData[att] = ncfile.getncattr(att)
-    # Second: write dimensions
-    for dd, dim in enumerate(dimensionLib):
-        varMetaData['_dimensions'].append(dim)
-    
-    # Third: get variable names and attributes
-    for ncVar in data_Lib:
-        varMetaData['_variables'].append(ncVar)  # add variable to list of variables to write
-        
-        varMetaData[ncVar] = {
-                'name':     data_Lib[ncVar].name,
-                'dim':      list(data_Lib[ncVar].dimensions),
-                'chunking': data_Lib[ncVar].chunking(),
-                }
-        for var in data_Lib[ncVar].ncattrs():  # add attributes to variable metadatalist
-            varMetaData[ncVar][var] = data_Lib[ncVar].getncattr(var)
-    
-    ncfile.close()  # close file
-    
-    return data_Lib, dimensionLib, varMetaData, globalMetaData
+    with nc.Dataset(inputFile) as ncfile:
+        # First: get all global Metadata
+        for att in ncfile.ncattrs():
+            globalMetaData[att] = ncfile.getncattr(att)
+
+        # Second: get variable names and attributes
+        for ncVar, variable in ncfile.variables.items():
+            varMetaData['_variables'].append(ncVar)  # add variable to list of variables to write
+            meta = {att: variable.getncattr(att) for att in variable.ncattrs() if att != '_FillValue'}
+            varMetaData['_fileAttributes'][ncVar] = list(meta)
+            meta.update({'name': variable.name, 'dim': list(variable.dimensions),
+                         'data_type': _dataType(variable.dtype)})
+            if '_FillValue' in variable.ncattrs():
+                meta['fill_value'] = variable.getncattr('_FillValue')
+            chunking, filters = variable.chunking(), variable.filters()
+            if chunking == 'contiguous':
+                if 'least_significant_digit' not in meta:
+                    meta['contiguous'] = True
+            else:
+                meta.update({'chunksizes': list(chunking), 'shuffle': filters['shuffle'],
+                             'complevel': filters['complevel'] if filters['zlib'] else 0})
+            varMetaData[ncVar] = meta
+
+    return dimensionLib, varMetaData, globalMetaData
 
 
 def readDimensions(inputFile):
-    """This function is not implemented yet, but desgned to read the dimensions from a netCDF file.
+    """Reads the dimensions of a netCDF file.
     
     Args:
-        inputFile:
+        inputFile: input netCDF file
 
     Returns:
+        dictionary of dimension name: length (None for an unlimited dimension), in the order of the file
 
     """
+    with nc.Dataset(inputFile) as ncfile:
+        return {name: None if dim.isunlimited() else len(dim) for name, dim in ncfile.dimensions.items()}
 
 
-def _createDimensions(fid, varMetaData, data):
+def _createDimensions(fid, varMetaData, data, unlimited=()):
     """
     
     Args:
         fid: file id of open netCDF file (should have global meta data by this point)
-        varMetaData: varMetaData dictionary
+        varMetaData: varMetaData dictionary or a write plan (see getWritePlan)
         data: dictionary with dimension name and size
+        unlimited: names of the dimensions created unlimited (default=())
 
     Returns:
         None
     
     """
-    for dim in varMetaData['_dimensions']:  # loop through each dimension
+    if isinstance(varMetaData, WritePlan):
+        dimensions, variableNames = varMetaData.dimensions, varMetaData.variableNames
+    else:
+        dimensions, variableNames = varMetaData['_dimensions'], varMetaData['_variables']
+    for dim in dimensions:  # loop through each dimension
         # first check that dimensions have corresponding variables (CF assumption)
-        assert (dim in varMetaData['_variables']), "dimension {} doesn't have a corresponding variable".format(dim)
+        assert (dim in variableNames), "dimension {} doesn't have a corresponding variable".format(dim)
+        if dim in unlimited:
+            fid.createDimension(dim, None)
+            continue
         try:
             fid.createDimension(dim, len(data[dim]))
         except TypeError:  # in the event you have a np.array(1) -- singlton dimensionally zero so no len
@@ -217,6 +496,169 @@ def import_template_file(yaml_location):
     return vars_dict
 
 
+def getWritePlan(globalYaml, varYaml, attributeNames=None, compress=True):
+    """Returns the compiled write plan of a global and variable yaml pair, compiling it only when needed.
+
+    Plans are cached in this process and recompiled only when the modification time of either yaml changes, so a
+    batch of conversions parses its templates once.
+
+    Args:
+        globalYaml: global meta data yaml file
+        varYaml: variable meta data yaml file
+        attributeNames: variable attributes written, see compileWritePlan (default=None, every key in the yaml)
+        compress: compress variables that have a fill_value and least_significant_digit (default=True)
+
+    Returns:
+        WritePlan, see compileWritePlan
+
+    """
+    key = (os.path.abspath(globalYaml), os.path.abspath(varYaml),
+           None if attributeNames is None else tuple(attributeNames), compress)
+    mtimes = (os.stat(globalYaml).st_mtime_ns, os.stat(varYaml).st_mtime_ns)
+    cached = _writePlans.get(key)
+    if cached is None or cached[0] != mtimes:
+        cached = _writePlans[key] = (mtimes, compileWritePlan(import_template_file(varYaml),
+                                                              import_template_file(globalYaml),
+                                                              attributeNames=attributeNames, compress=compress))
+    return cached[1]
+
+
+def compileWritePlan(varMetaData, globalMetaData=None, attributeNames=None, compress=True):
+    """Compiles yaml templates into an immutable plan of everything needed to write a netCDF file.
+
+    Every variable is resolved once into its netCDF name, data type, dimensions, createVariable keyword arguments
+    (fill value, storage layout and compression) and the attributes written to it, so writing a file does no yaml
+    lookups.  The yaml dictionaries are not changed, the plan is made of tuples, namedtuples and read only mappings.
+
+    The storage layout of a variable is set with these optional yaml keys (layoutKeys, not written as attributes)
+        chunksizes: chunk length along each of dim, clipped to the dimension length when the file is written
+        shuffle: byte shuffle before compressing (True/False)
+        complevel: zlib compression level 1-9, 0 turns compression off (overrides the least_significant_digit
+            default)
+        contiguous: store unchunked and uncompressed (True/False), can not be combined with the keys above
+    variables with none of them get the netCDF library default layout.
+
+    Args:
+        varMetaData: variable meta data dictionary from import_template_file
+        globalMetaData: global meta data dictionary from import_template_file (default=None)
+        attributeNames: list of variable attributes written, units and short_name are always written
+            (default=None, every key in the yaml other than name)
+        compress: variables with a fill_value and least_significant_digit are written with zlib at comp_level
+            (default 6) (default=True), the layout keys are applied either way
+
+    Returns:
+        WritePlan namedtuple
+            'globalAttributes': global attributes, None values left out
+
+            'variableNames': keys of the variables in _variables
+
+            'variables': VariablePlan (key, name, dataType, dims, createKwargs, attributes) of each variable
+
+            'dataAttributes': global attributes taken from the data (_attributes)
+
+            'dimensions': dimensions (_dimensions)
+
+    """
+    variables = []
+    for var in varMetaData['_variables']:
+        if var not in varMetaData:
+            continue
+        meta = dict(varMetaData[var])
+        createKwargs = {}
+        if "fill_value" in meta:
+            createKwargs['fill_value'] = meta["fill_value"]
+            if compress and "least_significant_digit" in meta:
+                meta.setdefault('comp_level', 6)  # set above default 4 level by package
+                createKwargs.update({'least_significant_digit': meta['least_significant_digit'], 'zlib': True,
+                                     'complevel': meta['comp_level']})
+        createKwargs.update(_layoutKwargs(var, meta))
+        # units first, then the attributes in yaml order, short_name (defaults to the variable name) last
+        attributes = {'units': meta["units"]} if "units" in meta else {}
+        for attr in (meta if attributeNames is None else attributeNames):
+            if attr in meta and attr != 'name' and attr not in layoutKeys:
+                attributes[attr] = np.nan if meta[attr] == 'NaN' else meta[attr]
+        attributes['short_name'] = meta.get('short_name', meta.get('name'))
+        variables.append(VariablePlan(var, meta.get("name"), meta.get("data_type"), tuple(meta.get("dim", ())),
+                                      _freeze(createKwargs), _freeze(attributes)))
+
+    return WritePlan(_freeze({key: value for key, value in (globalMetaData or {}).items() if value is not None}),
+                     tuple(varMetaData['_variables']), tuple(variables),
+                     tuple(varMetaData.get('_attributes', ())), tuple(varMetaData.get('_dimensions', ())))
+
+
+def _layoutKwargs(var, meta):
+    """createVariable keyword arguments from the layout keys of a variable's yaml, see compileWritePlan"""
+    layout = {}
+    if meta.get('contiguous', False):
+        if any(key in meta for key in ['chunksizes', 'shuffle', 'complevel', 'least_significant_digit']):
+            raise ValueError('variable {} is contiguous, it can not also be chunked or compressed'.format(var))
+        layout['contiguous'] = True
+    if 'chunksizes' in meta:
+        if len(meta['chunksizes']) != len(meta.get('dim', ())):
+            raise ValueError('variable {} has chunksizes {} for dimensions {}'.format(var, meta['chunksizes'],
+                                                                                      meta.get('dim')))
+        layout['chunksizes'] = tuple(int(chunk) for chunk in meta['chunksizes'])
+    if 'complevel' in meta:
+        layout.update({'zlib': int(meta['complevel']) > 0, 'complevel': int(meta['complevel'])})
+    if 'shuffle' in meta:
+        layout['shuffle'] = bool(meta['shuffle'])
+    return layout
+
+
+def variableKwargs(ncfile, varPlan):
+    """Keyword arguments for ncfile.createVariable of a compiled variable.
+
+    Chunk sizes longer than their (fixed length) dimension are clipped to it, as the library requires.
+
+    Args:
+        ncfile: open netCDF file with the dimensions of the variable defined
+        varPlan: VariablePlan from a compiled write plan
+
+    Returns:
+        dictionary of keyword arguments
+
+    """
+    kwargs = dict(varPlan.createKwargs)
+    if 'chunksizes' in kwargs:
+        kwargs['chunksizes'] = [chunk if ncfile.dimensions[dim].isunlimited() else
+                                max(1, min(chunk, len(ncfile.dimensions[dim])))
+                                for dim, chunk in zip(varPlan.dims, kwargs['chunksizes'])]
+    return kwargs
+
+
+def asVariableType(data, new_var):
+    """Data ready to hand to a netCDF variable without further copies.
+
+    Returns data itself when it is already a C contiguous array of the variable's declared type, otherwise one
+    contiguous copy in that type (eg. float64 data for an f4 variable are cast once, straight to float32).
+
+    Args:
+        data: array (or anything numpy.asarray takes)
+        new_var: netCDF4 variable the data are written to
+
+    Returns:
+        numpy array
+
+    """
+    if isinstance(new_var.dtype, np.dtype):
+        return np.ascontiguousarray(data, dtype=new_var.dtype)
+    return np.ascontiguousarray(data)
+
+
+def _stringToChar(text, length):
+    """string as a char (S1) array of length, padded with blanks or cut"""
+    return np.array(list(text.ljust(length)[:length]), dtype='S1')
+
+
+def _freeze(value):
+    """read only copy of nested yaml dictionaries and lists"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
 def init_nc_file(nc_filename, attributes):
     """Create the netCDF file and write the Global Attributes.
     
@@ -254,7 +696,8 @@ def write_data_to_nc(ncfile, template_vars, data_dict):
     
     Args:
       ncfile: this is an already opened netCDF file with already defined dimensions
-      template_vars (dict): variable and meta data associated with data_dict
+      template_vars: compiled write plan (see getWritePlan), or the variable meta data dictionary (from
+        import_template_file) associated with data_dict, which is then compiled for this call (and left unchanged)
       data_dict (dict): this is a dictionary with keys associated to those hopefully in template_vars, this holds the data
 
     Returns:
@@ -262,61 +705,28 @@ def write_data_to_nc(ncfile, template_vars, data_dict):
       also returns error strings and count that were created during the data writing process
 
     """
+    if not isinstance(template_vars, WritePlan):
+        template_vars = compileWritePlan(template_vars)
     # Keep track of any errors found
     num_errors = 0
     error_str = ''
     
     # write some more global attributes if present
-    if '_attributes' in template_vars:
-        for var in template_vars['_attributes']:
-            if var in data_dict:
-                setattr(ncfile, var, data_dict[var])
-    
-    accept_vars = template_vars['_variables']
-    # List all possible variable attributes in the template
-    possible_var_attr = ['standard_name', 'long_name', 'coordinates', 'flag_values', 'flag_meanings', 'description',
-                         'notes', 'positive', 'valid_min', 'valid_max', 'calendar', 'description', 'cf_role',
-                         'missing_value', 'topology_dimension', 'node_coordinates', "face_node_connectivity",
-                         "face_node_connectivity", "face_dimension", "start_index"]
+    for var in template_vars.dataAttributes:
+        if var in data_dict:
+            setattr(ncfile, var, data_dict[var])
     
     # Write variables to file
-    for var in accept_vars:  # only write variables that were loaded from [_variables] attribute in .yaml file
+    for varPlan in template_vars.variables:  # only write variables that were loaded from [_variables] in .yaml file
+        var = varPlan.key
         if var in data_dict:
             try:
-                if "fill_value" in template_vars[var] and "least_significant_digit" in template_vars[var]:
-                    if 'comp_level' not in template_vars[var]:  # set default
-                        template_vars[var]['comp_level'] = 6  # set above default 4 level by package
-                    new_var = ncfile.createVariable(template_vars[var]["name"],
-                                                    template_vars[var]["data_type"],
-                                                    template_vars[var]["dim"],
-                                                    fill_value=template_vars[var]["fill_value"],
-                                                    least_significant_digit=template_vars[var][
-                                                        'least_significant_digit'],
-                                                    zlib=True,
-                                                    complevel=template_vars[var]['comp_level'])
-                elif "fill_value" in template_vars[var]:
-                    new_var = ncfile.createVariable(template_vars[var]["name"], template_vars[var]["data_type"],
-                                                    template_vars[var]["dim"],
-                                                    fill_value=template_vars[var]["fill_value"])
-                else:
-                    new_var = ncfile.createVariable(template_vars[var]["name"],
-                                                    template_vars[var]["data_type"],
-                                                    template_vars[var]["dim"])
-                
-                new_var.units = template_vars[var]["units"]
-                
+                new_var = ncfile.createVariable(varPlan.name, varPlan.dataType, varPlan.dims,
+                                                **variableKwargs(ncfile, varPlan))
+                if 'units' not in varPlan.attributes:
+                    raise KeyError('units')
                 # Write the attributes
-                for attr in template_vars[var]:  # possible_var_attr:  # only write attributes listed in this list above
-                    if attr in template_vars[var] and attr != 'name':
-                        if template_vars[var][attr] == 'NaN':
-                            setattr(new_var, attr, np.nan)
-                        else:
-                            setattr(new_var, attr, template_vars[var][attr])
-                # Write the short_name attribute as the variable name
-                if 'short_name' in template_vars[var]:
-                    new_var.short_name = template_vars[var]["short_name"]
-                else:
-                    new_var.short_name = template_vars[var]["name"]
+                new_var.setncatts(varPlan.attributes)
                 # _____________________________________________________________________________________
                 # Write the data (1D, 2D, or 3D)
                 # ______________________________________________________________________________________
@@ -325,16 +735,16 @@ def write_data_to_nc(ncfile, template_vars, data_dict):
                     data = np.empty((1,), 'S' + repr(len(station_id)))
                     data[0] = station_id
                     new_var[:] = nc.stringtochar(data)
-                elif len(template_vars[var]["dim"]) == 0:
+                elif len(varPlan.dims) == 0:
                     try:
                         new_var[:] = data_dict[var]
                     except Exception as e:
                         new_var = data_dict[var]
                 
-                elif len(template_vars[var]["dim"]) == 1:
+                elif len(varPlan.dims) == 1:
                     # catch some possible errors for frequency and direction arrays
-                    if template_vars[var]["data_type"] == 'str':
-                        for i, c in enumerate(template_vars[var]["data_type"]):
+                    if varPlan.dataType == 'str':
+                        for i, c in enumerate(varPlan.dataType):
                             new_var[i] = data_dict[var][i]
                     else:
                         try:
@@ -345,34 +755,27 @@ def write_data_to_nc(ncfile, template_vars, data_dict):
                             except Exception:
                                 raise e
                 
-                elif len(template_vars[var]["dim"]) == 2:
-                    # create an empty 2d data set of the correct sizes
-                    try:
-                        # handles row vs col data, rather than transposing the array just figure out which it is
-                        length = data_dict[var][0].shape[1]
-                        if data_dict[var][0].shape[0] > length:
-                            length = data_dict[var][0].shape[0]
-                        
-                        x = np.empty([data_dict[var].shape[0], length], dtype=np.float64)
-                        for i in range(data_dict[var].shape[0]):
-                            # squeeze the 3d array in to 2d as dimension is not needed
-                            x[i] = np.squeeze(data_dict[var][i])
-                        new_var[:, :] = x
-                    except Exception as e:
+                elif len(varPlan.dims) == 2:
+                    data = np.asarray(data_dict[var])
+                    if data.dtype.kind in 'biuf':
+                        if data.ndim == 3 and 1 in data.shape[1:]:
+                            # squeeze the 3d array in to 2d as dimension is not needed (a view, not a copy)
+                            data = data.reshape(data.shape[0], -1)
+                        new_var[:, :] = asVariableType(data, new_var)
+                    elif isinstance(data_dict[var], str) and new_var.dtype == np.dtype('S1'):
+                        # a string into a (time, string length) char array, one character per element
+                        new_var[:] = _stringToChar(data_dict[var], new_var.shape[-1])[np.newaxis]
+                    else:
                         # if the tuple fails must be right...right?
                         new_var[:] = data_dict[var]
-                
-                elif len(template_vars[var]["dim"]) == 3:
-                    # create an empty 3d data set of the correct sizes
+
+                elif len(varPlan.dims) == 3:
                     # this portion was modified by Spicer Bak
                     assert data_dict[
                                var].shape == new_var.shape, 'The data must have the Same Dimensions  (missing time?)'
-                    x = np.empty([data_dict[var].shape[0], data_dict[var].shape[1], data_dict[var].shape[2]],
-                                 np.float64)
-                    for i in range(data_dict[var].shape[0]):
-                        x[i] = data_dict[var][i]
-                    new_var[:, :, :] = x[:, :, :]
-            
+                    for i in range(data_dict[var].shape[0]):  # written a time step (hyperslab) at a time
+                        new_var[i] = asVariableType(data_dict[var][i], new_var)
+
             except Exception as e:
                 num_errors += 1
                 print(('ERROR WRITING VARIABLE: {} - {} \n'.format(var, str(e))))
@@ -0,0 +1,168 @@
+"""
+Writes the gridded survey products to a Zarr store, driven by the same yaml templates as py2netCDF.
+
+A store holds many surveys stacked along time, each variable a chunked, compressed array, so a read of a small spatial
+window across many surveys only decompresses the chunks it touches and any number of processes can read the store at
+once (there is no HDF5 file lock).  The variable yaml layout keys (see py2netCDF.compileWritePlan) set the chunks and
+compression of each array
+    chunksizes: chunk length along each dimension (clipped to the dimension length, 1 survey per chunk along time)
+    complevel, shuffle: blosc zstd compression level and byte shuffle
+    contiguous: one uncompressed chunk
+arrays without layout keys get the zarr default compression, one chunk per survey (timeChunk surveys per chunk for
+variables only along time).  Arrays carry their dimension names, so xarray.open_zarr reads the store as it reads the
+netCDF files.
+
+zarr (version 3) is only needed to write or read stores, the rest of the package works without it.
+"""
+import os
+import shutil
+import time as ttime
+import numpy as np
+import py2netCDF as p2nc
+try:
+    import zarr
+    from zarr.codecs import BloscCodec
+except ImportError:  # optional, only needed for zarr output
+    zarr = None
+
+timeChunk = 1024  # surveys per chunk of the variables that are only along time (time, surveyNumber, ...)
+
+
+def makezarr_generic(store, globalYaml, varYaml, data, unlimitedDim='time'):
+    """Appends one survey to a zarr store, creating the store with the first survey.
+
+    The first survey creates every numeric variable of the yaml found in data.  After that only the variables along
+    unlimitedDim are written, at the new time index; the shared coordinates (xFRF, yFRF, latitude, longitude) are
+    checked against the store and not rewritten, a survey on a different grid raises a ValueError.  As for
+    py2netCDF.appendnc_generic, a survey whose time is already in the store replaces that time step and one older
+    than the last time step raises a ValueError.  Variables that are not numeric (eg. the project char array) are
+    not written.
+
+    Every value is converted before the store is touched and time is extended last, so an append that fails part way
+    leaves time at the surveys fully written and the next append overwrites the partial time step.  Only one process
+    may write to a store at a time, any number may read it.
+
+    Args:
+        store: zarr store directory on the local file system
+        globalYaml: global meta data yaml file
+        varYaml: variable meta data yaml file
+        data: dictionary of the survey data (as for py2netCDF.makenc_generic)
+        unlimitedDim: dimension the surveys are stacked along (default='time')
+
+    Returns:
+        index of the time step written
+
+    """
+    if zarr is None:
+        raise ImportError('zarr output needs the zarr package (pip install zarr)')
+    writePlan = p2nc.getWritePlan(globalYaml, varYaml)
+    variables = [varPlan for varPlan in writePlan.variables if varPlan.key in data and _isNumeric(varPlan.dataType)]
+    if not os.path.isdir(store):
+        root = zarr.open_group(store, mode='w')
+        try:
+            root.attrs.update(_jsonable(dict(writePlan.globalAttributes)))
+            root.attrs['date_created'] = ttime.strftime("%Y-%m-%d")
+            for varPlan in writePlan.variables:
+                if varPlan in variables:
+                    _createArray(root, varPlan, data, unlimitedDim)
+                elif varPlan.key in data:
+                    print('  <II> {} is not numeric, not written to {}'.format(varPlan.key, store))
+        except Exception:  # do not leave a half made store behind, the next survey would append to it
+            shutil.rmtree(store, ignore_errors=True)
+            raise
+        index = 0
+    else:
+        root = zarr.open_group(store, mode='r+')
+        index = _appendIndex(root, variables, data, unlimitedDim)
+
+    # convert every value before anything is written, then write the data arrays and time last (see above)
+    values = []
+    for varPlan in variables:
+        if unlimitedDim not in varPlan.dims:
+            continue  # shared coordinates, written when the store was created
+        array = root[varPlan.name]
+        axis = varPlan.dims.index(unlimitedDim)
+        values.append((varPlan, array, axis, np.reshape(np.asarray(data[varPlan.key], dtype=array.dtype),
+                                                        array.shape[:axis] + array.shape[axis + 1:])))
+    values.sort(key=lambda value: value[0].name == unlimitedDim)
+    for varPlan, array, axis, value in values:
+        if index >= array.shape[axis]:
+            shape = list(array.shape)
+            shape[axis] = index + 1
+            array.resize(tuple(shape))
+        array[tuple(index if dd == axis else slice(None) for dd in range(len(varPlan.dims)))] = value
+    root.attrs['date_issued'] = ttime.strftime("%Y-%m-%d")
+
+    return index
+
+
+def _createArray(root, varPlan, data, unlimitedDim):
+    """creates the array of a compiled variable, empty along unlimitedDim, holding the data of the other variables"""
+    values = np.asarray(data[varPlan.key])
+    shape = [len(np.atleast_1d(data[dim])) if dim in data else 1 for dim in varPlan.dims]
+    if unlimitedDim in varPlan.dims:
+        shape[varPlan.dims.index(unlimitedDim)] = 0
+    kwargs = dict(varPlan.createKwargs)
+    chunks = [chunk if chunk is None or dim == unlimitedDim else max(1, min(chunk, length))
+              for dim, chunk, length in zip(varPlan.dims, kwargs.get('chunksizes', [None] * len(shape)), shape)]
+    for dd, dim in enumerate(varPlan.dims):
+        if chunks[dd] is None:
+            chunks[dd] = (timeChunk if len(varPlan.dims) == 1 else 1) if dim == unlimitedDim else max(1, shape[dd])
+    if kwargs.get('contiguous', False):
+        chunks, compressors = [max(1, length) for length in shape], None
+    elif 'complevel' in kwargs or 'shuffle' in kwargs:
+        compressors = BloscCodec(cname='zstd', clevel=int(kwargs.get('complevel', 4)),
+                                 shuffle='shuffle' if kwargs.get('shuffle', False) else 'noshuffle')
+    else:
+        compressors = 'auto'
+    fillValue = kwargs.get('fill_value', None)
+    if fillValue is not None and not p2nc._fitsType(fillValue, varPlan.dataType):
+        print('<<WARNING>> fill_value {} does not fit {} {}, no fill value'.format(fillValue, varPlan.key,
+                                                                                 varPlan.dataType))
+        fillValue = None
+    elif fillValue is not None:
+        fillValue = np.array(fillValue).astype(varPlan.dataType).item()  # yaml fill values may be strings
+    array = root.create_array(varPlan.name, shape=tuple(shape), chunks=tuple(chunks), dtype=varPlan.dataType,
+                              fill_value=fillValue, compressors=compressors, dimension_names=varPlan.dims,
+                              attributes=_jsonable({key: value for key, value in varPlan.attributes.items()}))
+    if unlimitedDim not in varPlan.dims:
+        array[...] = values.reshape(array.shape)
+    return array
+
+
+def _appendIndex(root, variables, data, unlimitedDim):
+    """checks the survey fits the store and returns the time index it is written to"""
+    for varPlan in variables:  # the shared coordinates have to match the store
+        if unlimitedDim not in varPlan.dims and varPlan.name in root:
+            storeCoordinate, coordinate = root[varPlan.name][...], np.asarray(data[varPlan.key])
+            if storeCoordinate.size != coordinate.size or not np.allclose(storeCoordinate.ravel(), coordinate.ravel()):
+                raise ValueError('{} of the survey does not match the store {}'.format(varPlan.key, root.store))
+    times = root[unlimitedDim][...]
+    time = float(np.squeeze(data[unlimitedDim]))
+    if np.isin(time, times):
+        print('  <II> replacing time step {} of {}'.format(time, root.store))
+        return int(np.flatnonzero(times == time)[0])
+    if times.size > 0 and time < times.max():
+        raise ValueError('survey time {} is older than the last time step of {}, rebuild the store in time '
+                         'order'.format(time, root.store))
+    return times.size
+
+
+def _isNumeric(dataType):
+    try:
+        return np.dtype(dataType).kind in 'biuf'
+    except TypeError:
+        return False
+
+
+def _jsonable(value):
+    """yaml attribute values as json (numpy scalars to python, tuples to lists, NaN to 'NaN')"""
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return 'NaN'
+    return value
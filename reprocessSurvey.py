@@ -1,29 +1,214 @@
-g# -*- coding: utf-8 -*-
+# -*- coding: utf-8 -*-
 """
 Created on Wed Jan  8 16:30:08 2020
 
+Incremental reprocessing of the survey archive to netCDF.
+
+A manifest (JSON) records, for every input file, the hash of its contents, the hashes of the YAML templates it was
+written with, the version of the conversion code and the netCDF file it made.  A run only converts the files whose
+contents, templates or code changed since they were last converted (or whose output is gone), and the manifest is
+checkpointed after every file so an interrupted run picks up where it stopped.
+
+can be run from terminal
+    python reprocessSurvey.py [--jobs=N] [--manifest=file] [--out=dir] [--index=file] [--rehash] [--retry-errors]
+                              [--dry-run] [archive glob ...]
+
 @author: sb
 """
-import glob, os
-from surveyToNetCDF import convertText2NetCDF
+import sys, getopt, os, glob
+import json
+import hashlib
 import datetime as DT
+import batchConvert
+import surveyToNetCDF
+from checksums import fileHash
+
 # location to look for files
 surveyArchiveLocation = "/mnt/gaia/Survey/DATA/archive/"
 #prefix for file output name
 surveyOutPrefix = "/data/fdif/FRF/survey/gridded"
 surveyOutPrefix = '.'
-raise NotImplementedError, "need to check how to handle versions"
-# find list of files to re-rpocess
-flist = sorted(glob.glob(surveyArchiveLocation+'*.csv'))
-# loop through each file in a list
-for f in flist:
-    #extension = f.split('.')[-1]   # keep file extension
+manifestVersion = 1
+# modules whose source makes up the conversion code version (those that shape what the products hold)
+codeModules = ['surveyToNetCDF', 'sblib', 'survey_SortTime', 'makenc', 'py2netCDF', 'geoprocess', 'gridTemplate',
+               'py2zarr', 'surveyIndex']
+# yaml templates each kind of file is written with
+templateYamls = {'transect': [surveyToNetCDF.transectGlobalYaml, surveyToNetCDF.transectVarYaml],
+                 'grid': [surveyToNetCDF.gridGlobalYaml, surveyToNetCDF.gridVarYaml]}
+
+
+def codeVersion():
+    """Version of the conversion code, a hash over the source of every module in codeModules.
+
+    Returns:
+        sha256 hex digest (any edit to the conversion code changes it)
+
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for module in codeModules:
+        digest.update(module.encode())
+        digest.update(fileHash(os.path.join(here, module + '.py')).encode())
+    return digest.hexdigest()
+
+
+def loadManifest(manifestFile):
+    """Loads the reprocessing manifest, an empty one if it does not exist yet.
+
+    Args:
+        manifestFile: manifest file name
+
+    Returns:
+        dictionary with 'version' and 'files' (input file name: entry, see reprocessArchive)
+
+    """
+    if not os.path.isfile(manifestFile):
+        return {'version': manifestVersion, 'files': {}}
+    with open(manifestFile) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != manifestVersion:
+        print('<<WARNING>> manifest {} is version {}, starting a new one'.format(manifestFile, manifest.get('version')))
+        return {'version': manifestVersion, 'files': {}}
+    return manifest
+
+
+def saveManifest(manifest, manifestFile):
+    """writes the manifest to a temporary file then renames it into place, so a crash never leaves it half written"""
+    tmpFile = manifestFile + '.tmp'
+    with open(tmpFile, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpFile, manifestFile)
+
+
+def fileState(fname, entry=None, rehash=False):
+    """Identifies the current contents of an input file.
+
+    The content hash of the manifest entry is reused when the file size and modification time are unchanged, so an
+    unchanged archive is checked without reading it.
+
+    Args:
+        fname: input file name
+        entry: manifest entry of the last conversion of fname (default=None)
+        rehash: always hash the contents (default=False)
+
+    Returns:
+        dictionary with 'size', 'mtime' and 'inputHash'
+
+    """
+    stat = os.stat(fname)
+    state = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if not rehash and entry is not None and entry.get('size') == state['size'] and entry.get('mtime') == state['mtime']:
+        state['inputHash'] = entry['inputHash']
+    else:
+        state['inputHash'] = fileHash(fname)
+    return state
+
+
+def needsConversion(entry, state, yamlHashes, version, retryErrors=False):
+    """Decides if a file has to be (re)converted.
+
+    Args:
+        entry: manifest entry of the last conversion (None if never converted)
+        state: current file state, see fileState
+        yamlHashes: current hashes of the yaml templates for this kind of file
+        version: current code version
+        retryErrors: convert files that failed last time even if nothing changed (default=False)
+
+    Returns:
+        reason string if the file has to be converted, None if it is up to date
+
+    """
+    if entry is None:
+        return 'new'
+    if entry['inputHash'] != state['inputHash']:
+        return 'input changed'
+    if entry['yamlHashes'] != yamlHashes:
+        return 'templates changed'
+    if entry['codeVersion'] != version:
+        return 'code changed'
+    if entry['status'] != 'ok':
+        return 'retry' if retryErrors else None
+    if entry['output'] is None or not os.path.isfile(entry['output']):
+        return 'output missing'
+    return None
+
+
+def reprocessArchive(fileList, manifestFile, outDir=surveyOutPrefix, jobs=1, **kwargs):
+    """Converts the files of the archive that changed since the last run, checkpointing the manifest after each file.
+
+    Args:
+        fileList: list of archive transect (.csv) and grid (.txt) files
+        manifestFile: manifest file name (created if it does not exist)
+        outDir: directory for the netCDF files (default=surveyOutPrefix)
+        jobs: number of worker processes (default=1, None uses every core)
+
+    Keyword Args:
+        'rehash': hash every input instead of trusting unchanged size and modification time (default=False)
+        'retryErrors': convert files that failed last time even if nothing changed (default=False)
+        'dryRun': only report what would be converted (default=False)
+        'logFile': JSON lines log of the conversions (default=None)
+        'indexFile': inventory index updated with every file written (default=None, no index), see surveyIndex
+
+    Returns:
+        list of records of the files converted (see batchConvert.convertFile)
+
+    """
+    fileList = [os.path.abspath(fname) for fname in fileList]  # manifest is keyed on absolute path
+    manifest = loadManifest(manifestFile)
+    version = codeVersion()
+    yamlHashes = {kind: [fileHash(yaml) for yaml in yamls] for kind, yamls in templateYamls.items()}
+
+    todo, states = [], {}
+    for fname in fileList:
+        kind = batchConvert.fileKind(fname)
+        if kind is None:
+            continue
+        entry = manifest['files'].get(fname)
+        states[fname] = fileState(fname, entry, rehash=kwargs.get('rehash', False))
+        reason = needsConversion(entry, states[fname], yamlHashes[kind], version, kwargs.get('retryErrors', False))
+        if reason is not None:
+            todo.append(fname)
+            print('  <II> {} ({})'.format(fname, reason))
+    print('%d of %d file(s) need converting' % (len(todo), len(states)))
+    if kwargs.get('dryRun', False) or len(todo) == 0:
+        return []
+
     # generate new file version number
-    newVnum = '_v'+DT.datetime.today().strftime("%Y%m%d")+'.nc'
-    # generate base files name
-    filenameBase = "_".join(os.path.basename(flist[0]).split('_')[:-1])+newVnum
-    # generate output filename and path
-    outFname = os.path.join(surveyOutPrefix, filenameBase )
-    # reprocess
+    newVnum = '_v' + DT.datetime.today().strftime("%Y%m%d") + '.nc'
+
+    def _checkpoint(record):
+        fname = record['file']
+        entry = dict(states[fname])
+        entry.update({'kind': record['kind'], 'yamlHashes': yamlHashes[record['kind']], 'codeVersion': version,
+                      'output': os.path.abspath(record['output']) if record['output'] else None,
+                      'status': record['status'], 'error': record['error'], 'converted': record['started']})
+        manifest['files'][fname] = entry
+        saveManifest(manifest, manifestFile)
+
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+    return batchConvert.runBatch(todo, jobs=jobs, logFile=kwargs.get('logFile', None), callback=_checkpoint,
+                                 transectOptions={'ofname': '{stem}' + newVnum, 'outDir': outDir,
+                                                  'indexFile': kwargs.get('indexFile', None)},
+                                 gridOptions={'ofname': '{stem}' + newVnum, 'outDir': outDir,
+                                              'indexFile': kwargs.get('indexFile', None)})
 
 
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "hj:", ["help", "jobs=", "manifest=", "out=", "log=", "index=",
+                                                      "rehash", "retry-errors", "dry-run"])
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts:
+        print(__doc__)
+        sys.exit(0)
+    # find list of files to re-process
+    if len(args) == 0:
+        args = [surveyArchiveLocation + '*.csv']
+    flist = sorted(set(f for arg in args for f in glob.glob(arg)))
+    outDir = opts.get('--out', surveyOutPrefix)
+    reprocessArchive(flist, opts.get('--manifest', os.path.join(outDir, 'reprocessManifest.json')), outDir=outDir,
+                     jobs=int(opts.get('--jobs', opts.get('-j', 1))), logFile=opts.get('--log', None),
+                     indexFile=opts.get('--index', None),
+                     rehash='--rehash' in opts, retryErrors='--retry-errors' in opts, dryRun='--dry-run' in opts)
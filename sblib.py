@@ -12,7 +12,6 @@ this folder needs to be added to sys.path to use
 import numpy as np
 import datetime as DT
 
-import csv
 from matplotlib import colors as mc
 from matplotlib import pyplot as plt
 
@@ -778,62 +777,64 @@ def createDateList(start, end, delta):
         curr += delta
 
 
-def importFRFgrid(fname_in):
+def importFRFgrid(fname_in, dtype=np.float64, memoryMap=False):
     '''
     This function imports a file comma seperated and returns a dictionary with keys x, y, z
-    the file to be imported must be x y z order
-    :param file:
-    :param save: default false, will display, if true provide args
-    :return: dictionary of frf grid x, y, z values
-    '''
-    import csv
-    # import file with given path above
+    the file to be imported must be x y z order (3 columns) or lon lat z x y order (5 columns), optionally with a
+    point count on the first line
+
+    the format is detected once from the first lines then the whole file is parsed in one pass by the pandas C parser
+    straight into numpy arrays
 
-    raw_x, raw_y = [], []
-    ptCt, raw_z = [], []
-    raw_lon, raw_lat = [], []
+    :param fname_in: grid text file name
+    :param dtype: numpy float type of the output arrays, np.float32 halves the memory (default np.float64)
+    :param memoryMap: memory map the file for reading instead of buffered reads (default False)
+    :return: dictionary of frf grid values as numpy arrays
+            'raw_x', 'raw_y', 'raw_z', 'raw_lon', 'raw_lat' (lon/lat are empty for 3 column files)
+    '''
+    import pandas as pd
+    # detect format from the first lines: blank lines and a single column point count are skipped
+    skipRows, nColumns = 0, None
     with open(fname_in, 'r') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if len(row) == 1:
-                ptCt = row[0]
-            elif len(row) == 3:
-                raw_x.append(row[0])  # x in string format
-                raw_y.append(row[1])  # y in string format
-                raw_z.append(row[2])  # z in string format
-            elif len(row) == 5:
-                raw_lon.append(float(row[0]))
-                raw_lat.append(float(row[1]))
-                raw_z.append(float(row[2]))  # z in string format
-                raw_x.append(float(row[3]))  # x in string format
-                raw_y.append(float(row[4]))  # y in string format
-            elif len(row) == 0:
-                continue
+        for line in f:
+            nFields = len(line.split(',')) if line.strip() else 0
+            if nFields in [0, 1]:
+                skipRows += 1
             else:
-                raise ImportError('File format not understood')
-
-    # initializing values to make strictly numbers, imported as strings
-    # num_x = np.zeros(len(raw_x))
-    # num_y = np.zeros(len(raw_y))
-    # num_z = np.zeros(len(raw_z))
-    # # making strings into floating point numbers
-    # for ii in range(0, len(raw_x)):
-    #     num_x[ii] = float(raw_x[ii])
-    #     num_y[ii] = float(raw_y[ii])
-    #     num_z[ii] = float(raw_z[ii])
-    # gridding
-
-
-    # format dictionary for output
-    out = {'raw_x': raw_x,
-           'raw_y': raw_y,
-           'raw_z': raw_z,
-           'raw_lon': raw_lon,
-           'raw_lat': raw_lat
-           }
+                nColumns = nFields
+                break
+    if nColumns is None:  # empty file or count only
+        empty = np.array([], dtype=dtype)
+        return {'raw_x': empty, 'raw_y': empty, 'raw_z': empty, 'raw_lon': empty, 'raw_lat': empty}
+    if nColumns not in [3, 5]:
+        raise ImportError('File format not understood')
+
+    try:
+        data = pd.read_csv(fname_in, header=None, skiprows=skipRows, dtype=dtype, engine='c',
+                           memory_map=memoryMap).to_numpy()
+    except (pd.errors.ParserError, ValueError) as e:
+        raise ImportError('File format not understood: {}'.format(e))
+    if data.shape[1] != nColumns:
+        raise ImportError('File format not understood')
+
+    # columns of the parsed block are contiguous views, no copies are made here
+    if nColumns == 3:
+        out = {'raw_x': data[:, 0],
+               'raw_y': data[:, 1],
+               'raw_z': data[:, 2],
+               'raw_lon': np.array([], dtype=dtype),
+               'raw_lat': np.array([], dtype=dtype)
+               }
+    else:
+        out = {'raw_lon': data[:, 0],
+               'raw_lat': data[:, 1],
+               'raw_z': data[:, 2],
+               'raw_x': data[:, 3],
+               'raw_y': data[:, 4]
+               }
     return out
 
-def import_FRF_Transect(fname):
+def import_FRF_Transect(fname, surveyFrame=None):
     """
     This function import a FRF transect csv file
     Comma Separated Value (CSV) ASCII data.  Column Header (not included in the file):
@@ -867,42 +868,47 @@ def import_FRF_Transect(fname):
         6) Vessel used (LARC)
         7) Survey Instrument (GPS)
 
+    All columns are parsed in one pass by the pandas C parser, date and time are converted to datetime64 in one
+    vectorized operation and rows that do not parse (bad numbers or date/time) are removed with a single boolean mask.
+
     :param fname: name/location of a FRF measured bathymetry transect file
+    :param surveyFrame: survey table already parsed in memory with its columns in file order (eg. returned by
+            survey_SortTime.surveySortTime), when given the file is not read again and fname only supplies the
+            file name fields (default None)
     :return: dictionary of all fields
     )
     """
-    import pytz
-    c0, c1, c2, c3, c4, c5, c6, c7, c8, c9, c10, c11, c12, c13 = [], [], [], [], [], [], [], [], [], [], [], [], [], []
-    with open(fname, 'r') as csvfile:  # opening the file
-        reader = csv.reader(csvfile, delimiter=',')  # reading the lines
-        for row in reader:
-            c0.append(str(row[0]))  # Locality Code
-            c1.append(int(row[1]))  # Profile number
-            c2.append(int(row[2]))  # survey number
-            c3.append(float(row[3]))  # Latitude
-            c4.append(float(row[4]))  # Longitude
-            c5.append(float(row[5]))  # Northing
-            c6.append(float(row[6]))  # Easting
-            c7.append(float(row[7]))  # FRF xshore
-            c8.append(float(row[8]))  # FRF Long shore
-            c9.append(float(row[9]))  # Elevation (NAVD88)
-            c10.append(float(row[10]))  # Ellipsoid
-            c11.append(row[11])  # YYMMDD
-            c12.append(row[12])  # hhmmss
-            #    c13.append(row[13])   seconds past midnight
-    # convert EST to UTC
-
-    date,time = [], []
-    for ii in range(0, len(c12)):
-        #print(ii, ''.join([c11[ii], c12[ii]]))
-        try:  # data are in UTC already
-            time.append(DT.datetime.strptime(''.join([c11[ii], c12[ii]]), 
-                                '%Y%m%d%H%M%S.%f'))
-            date.append(time[-1].date())
-        except(ValueError):
-            del c0[ii], c1[ii], c2[ii], c3[ii], c4[ii],c5[ii], c6[ii],c7[ii]
-            del c8[ii], c9[ii], c10[ii]
-            pass  # date doesn't convert properly (bad datapoint)
+    import pandas as pd
+    intColumns = [1, 2]  # Profile number, survey number
+    floatColumns = [3, 4, 5, 6, 7, 8, 9, 10]  # Latitude, Longitude, Northing, Easting, FRF x/y, Elevation, Ellipsoid
+    if surveyFrame is None:
+        df = pd.read_csv(fname, header=None, usecols=list(range(13)), dtype={0: str, 11: str, 12: str}, engine='c')
+    else:
+        df = surveyFrame.iloc[:, :13].copy()
+        df.columns = list(range(13))
+        for col in [0, 11, 12]:  # text columns as they would be read from the file
+            df[col] = df[col].astype(str)
+    # bad rows are collected in one mask instead of deleted from each column in a loop
+    bad = np.zeros(len(df), dtype=bool)
+    for col in intColumns + floatColumns:
+        if not pd.api.types.is_numeric_dtype(df[col]):  # something in this column was not a number
+            values = pd.to_numeric(df[col], errors='coerce')
+            bad |= (values.isna() & df[col].notna()).to_numpy()
+            df[col] = values
+    for col in intColumns:
+        bad |= df[col].isna().to_numpy()
+    # date/time are already in UTC (YYYYMMDD, hhmmss.ffffff), the dates repeat so their parse is cached, the times
+    # are split into hours, minutes and seconds arithmetically
+    days = pd.to_datetime(df[11], format='%Y%m%d', errors='coerce').to_numpy()
+    hhmmss = pd.to_numeric(df[12], errors='coerce').to_numpy()
+    hours, minutes, seconds = hhmmss // 10000, (hhmmss // 100) % 100, hhmmss % 100
+    bad |= np.isnat(days) | ~df[12].str.contains('.', regex=False, na=False).to_numpy()
+    bad |= ~((hours >= 0) & (hours < 24) & (minutes < 60) & (seconds < 60))  # also catches NaN
+    microseconds = np.round((hours * 3600 + minutes * 60 + seconds) * 1e6)
+    times = days + np.where(bad, 0, microseconds).astype('timedelta64[us]')
+    good = ~bad
+    times = times[good]
+
     # now make survey platform decision
     if fname.split('_')[-4] == 'LARC':
         Collection_Platform = 1
@@ -916,19 +922,19 @@ def import_FRF_Transect(fname):
         Collection_Platform = 5
     
     bathyDict = {'Collection_Platform': Collection_Platform,
-                 'Locality_Code': np.array(c0),
-                 'Profile_number': np.array(c1),
-                 'Survey_number': np.array(c2),
-                 'Latitude': np.array(c3),
-                 'Longitude': np.array(c4),
-                 'Northing': np.array(c5),
-                 'Easting': np.array(c6),
-                 'xFRF': np.array(c7),
-                 'yFRF': np.array(c8),
-                 'Elevation': np.array(c9),
-                 'Ellipsoid': np.array(c10),
-                 'time': np.array(time), #  datetime object
-                 'date': np.array(date),
+                 'Locality_Code': df[0].to_numpy(dtype=str)[good],
+                 'Profile_number': df[1].to_numpy()[good].astype(int),
+                 'Survey_number': df[2].to_numpy()[good].astype(int),
+                 'Latitude': df[3].to_numpy(dtype=float)[good],
+                 'Longitude': df[4].to_numpy(dtype=float)[good],
+                 'Northing': df[5].to_numpy(dtype=float)[good],
+                 'Easting': df[6].to_numpy(dtype=float)[good],
+                 'xFRF': df[7].to_numpy(dtype=float)[good],
+                 'yFRF': df[8].to_numpy(dtype=float)[good],
+                 'Elevation': df[9].to_numpy(dtype=float)[good],
+                 'Ellipsoid': df[10].to_numpy(dtype=float)[good],
+                 'time': times.astype('datetime64[us]').astype(object),  # datetime object
+                 'date': times.astype('datetime64[D]').astype(object),  # date object
                  'meta': 'date and Time has been converted to a UTC datetimeta object, elevation is in NAVD88',
                  }
     return bathyDict
@@ -0,0 +1,190 @@
+"""Per stage timing and throughput records for the survey conversion pipeline.
+
+Each conversion stage (sorting, parsing, template placement, netCDF writing) is wrapped in stage(), which records wall
+time, points per second, bytes read and written and the peak memory of the process.  Records are kept in this process
+until collectStages() hands them over, and can be written as JSON lines (writeStageLog) or summarised in a Prometheus
+textfile (writePrometheus) for the node exporter on the batch node.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import datetime as DT
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:  # not available on windows, peak memory is then not recorded
+    resource = None
+
+stageRecords = []  # records of the stages run in this process since the last collectStages()
+_recordsLock = threading.Lock()  # stages may run on several threads (see batchConvert pipelined mode)
+
+
+def peakMemory():
+    """Peak resident memory of this process so far.
+
+    Returns:
+        bytes, None where the resource module is not available
+
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # bytes on mac, kilobytes on linux
+
+
+@contextmanager
+def stage(name, fname=None, points=None, inFile=None, outFile=None):
+    """Times a conversion stage and records its throughput.
+
+    The record is yielded so the stage can fill in what it only knows at the end, eg. record['points'] = len(x).
+    Bytes read and written are the sizes of inFile and outFile once the stage finishes.
+
+    Args:
+        name: stage name
+        fname: survey file the stage works on (default=None)
+        points: number of survey points (default=None)
+        inFile: file read by the stage (default=None)
+        outFile: file written by the stage (default=None)
+
+    Yields:
+        record dictionary
+            'stage', 'file', 'started': stage name, survey file, ISO start time
+
+            'seconds': wall time
+
+            'points', 'pointsPerSecond': survey points and throughput (None if points is not known)
+
+            'bytesRead', 'bytesWritten': sizes of inFile and outFile
+
+            'peakMemory': peak resident memory of the process at the end of the stage (bytes)
+
+            'memoryGrowth': how much the stage raised that peak (bytes)
+
+            'status': 'ok' or the error the stage raised
+
+    """
+    record = {'stage': name, 'file': fname, 'started': DT.datetime.now().isoformat(), 'seconds': None,
+              'points': points, 'pointsPerSecond': None, 'bytesRead': None, 'bytesWritten': None, 'peakMemory': None,
+              'memoryGrowth': None, 'status': 'ok', 'pid': os.getpid()}
+    peakBefore = peakMemory()
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record['status'] = '{}: {}'.format(type(e).__name__, e)
+        raise
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        if record['points'] is not None and record['seconds'] > 0:
+            record['pointsPerSecond'] = record['points'] / record['seconds']
+        if inFile is not None and os.path.isfile(inFile):
+            record['bytesRead'] = os.path.getsize(inFile)
+        if outFile is not None and os.path.isfile(outFile):
+            record['bytesWritten'] = os.path.getsize(outFile)
+        record['peakMemory'] = peakMemory()
+        if peakBefore is not None:
+            record['memoryGrowth'] = record['peakMemory'] - peakBefore
+        with _recordsLock:
+            stageRecords.append(record)
+
+
+def collectStages():
+    """Hands over the stage records of this process and starts a new list.
+
+    Returns:
+        list of stage records (see stage)
+
+    """
+    with _recordsLock:
+        records = list(stageRecords)
+        del stageRecords[:]
+    return records
+
+
+def writeStageLog(records, logFile):
+    """Appends stage records to a JSON lines log, one record per line.
+
+    Args:
+        records: list of stage records
+        logFile: JSON lines file name
+
+    """
+    with open(logFile, 'a') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def stageTotals(records, totals=None):
+    """Adds stage records into running per stage totals.
+
+    Long running processes (ingestDaemon) keep these totals instead of every record, so memory and the cost of
+    writing the metrics stay the same however many files were converted.
+
+    Args:
+        records: list of stage records
+        totals: totals to add to (default=None, new totals), updated in place
+
+    Returns:
+        dictionary of stage name: {'runs', 'errors', 'seconds', 'points', 'bytesRead', 'bytesWritten' (sums),
+        'peakMemory' (largest)}
+
+    """
+    totals = {} if totals is None else totals
+    for record in records:
+        total = totals.setdefault(record['stage'], {'runs': 0, 'errors': 0, 'seconds': 0, 'points': 0,
+                                                    'bytesRead': 0, 'bytesWritten': 0, 'peakMemory': 0})
+        total['runs'] += 1
+        total['errors'] += record['status'] != 'ok'
+        for field in ['seconds', 'points', 'bytesRead', 'bytesWritten']:
+            total[field] += record[field] or 0
+        total['peakMemory'] = max(total['peakMemory'], record['peakMemory'] or 0)
+    return totals
+
+
+def writePrometheus(records, fname, prefix='frf_survey'):
+    """Summarises stage records as Prometheus metrics in a node exporter textfile, see writePrometheusTotals.
+
+    Args:
+        records: list of stage records
+        fname: textfile name (the node exporter reads *.prom)
+        prefix: metric name prefix (default='frf_survey')
+
+    """
+    writePrometheusTotals(stageTotals(records), fname, prefix=prefix)
+
+
+def writePrometheusTotals(totals, fname, prefix='frf_survey'):
+    """Writes per stage totals as Prometheus metrics in a node exporter textfile.
+
+    The file is written to a temporary name and renamed into place so the exporter never reads it half written.
+
+    Args:
+        totals: per stage totals from stageTotals
+        fname: textfile name (the node exporter reads *.prom)
+        prefix: metric name prefix (default='frf_survey')
+
+    """
+    metrics = [('stage_runs_total', 'counter', 'number of times the stage ran', 'runs'),
+               ('stage_errors_total', 'counter', 'number of times the stage failed', 'errors'),
+               ('stage_seconds_total', 'counter', 'wall time spent in the stage', 'seconds'),
+               ('stage_points_total', 'counter', 'survey points through the stage', 'points'),
+               ('stage_bytes_read_total', 'counter', 'bytes read by the stage', 'bytesRead'),
+               ('stage_bytes_written_total', 'counter', 'bytes written by the stage', 'bytesWritten'),
+               ('stage_peak_memory_bytes', 'gauge', 'largest peak resident memory seen at the end of the stage',
+                'peakMemory')]
+    lines = []
+    for metric, metricType, helpText, field in metrics:
+        lines.append('# HELP {}_{} {}'.format(prefix, metric, helpText))
+        lines.append('# TYPE {}_{} {}'.format(prefix, metric, metricType))
+        for name in sorted(totals):
+            lines.append('{}_{}{{stage="{}"}} {:g}'.format(prefix, metric, name, totals[name][field]))
+    lines.append('# HELP {}_last_run_timestamp_seconds unix time the metrics were written'.format(prefix))
+    lines.append('# TYPE {}_last_run_timestamp_seconds gauge'.format(prefix))
+    lines.append('{}_last_run_timestamp_seconds {:f}'.format(prefix, time.time()))
+
+    tmpFile = fname + '.tmp'
+    with open(tmpFile, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmpFile, fname)
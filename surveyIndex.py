@@ -0,0 +1,366 @@
+"""Inventory index (SQLite) of the survey netCDF products.
+
+Every survey in a product gets one row: the file, its time step in the file (grid cubes hold many surveys), survey
+number, time span, xFRF/yFRF extent of the surveyed points, vehicle, instrumentation, version date, point count and a
+checksum of the file.  The writers (surveyToNetCDF, given indexFile) update the index each time they write a file,
+rebuild() scans existing archives on a pool of worker processes, and query() answers survey number, date range and
+area questions from the index without opening any netCDF file.  The writers record the survey file each time step was
+made from in the sourceFiles global attribute of the product (see py2netCDF.recordSource), the vehicle,
+instrumentation and version date of a survey are read from that name when the product does not hold them.
+
+can be run from terminal
+    python surveyIndex.py [--index=file] query [--survey=N] [--start=YYYY-MM-DD] [--end=YYYY-MM-DD]
+                                               [--box=xmin,xmax,ymin,ymax] [--kind=transect|grid] [--vehicle=name]
+    python surveyIndex.py [--index=file] [--jobs=N] [--full] rebuild file_directory_or_glob [...]
+    python surveyIndex.py [--index=file] update file.nc [...]
+"""
+import sys, getopt, os, glob
+import time
+import sqlite3
+import datetime as DT
+import numpy as np
+import netCDF4 as nc
+from concurrent.futures import ProcessPoolExecutor
+import py2netCDF as p2nc
+from checksums import fileHash
+
+defaultIndexFile = 'surveyIndex.sqlite'
+columns = ['path', 'step', 'kind', 'surveyNumber', 'timeStart', 'timeEnd', 'xMin', 'xMax', 'yMin', 'yMax', 'vehicle',
+           'instrumentation', 'versionDate', 'points', 'checksum', 'size', 'mtime', 'indexed']
+# names of the survey vehicle and instrumentation codes of the grid files (see surveyToNetCDF.preprocessGridFile)
+vehicleNames = {0: 'crab', 1: 'larc'}
+instrumentationNames = {0: 'level', 1: 'zeiss', 2: 'geodimeter', 3: 'gps'}
+sourceColumns = ['vehicle', 'instrumentation', 'versionDate']  # columns only known from the survey file name
+
+_schema = """
+create table if not exists surveys (
+    path text not null,             -- absolute netCDF file name
+    step integer not null,          -- time step of the survey in the file (0 unless the file is a cube)
+    kind text,                      -- 'transect' or 'grid'
+    surveyNumber integer,
+    timeStart real,                 -- seconds since 1970-01-01
+    timeEnd real,
+    xMin real, xMax real, yMin real, yMax real,  -- FRF extent of the surveyed points
+    vehicle text,
+    instrumentation text,
+    versionDate real,               -- seconds since 1970-01-01
+    points integer,                 -- surveyed points (grid nodes with data)
+    checksum text,                  -- sha256 of the file
+    size integer, mtime real,       -- of the file when it was indexed
+    indexed text,                   -- ISO time the row was written
+    primary key (path, step));
+create index if not exists surveysByNumber on surveys (surveyNumber);
+create index if not exists surveysByTime on surveys (timeStart, timeEnd);
+create index if not exists surveysByX on surveys (xMin, xMax);
+"""
+
+
+def connect(indexFile=defaultIndexFile):
+    """Opens (creating if needed) the index database.
+
+    Several processes may write the index at once, each write waits for the others (write ahead log).
+
+    Args:
+        indexFile: SQLite index file (default=defaultIndexFile)
+
+    Returns:
+        sqlite3 connection, rows are returned as sqlite3.Row
+
+    """
+    db = sqlite3.connect(indexFile, timeout=60)
+    db.row_factory = sqlite3.Row
+    db.execute('pragma journal_mode=wal')
+    db.executescript(_schema)
+    return db
+
+
+def describeFile(ncFile, sourceFile=None):
+    """Reads the index rows of a survey netCDF file.
+
+    Args:
+        ncFile: transect or grid netCDF file
+        sourceFile: survey file the product was made from, used when the product does not record it (default=None),
+            see py2netCDF.recordSource, the vehicle, instrumentation and version date of transect products are only
+            known from its name (FRF_date_N_FRF_NAVD88_vehicle_instrument_UTC_vDate)
+
+    Returns:
+        list of row dictionaries (see columns), one per survey in the file
+
+    """
+    ncFile = os.path.abspath(ncFile)
+    stat = os.stat(ncFile)
+    common = {'path': ncFile, 'checksum': fileHash(ncFile), 'size': stat.st_size, 'mtime': stat.st_mtime,
+              'indexed': DT.datetime.now().isoformat()}
+    rows = []
+    with nc.Dataset(ncFile) as fid:
+        sourceFiles = p2nc.readSourceFiles(fid)
+        if sourceFile is not None and not any(sourceFiles):  # a product that does not record its sources
+            sourceFiles = [sourceFile] * max(1, len(fid.dimensions['time']))
+        if 'elevation' in fid.variables and fid.variables['elevation'].ndim == 3:  # grid, one survey per time step
+            xFRF, yFRF = fid.variables['xFRF'][:], fid.variables['yFRF'][:]
+            for step in range(len(fid.dimensions['time'])):
+                row = dict(common, step=step, kind='grid', timeStart=_value(fid, 'time', step))
+                row.update(_sourceNameFields(sourceFiles[step] if step < len(sourceFiles) else None))
+                row['timeEnd'] = row['timeStart']
+                row['surveyNumber'] = _value(fid, 'surveyNumber', step, int)
+                versionDate = _value(fid, 'versionDate', step)
+                row['versionDate'] = row.get('versionDate') if versionDate is None else versionDate
+                row['vehicle'] = vehicleNames.get(_value(fid, 'surveyVehicle', step, int), row.get('vehicle'))
+                row['instrumentation'] = instrumentationNames.get(_value(fid, 'surveyInstrumentation', step, int),
+                                                                  row.get('instrumentation'))
+                surveyed = ~np.ma.getmaskarray(fid.variables['elevation'][step])
+                row['points'] = int(surveyed.sum())
+                row.update(_extent(np.ma.masked_array(np.broadcast_to(xFRF, surveyed.shape), ~surveyed),
+                                   np.ma.masked_array(np.broadcast_to(yFRF[:, np.newaxis], surveyed.shape), ~surveyed)))
+                rows.append(row)
+        else:  # transect, one survey
+            times = fid.variables['time'][:]
+            row = dict(common, step=0, kind='transect', points=int(np.ma.count(times)),
+                       timeStart=_float(times.min()), timeEnd=_float(times.max()))
+            row.update(_sourceNameFields(sourceFiles[0] if sourceFiles else None))
+            if 'surveyNumber' in fid.variables:
+                row['surveyNumber'] = _value(fid, 'surveyNumber', 0, int)
+            row.update(_extent(fid.variables['xFRF'][:], fid.variables['yFRF'][:]))
+            rows.append(row)
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+
+def _value(fid, var, index, kind=float):
+    """one value of a variable, None if the variable is missing or the value is fill"""
+    if var not in fid.variables or fid.variables[var].shape[0] <= index:
+        return None
+    value = fid.variables[var][index]
+    return None if np.ma.is_masked(value) else kind(value)
+
+
+def _float(value):
+    return None if np.ma.is_masked(value) else float(value)
+
+
+def _extent(x, y):
+    """FRF extent of the unmasked points"""
+    return {'xMin': _float(x.min()), 'xMax': _float(x.max()), 'yMin': _float(y.min()), 'yMax': _float(y.max())}
+
+
+def _sourceNameFields(sourceFile):
+    """vehicle, instrumentation and version date from a survey file name, see describeFile"""
+    if not sourceFile:
+        return {}
+    split = os.path.splitext(os.path.basename(sourceFile))[0].split('_')
+    fields = {}
+    if len(split) > 6:
+        fields.update({'vehicle': split[5].lower(), 'instrumentation': split[6].lower()})
+    if len(split) > 8 and split[8].startswith('v'):
+        try:
+            fields['versionDate'] = float(nc.date2num(DT.datetime.strptime(split[8][1:9], '%Y%m%d'),
+                                                      'seconds since 1970-01-01'))
+        except ValueError:
+            pass
+    return fields
+
+
+def _keepSourceFields(db, rows):
+    """fills the sourceColumns a row does not know from the row already in the index (written by the writers)"""
+    for row in rows:
+        if all(row[column] is not None for column in sourceColumns):
+            continue
+        indexed = db.execute('select {} from surveys where path = ? and step = ?'.format(', '.join(sourceColumns)),
+                             (row['path'], row['step'])).fetchone()
+        if indexed is not None:
+            for column in sourceColumns:
+                if row[column] is None:
+                    row[column] = indexed[column]
+    return rows
+
+
+def writeRows(db, rows, paths=()):
+    """Replaces the rows of every file in rows (and paths) with rows, in one transaction.
+
+    Args:
+        db: connection from connect
+        rows: list of row dictionaries from describeFile
+        paths: further files whose rows are removed (eg. files that are gone) (default=())
+
+    """
+    with db:
+        for path in set(row['path'] for row in rows) | set(paths):
+            db.execute('delete from surveys where path = ?', (path,))
+        db.executemany('insert into surveys ({}) values ({})'.format(', '.join(columns), ', '.join('?' * len(columns))),
+                       [tuple(row[column] for column in columns) for row in rows])
+
+
+def updateFile(ncFile, indexFile=defaultIndexFile, sourceFile=None):
+    """Indexes (or re-indexes) one netCDF file, called by the writers after each file they write.
+
+    Args:
+        ncFile: netCDF file written
+        indexFile: SQLite index file (default=defaultIndexFile)
+        sourceFile: survey file it was made from (default=None), see describeFile
+
+    Returns:
+        list of the rows written
+
+    """
+    rows = describeFile(ncFile, sourceFile)
+    db = connect(indexFile)
+    try:
+        writeRows(db, rows)
+    finally:
+        db.close()
+    return rows
+
+
+def query(indexFile=defaultIndexFile, surveyNumber=None, start=None, end=None, box=None, kind=None, vehicle=None):
+    """Finds the surveys in the index.
+
+    Args:
+        indexFile: SQLite index file (default=defaultIndexFile)
+        surveyNumber: survey number (default=None, any)
+        start: surveys that end on or after this time, datetime or seconds since 1970-01-01 (default=None)
+        end: surveys that start on or before this time, datetime or seconds since 1970-01-01 (default=None)
+        box: (xMin, xMax, yMin, yMax) FRF area the survey extent has to overlap (default=None)
+        kind: 'transect' or 'grid' (default=None, both)
+        vehicle: survey vehicle name, eg. 'larc' (default=None, any)
+
+    Returns:
+        list of row dictionaries (see columns) in time order
+
+    """
+    where, arguments = [], []
+    if surveyNumber is not None:
+        where.append('surveyNumber = ?')
+        arguments.append(int(surveyNumber))
+    if start is not None:
+        where.append('timeEnd >= ?')
+        arguments.append(_epoch(start))
+    if end is not None:
+        where.append('timeStart <= ?')
+        arguments.append(_epoch(end))
+    if box is not None:
+        where.append('xMax >= ? and xMin <= ? and yMax >= ? and yMin <= ?')
+        arguments.extend([box[0], box[1], box[2], box[3]])
+    if kind is not None:
+        where.append('kind = ?')
+        arguments.append(kind)
+    if vehicle is not None:
+        where.append('vehicle = ?')
+        arguments.append(vehicle.lower())
+    sql = 'select * from surveys{} order by timeStart, path, step'.format(
+            ' where ' + ' and '.join(where) if where else '')
+    db = connect(indexFile)
+    try:
+        return [dict(row) for row in db.execute(sql, arguments)]
+    finally:
+        db.close()
+
+
+def _epoch(when):
+    """datetime (or seconds since 1970-01-01) to seconds since 1970-01-01"""
+    if isinstance(when, DT.datetime):
+        return float(nc.date2num(when, 'seconds since 1970-01-01'))
+    return float(when)
+
+
+def _isoDate(seconds):
+    """seconds since 1970-01-01 as an ISO date"""
+    return None if seconds is None else (DT.datetime(1970, 1, 1) + DT.timedelta(seconds=seconds)).strftime('%Y-%m-%d')
+
+
+def _describe(ncFile):
+    """describeFile for the rebuild pool, a file that can not be read is returned with its error"""
+    try:
+        return ncFile, describeFile(ncFile), None
+    except Exception as e:
+        return ncFile, [], '{}: {}'.format(type(e).__name__, e)
+
+
+def rebuild(paths, indexFile=defaultIndexFile, jobs=1, full=False):
+    """Scans existing archives into the index on a pool of worker processes.
+
+    Files whose size and modification time are unchanged since they were indexed are skipped unless full, and the
+    rows of files under the scanned directories that no longer exist are removed.  A rebuilt row keeps the vehicle,
+    instrumentation and version date already in the index when the file does not record them (products written
+    before the writers recorded their sources).  Only this process writes the index.
+
+    Args:
+        paths: list of netCDF files, directories (searched recursively for *.nc) or glob patterns
+        indexFile: SQLite index file (default=defaultIndexFile)
+        jobs: number of worker processes (default=1, None uses every core)
+        full: re-read every file (default=False)
+
+    Returns:
+        number of files indexed
+
+    """
+    fileList, directories = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            directories.append(os.path.join(os.path.abspath(path), ''))
+            fileList.extend(glob.glob(os.path.join(path, '**', '*.nc'), recursive=True))
+        else:
+            fileList.extend(glob.glob(path))
+    fileList = sorted(set(os.path.abspath(fname) for fname in fileList))
+
+    db = connect(indexFile)
+    try:
+        known = {row['path']: (row['size'], row['mtime'])
+                 for row in db.execute('select path, size, mtime from surveys')}
+        gone = [path for path in known if any(path.startswith(directory) for directory in directories) and
+                not os.path.isfile(path)]
+        todo = []
+        for fname in fileList:
+            stat = os.stat(fname)
+            if full or known.get(fname) != (stat.st_size, stat.st_mtime):
+                todo.append(fname)
+        print('Indexing %d of %d file(s), removing %d' % (len(todo), len(fileList), len(gone)))
+        writeRows(db, [], gone)
+        start, rows = time.time(), []
+        if jobs is None or jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = pool.map(_describe, todo, chunksize=16)
+                for fname, fileRows, error in results:
+                    rows.extend(_keepSourceFields(db, fileRows))
+                    if error is not None:
+                        print('<<ERROR>> %s %s' % (fname, error))
+                    if len(rows) >= 1000:  # commit as it goes so an interrupted rebuild keeps its work
+                        writeRows(db, rows)
+                        rows = []
+        else:
+            for fname, fileRows, error in map(_describe, todo):
+                rows.extend(_keepSourceFields(db, fileRows))
+                if error is not None:
+                    print('<<ERROR>> %s %s' % (fname, error))
+        writeRows(db, rows)
+        print('  <II> indexed %d file(s) in %.1f s' % (len(todo), time.time() - start))
+    finally:
+        db.close()
+    return len(todo)
+
+
+if __name__ == "__main__":
+    opts, args = getopt.gnu_getopt(sys.argv[1:], "hj:", ["help", "index=", "jobs=", "full", "survey=", "start=",
+                                                          "end=", "box=", "kind=", "vehicle="])
+    opts = dict(opts)
+    if '-h' in opts or '--help' in opts or len(args) == 0 or args[0] not in ['query', 'rebuild', 'update']:
+        print(__doc__)
+        sys.exit(0)
+    indexFile = opts.get('--index', defaultIndexFile)
+    if args[0] == 'rebuild':
+        rebuild(args[1:], indexFile, jobs=int(opts.get('--jobs', opts.get('-j', 1))), full='--full' in opts)
+    elif args[0] == 'update':
+        for fname in args[1:]:
+            updateFile(fname, indexFile)
+    else:
+        toDate = lambda text: DT.datetime.strptime(text, '%Y-%m-%d')
+        start = time.time()
+        found = query(indexFile, surveyNumber=opts.get('--survey', None),
+                      start=toDate(opts['--start']) if '--start' in opts else None,
+                      end=toDate(opts['--end']) if '--end' in opts else None,
+                      box=[float(edge) for edge in opts['--box'].split(',')] if '--box' in opts else None,
+                      kind=opts.get('--kind', None), vehicle=opts.get('--vehicle', None))
+        for row in found:
+            print('%s %-8s survey %-6s %s - %s x %s-%s y %s-%s %s' % (
+                    row['path'] + ('[%d]' % row['step'] if row['step'] else ''), row['kind'], row['surveyNumber'],
+                    _isoDate(row['timeStart']), _isoDate(row['timeEnd']), row['xMin'], row['xMax'], row['yMin'],
+                    row['yMax'], row['vehicle']))
+        print('%d survey(s) in %.1f ms' % (len(found), (time.time() - start) * 1e3))
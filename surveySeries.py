@@ -0,0 +1,161 @@
+"""Reads a series of survey netCDF files as one dataset along time.
+
+SurveySeries stacks the grid files (FRF-geomorphology_DEMs_surveyDEM_*.nc, or cubes) or the transect files
+(FRF-geomorphology_elevationTransects_survey_*.nc) along their time dimension, in time order.  Only the time of every
+file is read up front, a variable is read when it is sliced and then only the hyperslab asked for is read from each
+file it touches.  Files are opened on demand and at most maxOpen are held open (least recently used are closed), so a
+time series at one grid node over decades of surveys reads one value per survey and never holds the grids in memory
+
+    with SurveySeries('/data/FRF/survey/gridded/FRF-geomorphology_DEMs_surveyDEM_*.nc') as series:
+        j, i = series.node(xFRF=500, yFRF=900)
+        elevation = series['elevation'][:, j, i]
+        dates = series.dates
+"""
+import glob
+import collections
+import numpy as np
+import netCDF4 as nc
+
+
+class SurveySeries(object):
+    """Survey netCDF files presented as one dataset along time."""
+
+    def __init__(self, files, maxOpen=16, timeDim='time'):
+        """
+        Args:
+            files: glob pattern or list of netCDF files (of one kind, grid or transect)
+            maxOpen: largest number of files held open at once (default=16)
+            timeDim: dimension the files are stacked along (default='time')
+
+        """
+        if isinstance(files, str):
+            files = glob.glob(files)
+        if len(files) == 0:
+            raise IOError('no survey files to read')
+        self.maxOpen = max(1, maxOpen)
+        self.timeDim = timeDim
+        self._handles = collections.OrderedDict()  # file: open dataset, least recently used first
+        firstTimes, times = {}, {}
+        for fname in files:
+            fid = self._open(fname)
+            times[fname] = np.ma.getdata(fid.variables[timeDim][:])
+            firstTimes[fname] = times[fname].min() if times[fname].size else np.inf
+        self.files = sorted(files, key=lambda fname: firstTimes[fname])
+        # global index along time -> file number and index in that file
+        self.times = np.concatenate([times[fname] for fname in self.files])
+        self.fileNumber = np.concatenate([np.full(times[fname].size, number, dtype=int)
+                                          for number, fname in enumerate(self.files)])
+        self.fileIndex = np.concatenate([np.arange(times[fname].size) for fname in self.files])
+        self.timeUnits = self._open(self.files[0]).variables[timeDim].units
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.times.size
+
+    def __contains__(self, var):
+        return var in self._open(self.files[0]).variables
+
+    def __getitem__(self, var):
+        """lazy view of a variable, see SeriesVariable"""
+        if var not in self:
+            raise KeyError('{} is not a variable of {}'.format(var, self.files[0]))
+        return SeriesVariable(self, var)
+
+    @property
+    def variables(self):
+        """names of the variables (those of the first file)"""
+        return list(self._open(self.files[0]).variables)
+
+    @property
+    def dates(self):
+        """times as datetimes"""
+        return nc.num2date(self.times, self.timeUnits, only_use_cftime_datetimes=False)
+
+    def node(self, xFRF, yFRF):
+        """Index of the grid node nearest a location.
+
+        Args:
+            xFRF: cross-shore FRF coordinate
+            yFRF: along-shore FRF coordinate
+
+        Returns:
+            (yFRF index, xFRF index), for slicing grid variables [time, yFRF, xFRF]
+
+        """
+        fid = self._open(self.files[0])
+        return (int(np.abs(fid.variables['yFRF'][:] - yFRF).argmin()),
+                int(np.abs(fid.variables['xFRF'][:] - xFRF).argmin()))
+
+    def _open(self, fname):
+        """the open dataset of a file, opening it (and closing the least recently used) if needed"""
+        fid = self._handles.pop(fname, None)
+        if fid is None:
+            fid = nc.Dataset(fname)
+            while len(self._handles) >= self.maxOpen:
+                self._handles.popitem(last=False)[1].close()
+        self._handles[fname] = fid
+        return fid
+
+    def close(self):
+        """closes every open file"""
+        while self._handles:
+            self._handles.popitem()[1].close()
+
+
+class SeriesVariable(object):
+    """A variable of a SurveySeries, read when sliced.
+
+    Variables along time are sliced as one array over all the files ([time, ...] as in a single file), only the files
+    with the requested time steps are opened and only the requested hyperslab is read from each.  Variables without
+    time (eg. xFRF, yFRF, latitude, longitude of the grids) are read from the first file.
+    """
+
+    def __init__(self, series, name):
+        self.series = series
+        self.name = name
+        variable = series._open(series.files[0]).variables[name]
+        self.dimensions = variable.dimensions
+        self.dtype = variable.dtype
+        self.alongTime = len(self.dimensions) > 0 and self.dimensions[0] == series.timeDim
+        self.shape = (len(series),) + variable.shape[1:] if self.alongTime else variable.shape
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        series = self.series
+        if not self.alongTime:
+            return series._open(series.files[0]).variables[self.name][key]
+        key = key if isinstance(key, tuple) else (key,)
+        timeKey, rest = key[0], key[1:]
+        if rest and rest[0] is Ellipsis:
+            rest = rest[1:]
+        steps = np.arange(len(series))[timeKey]
+        if np.ndim(steps) == 0:  # a single time step
+            return self._read(series.fileNumber[steps], [series.fileIndex[steps]], rest)[0]
+        parts = []
+        # one read per run of consecutive time steps from the same file
+        changes = np.flatnonzero(np.diff(series.fileNumber[steps])) + 1
+        for run in np.split(steps, changes):
+            if run.size:
+                parts.append(self._read(series.fileNumber[run[0]], series.fileIndex[run], rest))
+        if not parts:
+            return self._read(0, [], rest)
+        return np.ma.concatenate(parts, axis=0)
+
+    def _read(self, fileNumber, indices, rest):
+        """reads time steps indices (of one file) of the variable, with rest of the key on the other dimensions"""
+        variable = self.series._open(self.series.files[fileNumber]).variables[self.name]
+        indices = np.asarray(indices, dtype=int)
+        if indices.size == 0:
+            timeKey = slice(0, 0)
+        elif (np.diff(indices) == 1).all():
+            timeKey = slice(int(indices[0]), int(indices[-1]) + 1)  # a contiguous hyperslab (keeps the time axis)
+        else:
+            timeKey = indices
+        return variable[(timeKey,) + tuple(rest)]
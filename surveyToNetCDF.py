@@ -1,37 +1,53 @@
 """This file converts netCDF using specific file name inputs for both transect and grids
 can be run from terminal
+    python surveyToNetCDF.py [--rewrite-source] [--profile] [--cube=cube.nc] [--zarr=store.zarr] file
 """
-import sys, getopt, os
-import geoprocess as gp
-import makenc, time
+import sys, getopt, os, glob
+import contextlib
+import gridTemplate
+import makenc
 import netCDF4 as nc
 import sblib as sb
 
 import py2netCDF as p2nc
+import py2zarr
+import surveyIndex
 import datetime as DT
 import numpy as np
 import survey_SortTime as ss
+import stageMetrics
+import profiling
 
 
-def convertText2NetCDF(fnameIn):
+## INPUTS
+yamlPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'yamlFiles')
+gridGlobalYaml = os.path.join(yamlPath, 'grid_Global.yml')  # grid Global yaml
+gridVarYaml = os.path.join(yamlPath, 'grid_variables.yml')  # grid yaml location
+transectGlobalYaml = os.path.join(yamlPath, 'transect_Global.yml')
+transectVarYaml = os.path.join(yamlPath, 'transect_variables.yml')
+
+
+def convertText2NetCDF(fnameIn, rewriteSource=False, **kwargs):
     """This function searches the given path for both grids and transect files present at the FRF to make the data into
     netCDF files.
-    Assumes a file called 'logs' in the local directory    
 
     the below yaml's have to be in the same folder as the
-    
+
+    Transect surveys are parsed once: the survey is read and sorted by time in memory (survey_SortTime) and that table
+    is handed straight to the transect reader.
+
     :param fnameIn: a path to find the yaml files and the data
+    :param rewriteSource: also write the time sorted survey back over the input .csv (default False, the raw archive
+            file is left untouched)
+    :key logFile: error log file (default Bathy_LOG.log next to fnameIn)
+    :key stageLog: JSON lines log of the stage timings (default Bathy_STAGES.jsonl next to fnameIn), see stageMetrics
+    :key profileDir: profile the conversion, writing the reports and sampled stacks to this directory (default None,
+            not profiled), see profiling
+    :key cube: grid cube file the grid survey is appended to instead of being written to its own file (default None),
+            see convertGridFile
+    :key zarrStore: zarr store the grid survey is also appended to (default None), see convertGridFile
     :return:
     """
-    ## INPUTS
-    yamlPath = 'yamlFiles/'
-    gridGlobalYaml = yamlPath + 'grid_Global.yml'  # grid Global yaml
-    gridVarYaml = yamlPath + 'grid_variables.yml'  # grid yaml location
-    transectGlobalYaml = yamlPath + 'transect_Global.yml'
-    transectVarYaml = yamlPath + 'transect_variables.yml'
-
-    # this function has been added to sort the survey by time before netcdf conversion
-    ss.surveySortTime(fnameIn)
     ## INPUTS  - rename
     if fnameIn.split('.')[-1] in ['txt', "txt'"]:
         filelist = []
@@ -43,14 +59,10 @@ def convertText2NetCDF(fnameIn):
         filelist = []
         gridList = []
         print('<<ERROR>> No Files To Convert to NetCDF')
-        
-<<<<<<< HEAD
-    #logFile = os.path.join(globPath, 'Bathy_LOG.log')
-    #logFile = '/home/mikef/PycharmProjects/netcdf_Survey/Bathy_LOG.log'
-=======
-    logFile = os.path.join('logs',globPath+'Bathy_LOG.log')
-    #logFile = '/home/mikef/PycharmProjects/netcdfSurvey/Bathy_LOG.log'
->>>>>>> afeda5bd312e3f42e63c2bc7c1d8ce88ff3556d1
+
+    logFile = kwargs.get('logFile', os.path.join(os.path.dirname(fnameIn), 'Bathy_LOG.log'))
+    stageLog = kwargs.get('stageLog', os.path.join(os.path.dirname(fnameIn), 'Bathy_STAGES.jsonl'))
+    profileDir = kwargs.get('profileDir', None)
 
     errorFname, errors = [],[]
 
@@ -58,14 +70,8 @@ def convertText2NetCDF(fnameIn):
     print('Converting %d Transect (csv) file(s) to netCDF ' % len(filelist))
     for transectFname in filelist:
         try:
-            fname_parts = os.path.basename(transectFname).split('_')
-            Tofname = os.path.join(os.path.dirname(transectFname),'FRF-geomorphology_elevationTransects_survey_{}.nc'.format(fname_parts[1]))
-            print('  <II> Making %s ' % Tofname)
-            # first make transect
-            TransectDict = sb.import_FRF_Transect(fnameIn)  # import frf Transect product
-            TransectDict['time'] = nc.date2num(TransectDict['time'], 'seconds since 1970-01-01')
-            TransectDict['date'] = [int(i.strftime('%s')) for i in TransectDict['date']]
-            makenc.makenc_FRFTransect(bathyDict=TransectDict, ofname=Tofname, globalYaml=transectGlobalYaml, varYaml=transectVarYaml)
+            with _profiled(profileDir, transectFname):
+                convertTransectFile(transectFname, rewriteSource=rewriteSource)
         except Exception as e:
             print(e)
             errors.append(e)
@@ -74,14 +80,9 @@ def convertText2NetCDF(fnameIn):
     print('Converting %d Grid (txt) file to netCDF ' % len(gridList))
     for gridFname in gridList:
         try:
-            # load text file
-            outDict = sb.importFRFgrid(gridFname)
-
-            outDict, date = preprocessGridFile(outDict, gridFname)
-            ofname = 'FRF-geomorphology_DEMs_surveyDEM_{}.nc'.format(date)
-            print('  <II> Making %s ' %ofname)
-            p2nc.makenc_generic(ofname, gridGlobalYaml, gridVarYaml, data=outDict)
-            
+            with _profiled(profileDir, gridFname):
+                convertGridFile(gridFname, appendTo=kwargs.get('cube', None),
+                                zarrStore=kwargs.get('zarrStore', None))
         except Exception as e:
             print(e)
             errors.append(e)
@@ -95,6 +96,186 @@ def convertText2NetCDF(fnameIn):
     for aa in range(0, len(errorFname)):  # looping through errors
         f.write('%s,\n %s\n----------------------------\n\n' %(errorFname[aa], errors[aa]))
     f.close()
+    # log the time taken by each stage of the conversion
+    stageMetrics.writeStageLog(stageMetrics.collectStages(), stageLog)
+    if profileDir is not None:  # add up the stacks of every file profiled into profileDir
+        aggregate = os.path.join(profileDir, 'aggregate.folded')
+        profiling.mergeFolded([f for f in glob.glob(os.path.join(profileDir, '*.folded')) if f != aggregate], aggregate)
+
+def _profiled(profileDir, fname):
+    """profiles the conversion of fname into profileDir, does nothing when profileDir is None"""
+    if profileDir is None:
+        return contextlib.nullcontext()
+    print('  <II> profiling to %s' % profileDir)
+    return profiling.profiled(os.path.join(profileDir, os.path.splitext(os.path.basename(fname))[0]))
+
+def convertTransectFile(transectFname, ofname='FRF-geomorphology_elevationTransects_survey_{date}.nc', outDir=None,
+                        rewriteSource=False, sortSurvey=True, indexFile=None):
+    """Converts a single transect survey (csv) file to netCDF.
+
+    Args:
+        transectFname: transect survey .csv file
+        ofname: output file name, formatted with date (survey date from the file name), base (input file name
+            without extension) and stem (base without its last '_' field, the version)
+            (default='FRF-geomorphology_elevationTransects_survey_{date}.nc')
+        outDir: output directory (default=None, same directory as transectFname)
+        rewriteSource: also write the time sorted survey back over the input .csv (default=False)
+        sortSurvey: sort the survey by time before conversion (default=True)
+        indexFile: inventory index updated with the file written (default=None, no index), see surveyIndex
+
+    Returns:
+        output netCDF file name
+
+    """
+    TransectDict = readTransectFile(transectFname, rewriteSource=rewriteSource, sortSurvey=sortSurvey)
+    return writeTransectFile(prepareTransectData(TransectDict), transectFname, ofname=ofname, outDir=outDir,
+                             indexFile=indexFile)
+
+def readTransectFile(transectFname, rewriteSource=False, sortSurvey=True):
+    """Reads (and time sorts) a transect survey, the parsing stage of convertTransectFile.
+
+    Args:
+        transectFname: transect survey .csv file
+        rewriteSource: also write the time sorted survey back over the input .csv (default=False)
+        sortSurvey: sort the survey by time before conversion (default=True)
+
+    Returns:
+        transect dictionary, see sblib.import_FRF_Transect
+
+    """
+    if sortSurvey:
+        # sort the survey by time before netcdf conversion, in memory, then make transect from the sorted table
+        with stageMetrics.stage('surveySortTime', fname=transectFname, inFile=transectFname) as stage:
+            surveyFrame = ss.surveySortTime(transectFname, writeFile=rewriteSource)
+            stage['points'] = len(surveyFrame) if surveyFrame is not None else None
+    else:
+        surveyFrame = None
+    with stageMetrics.stage('import_FRF_Transect', fname=transectFname,
+                            inFile=transectFname if surveyFrame is None else None) as stage:
+        TransectDict = sb.import_FRF_Transect(transectFname, surveyFrame=surveyFrame)  # import frf Transect product
+        stage['points'] = len(TransectDict['xFRF'])
+    return TransectDict
+
+def prepareTransectData(TransectDict):
+    """converts the times of a transect dictionary to what the netCDF file stores (epoch seconds)"""
+    TransectDict['time'] = nc.date2num(TransectDict['time'], 'seconds since 1970-01-01')
+    TransectDict['date'] = [int(i.strftime('%s')) for i in TransectDict['date']]
+    return TransectDict
+
+def writeTransectFile(TransectDict, transectFname, ofname='FRF-geomorphology_elevationTransects_survey_{date}.nc',
+                      outDir=None, indexFile=None):
+    """Writes a prepared transect dictionary to netCDF, the writing stage of convertTransectFile.
+
+    Args:
+        TransectDict: transect dictionary from readTransectFile and prepareTransectData
+        transectFname: transect survey .csv file it was read from (names the output)
+        ofname: output file name, see convertTransectFile
+        outDir: output directory (default=None, same directory as transectFname)
+        indexFile: inventory index updated with the file written (default=None, no index), see surveyIndex
+
+    Returns:
+        output netCDF file name
+
+    """
+    fname_parts = os.path.basename(transectFname).split('_')
+    if outDir is None:
+        outDir = os.path.dirname(transectFname)
+    Tofname = os.path.join(outDir, ofname.format(date=fname_parts[1], **_nameParts(transectFname)))
+    print('  <II> Making %s ' % Tofname)
+    with stageMetrics.stage('write_data_to_nc', fname=transectFname, points=len(TransectDict['xFRF']),
+                            outFile=Tofname):  # file creation and close (compression) included
+        makenc.makenc_FRFTransect(bathyDict=TransectDict, ofname=Tofname, globalYaml=transectGlobalYaml,
+                                  varYaml=transectVarYaml, sourceFile=transectFname)
+    _updateIndex(indexFile, Tofname, transectFname)
+
+    return Tofname
+
+def convertGridFile(gridFname, ofname='FRF-geomorphology_DEMs_surveyDEM_{date}.nc', outDir='', appendTo=None,
+                    zarrStore=None, indexFile=None):
+    """Converts a single grid (txt) file to netCDF.
+
+    Args:
+        gridFname: grid .txt file
+        ofname: output file name, formatted with date (survey date from the file name), base (input file name
+            without extension) and stem (base without its last '_' field, the version)
+            (default='FRF-geomorphology_DEMs_surveyDEM_{date}.nc')
+        outDir: output directory (default='', the working directory)
+        appendTo: cube file the survey is appended to as a new time step instead of being written to its own file
+            (default=None), see py2netCDF.appendnc_generic, only one process may append to a cube at a time
+        zarrStore: zarr store the survey is also appended to as a new time step (default=None), see
+            py2zarr.makezarr_generic, only one process may write to a store at a time
+        indexFile: inventory index updated with the file written (default=None, no index), see surveyIndex
+
+    Returns:
+        output netCDF file name
+
+    """
+    outDict, date = prepareGridData(readGridFile(gridFname), gridFname)
+    return writeGridFile(outDict, date, gridFname, ofname=ofname, outDir=outDir, appendTo=appendTo,
+                         zarrStore=zarrStore, indexFile=indexFile)
+
+def readGridFile(gridFname):
+    """reads a grid (txt) file, the parsing stage of convertGridFile, see sblib.importFRFgrid"""
+    # load text file
+    with stageMetrics.stage('importFRFgrid', fname=gridFname, inFile=gridFname) as stage:
+        outDict = sb.importFRFgrid(gridFname)
+        stage['points'] = np.size(outDict['raw_z'])
+    return outDict
+
+def prepareGridData(outDict, gridFname):
+    """places a read grid on the FRF template, see preprocessGridFile, returns outDict and the survey date"""
+    with stageMetrics.stage('preprocessGridFile', fname=gridFname, points=np.size(outDict['raw_z'])):
+        return preprocessGridFile(outDict, gridFname)
+
+def writeGridFile(outDict, date, gridFname, ofname='FRF-geomorphology_DEMs_surveyDEM_{date}.nc', outDir='',
+                  appendTo=None, zarrStore=None, indexFile=None):
+    """Writes a prepared grid to netCDF, the writing stage of convertGridFile.
+
+    Args:
+        outDict: grid dictionary from readGridFile and prepareGridData
+        date: survey date string (yyyymmdd) from prepareGridData
+        gridFname: grid .txt file it was read from (names the output)
+        ofname: output file name, see convertGridFile
+        outDir: output directory (default='', the working directory)
+        appendTo: cube file the survey is appended to instead of being written to its own file (default=None)
+        zarrStore: zarr store the survey is also appended to (default=None)
+        indexFile: inventory index updated with the file written (default=None, no index)
+
+    Returns:
+        output netCDF file name
+
+    """
+    if appendTo is not None:
+        ofname = appendTo
+        print('  <II> Appending to %s ' %ofname)
+    else:
+        ofname = os.path.join(outDir, ofname.format(date=date, **_nameParts(gridFname)))
+        print('  <II> Making %s ' %ofname)
+    with stageMetrics.stage('write_data_to_nc', fname=gridFname, points=np.size(outDict['elevation']),
+                            outFile=ofname):  # file creation and close (compression) included
+        p2nc.makenc_generic(ofname, gridGlobalYaml, gridVarYaml, data=outDict, append=appendTo is not None,
+                            sourceFile=gridFname)
+    if zarrStore is not None:
+        print('  <II> Appending to %s ' %zarrStore)
+        with stageMetrics.stage('write_data_to_zarr', fname=gridFname, points=np.size(outDict['elevation'])):
+            py2zarr.makezarr_generic(zarrStore, gridGlobalYaml, gridVarYaml, data=outDict)
+    _updateIndex(indexFile, ofname, gridFname)
+
+    return ofname
+
+def _updateIndex(indexFile, ofname, sourceFname):
+    """adds a file written to the inventory index, a failure is reported but does not fail the conversion"""
+    if indexFile is None:
+        return
+    try:
+        surveyIndex.updateFile(ofname, indexFile, sourceFile=sourceFname)
+    except Exception as e:  # the file is fine, surveyIndex.rebuild catches the index up
+        print('<<ERROR>> indexing %s: %s' % (ofname, e))
+
+def _nameParts(fname):
+    """parts of the input file name available to the output file name patterns"""
+    base = os.path.splitext(os.path.basename(fname))[0]
+    return {'base': base, 'stem': '_'.join(base.split('_')[:-1]) or base}
 
 def preprocessGridFile(outDict, gridFname):
     """ taking read file, preprocessing to expected netCDF file
@@ -112,10 +293,11 @@ def preprocessGridFile(outDict, gridFname):
     # process data into background data size and shape (with fill values)
     
     #check to make sure that xFRF and yFRF are in total dataset.
-    outDict['xFRF'], outDict['yFRF'], outDict['longitude'], outDict['latitude'], \
-    outDict['elevation'] = fillFRFgridTemplate(xFRF=np.unique(outDict['raw_x']),
-                                               yFRF=np.unique(outDict['raw_y']),
-                                               elev=outDict['raw_z'])
+    with stageMetrics.stage('fillFRFgridTemplate', fname=gridFname, points=np.size(outDict['raw_z'])):
+        outDict['xFRF'], outDict['yFRF'], outDict['longitude'], outDict['latitude'], \
+        outDict['elevation'] = fillFRFgridTemplate(xFRF=np.unique(outDict['raw_x']),
+                                                   yFRF=np.unique(outDict['raw_y']),
+                                                   elev=outDict['raw_z'])
     # now parse platform
     if split[5].lower() == 'crab':
         outDict['surveyVehicle'] = 0
@@ -146,6 +328,11 @@ def preprocessGridFile(outDict, gridFname):
 
 def fillFRFgridTemplate(xFRF, yFRF, elev, **kwargs):
     """ Function will take place this grid into the larger FRF template grid initalized by keyword arguments
+
+    The grid nodes are placed by index arithmetic on the template spacing, each node has to land within tolerance
+    (fraction of a cell) of a template node, so float jitter in the survey coordinates is absorbed and grids that are
+    off the template raise instead of being silently misaligned.  Parts of the grid outside of the template bounds are
+    dropped.
     
     Args:
         xFRF: 1d array of xFRF values in grid (non-unique)
@@ -159,6 +346,8 @@ def fillFRFgridTemplate(xFRF, yFRF, elev, **kwargs):
         'gridYmin':  minimum FRF Y distance for netCDF file (default=-100)
         'gridXmax':  maximum FRF X distance for netCDF file (default=950)
         'gridXmin':  minimum FRF xdistance for netCDF file (default=50)
+        'tolerance': largest offset of a grid node from its template node, as a fraction of the grid spacing
+            (default=0.01)
         
     Returns:
         2D arrays that match size of previous files for xFRF, yFRF, lon, lat, Elevation with fill values surrounding
@@ -169,58 +358,101 @@ def fillFRFgridTemplate(xFRF, yFRF, elev, **kwargs):
     gridYmax = kwargs.get('gridYmax',  1100)  # maximum FRF Y distance for netCDF file
     gridYmin = kwargs.get('gridYmin', -100)   # minimum FRF Y distance for netCDF file
     gridXmax = kwargs.get('gridXmax', 950)    # maximum FRF X distance for netCDF file
-    gridXmin = kwargs.get('grixXmin', 50)     # minimum FRF xdistance for netCDF file
-    fill_value = '-999'
+    gridXmin = kwargs.get('gridXmin', 50)     # minimum FRF xdistance for netCDF file
+    tolerance = kwargs.get('tolerance', 0.01) # allowed node offset from the template, fraction of a cell
+    fill_value = -999.
     
     # parse input parameters
-    dx = np.median(np.diff(xFRF))                                                       # get grid resolution in x
-    dy = np.max(np.diff(yFRF))                                                          # get grid resolution in y
     xgrid = np.unique(xFRF)                                                             # create singular xGrid values
     ygrid = np.unique(yFRF)                                                             # create singular yGrid values
+    dx = _gridResolution(xgrid)                                                         # get grid resolution in x
+    dy = _gridResolution(ygrid)                                                         # get grid resolution in y
+    if np.size(elev) != ygrid.shape[0] * xgrid.shape[0]:
+        raise ValueError('The grid has {} elevations for {} x {} nodes, it is not a full rectangular grid'.format(
+                np.size(elev), ygrid.shape[0], xgrid.shape[0]))
     zgrid = np.reshape(elev, (ygrid.shape[0], xgrid.shape[0]))                          # add time dimension
     
-    # initalize netCDF output grid based on
-    ncXFRF = np.linspace(gridXmin, gridXmax, num=int((gridXmax - gridXmin) / dx + 1), endpoint=True)
-    ncYFRF = np.linspace(gridYmin, gridYmax, num=int((gridYmax - gridYmin) / dy + 1), endpoint=True)
+    # initalize netCDF output grid based on the template registry (coordinates are only computed once per resolution)
+    template = gridTemplate.getFRFgridTemplate(dx, dy, gridXmin=gridXmin, gridXmax=gridXmax, gridYmin=gridYmin,
+                                               gridYmax=gridYmax)
+    ncXFRF, ncYFRF = template['xFRF'], template['yFRF']
     ncElevation = np.full((1, np.shape(ncYFRF)[0], np.shape(ncXFRF)[0]), fill_value=fill_value, dtype=np.float64)
     
-    # find the overlap locations between input grid and the nodes used for the netCDF file
-    xOverlap = np.intersect1d(xgrid, ncXFRF)
-    yOverlap = np.intersect1d(ygrid, ncYFRF)
-    assert len(yOverlap) >= 3, 'The overlap between grid nodes and netCDF grid nodes is short'
-    
-    lastX = np.argwhere(ncXFRF == xOverlap[-1]).squeeze()  # these are indicies of the max overlap
-    firstX = np.argwhere(ncXFRF == xOverlap[0]).squeeze()  # these are indicies of the min overlap
-    lastY = np.argwhere(ncYFRF == yOverlap[-1]).squeeze()  # these are indices of the max overlap between the two grids
-    firstY = np.argwhere(ncYFRF == yOverlap[0]).squeeze()  # these are indices of the min overlap between the two grids
+    # find the template index of every grid node and which of them are inside of the template
+    xIndex, xInside = _templateIndex(xgrid, ncXFRF, tolerance, 'X')
+    yIndex, yInside = _templateIndex(ygrid, ncYFRF, tolerance, 'Y')
+    assert yInside.sum() >= 3 and xInside.any(), 'The overlap between grid nodes and netCDF grid nodes is short'
+    if not (xInside.all() and yInside.all()):
+        print('  <II> dropping %d x and %d y grid nodes outside of the netCDF template' % ((~xInside).sum(),
+                                                                                          (~yInside).sum()))
     
-    # fill the frame grid with the loaded data
-    ncElevation[0, firstY:lastY+1, firstX:lastX+1] = zgrid
+    # fill the frame grid with the loaded data, the nodes are contiguous so the placement is a block copy
+    ncElevation[0, yIndex[yInside][0]:yIndex[yInside][-1]+1, xIndex[xInside][0]:xIndex[xInside][-1]+1] = \
+        zgrid[yInside][:, xInside]
     
-    # run data check
-    assert set(xOverlap).issubset(ncXFRF), 'The FRF X values in your function do not fit into the netCDF format, please rectify'
-    assert set(yOverlap).issubset(ncYFRF), 'The FRF Y values in your function do not fit into the netCDF format, please rectify'
-    
-    # convert lon/lat from template x/y FRF
-    lonOut, latOut = [], []
-    xx, yy = np.meshgrid(ncXFRF, ncYFRF)
-    for val in zip(xx.flatten(), yy.flatten()):
-        coords = gp.FRFcoord(val[0], val[1])
-        lonOut.append(coords['Lon'])
-        latOut.append(coords['Lat'])
-    
-    lonOut = np.reshape(lonOut, (ncYFRF.shape[0], ncXFRF.shape[0]))
-    latOut = np.reshape(latOut, (ncYFRF.shape[0], ncXFRF.shape[0]))
+    # lon/lat of the template x/y FRF nodes
+    lonOut, latOut = template['longitude'], template['latitude']
     
     return ncXFRF, ncYFRF, lonOut, latOut, ncElevation
 
+def _gridResolution(gridNodes):
+    """ estimates the node spacing of a survey grid axis
+
+    The median of the steps between the unique nodes, so a few jittered or missing nodes do not change it, snapped with
+    gridTemplate.canonicalResolution so jitter of the survey coordinates does not make a new template resolution.
+
+    Args:
+        gridNodes: node locations of the survey grid (non-unique)
+
+    Returns:
+        grid resolution (m)
+
+    """
+    steps = np.diff(np.unique(gridNodes))
+    steps = steps[steps > 0]
+    if steps.size == 0:
+        raise ValueError('The grid has a single node along an axis, its resolution can not be found')
+    return gridTemplate.canonicalResolution(np.median(steps))
+
+def _templateIndex(gridNodes, templateNodes, tolerance, axis):
+    """ finds the index of each (sorted, unique) grid node in an evenly spaced template axis
+
+    Args:
+        gridNodes: sorted unique node locations of the survey grid
+        templateNodes: evenly spaced template node locations
+        tolerance: largest offset of a node from its template node, fraction of the template spacing
+        axis: axis name for error messages
+
+    Returns:
+        integer template index of every grid node, boolean mask of the nodes inside of the template
+
+    """
+    spacing = (templateNodes[-1] - templateNodes[0]) / (templateNodes.shape[0] - 1)
+    position = (gridNodes - templateNodes[0]) / spacing
+    index = np.rint(position).astype(np.int64)
+    offGrid = np.abs(position - index) > tolerance
+    if offGrid.any():
+        raise ValueError('The FRF {} values {} do not fit into the netCDF format, please rectify'.format(
+                axis, gridNodes[offGrid][:5]))
+    if (np.diff(index) != 1).any():
+        raise ValueError('The FRF {} values are not evenly spaced at the netCDF grid resolution {:g}'.format(
+                axis, spacing))
+    inside = (index >= 0) & (index < templateNodes.shape[0])
+    return index, inside
+
 if __name__ == "__main__":
-    opts, args = getopt.getopt(sys.argv[1:], "h", ["help"])
+    opts, args = getopt.getopt(sys.argv[1:], "h", ["help", "rewrite-source", "profile", "cube=", "zarr="])
+    opts = dict(opts)
 
     #  Location of where to look for files to convert
     globPath = args[0]
     if globPath.startswith("'") and globPath.endswith("'"):
         globPath = globPath[1:-1]
-    convertText2NetCDF(globPath)
+    if '--profile' in opts:  # reports go to profile/ next to the input file
+        profileDir = os.path.join(os.path.dirname(globPath), 'profile')
+    else:
+        profileDir = None
+    convertText2NetCDF(globPath, rewriteSource='--rewrite-source' in opts, profileDir=profileDir,
+                       cube=opts.get('--cube', None), zarrStore=opts.get('--zarr', None))
 
 
@@ -1,57 +1,75 @@
+import numpy as np
 import pandas as pd
-import datetime
 
-def surveySortTime(fname):
+def surveySortTime(fname, writeFile=True):
     """reads in .csv survey point file sorts based on hypack time
     (seconds) and then saves .csv with same name for input to
-    surveyToNetCDF.py"""
+    surveyToNetCDF.py
+
+    Args:
+        fname: survey .csv file name
+        writeFile: write the sorted survey back over fname (default=True), when False the source file is left as is
+            and the sorted table is only returned
+
+    Returns:
+        sorted survey table (pandas DataFrame, columns in file order with date/time as the strings that would be
+        written to the file) for sblib.import_FRF_Transect(surveyFrame=), None if fname is not a .csv
+
+    """
     if fname.split('.')[-1] in ["csv'", 'csv']:
         df = pd.read_csv(fname, header=None)
         print('*** working on file***{}'.format(fname))
-        df.columns = ['loc', 'lineNo', 'sureyNo', 'lat', 'long', 'easting', 'norhting', 'FRFX', 'FRFY', 'elevation',
-                      'ellipsoid', 'date', 'time', 'hypacktime']
-        df['time'] = df['time'].astype(int)
-        df['datetime'] = df['date'].astype(str) + df['time'].astype(str)
-        combinedDateTime = df['datetime']
-
-        for num, val in enumerate(combinedDateTime):
-            if len(val) == 9:
-                newVal = val.ljust(5 + len(val), '0')
-                combinedDateTime = combinedDateTime._set_value(num, newVal)
-
-        df['datetime'] = combinedDateTime
-
-        df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce', format='%Y%m%d%H%M%S')
-        df['epochtime'] = df['datetime'].apply(lambda x: (x - datetime.datetime(1970, 1, 1)).total_seconds())
-        df = df.sort_values(by=['epochtime'], axis=0).reset_index(drop=True)
-
-        df['interp'] = df['epochtime'].duplicated()
-        df['newdata'] = df['epochtime'][df['interp']]
-
-        num = 0.25
-        for val in range(len(df) - 1):
-            if df.loc[val, 'interp'] == True:
-                df.loc[val, 'newdata'] = df.loc[val, 'newdata'] + num
-                num = num + 0.25
-
-            else:
-                if df.loc[val, 'interp'] == False:
-                    num = 0.25
-
-        df.newdata.fillna(df.epochtime, inplace=True)
-        df = df.sort_values(by=['newdata'], axis=0).reset_index(drop=True)
-        df['datetime'] = pd.to_datetime(df['newdata'], unit='s')
-        df = df.drop_duplicates(subset=['datetime'])
-
-        df['date'] = df['datetime'].dt.strftime('%Y%m%d')
-        df['time'] = df['datetime'].dt.strftime('%H%M%S.%f').astype('str')
-
-        del df['datetime'], df['epochtime'], df['interp'], df['newdata']
-        df.to_csv(fname[:-4] + '.csv', header=False, index=False)
+        df = sortSurveyFrame(df)
+        if writeFile:
+            df.to_csv(fname[:-4] + '.csv', header=False, index=False)
+        return df
     else:
         None
 
 
+def sortSurveyFrame(df):
+    """sorts an already parsed survey table on time, spreading repeated time stamps 0.25 s apart
+
+    Args:
+        df: survey table as read from the .csv (14 columns in file order)
+
+    Returns:
+        sorted table with date (YYYYMMDD) and time (HHMMSS.ffffff) as strings
+
+    """
+    df.columns = ['loc', 'lineNo', 'sureyNo', 'lat', 'long', 'easting', 'norhting', 'FRFX', 'FRFY', 'elevation',
+                  'ellipsoid', 'date', 'time', 'hypacktime']
+    df['time'] = df['time'].astype(int)
+    df['datetime'] = df['date'].astype(str) + df['time'].astype(str)
+    # 9 character date times (single digit time) are padded with zeros to the full YYYYMMDDHHMMSS
+    df['datetime'] = df['datetime'].where(df['datetime'].str.len() != 9, df['datetime'] + '00000')
+
+    df['datetime'] = pd.to_datetime(df['datetime'], errors='coerce', format='%Y%m%d%H%M%S')
+    df['epochtime'] = (df['datetime'] - pd.Timestamp(1970, 1, 1)).dt.total_seconds()
+    df = df.sort_values(by=['epochtime'], axis=0).reset_index(drop=True)
+
+    # points sharing a time stamp are spread 0.25 s apart: the n-th repeat of a time (they are consecutive once
+    # sorted) gets n * 0.25 s added.  The last point is left as is, as it always has been.
+    df['interp'] = df['epochtime'].duplicated()
+    interp = df['interp'].to_numpy()
+    rows = np.arange(len(df))
+    repeatCount = rows - np.maximum.accumulate(np.where(interp, 0, rows))  # consecutive repeats so far
+    jitter = np.where(interp, repeatCount * 0.25, 0)
+    if len(jitter):
+        jitter[-1] = 0
+    df['newdata'] = np.where(interp, df['epochtime'].to_numpy() + jitter, df['epochtime'].to_numpy())
+
+    df = df.sort_values(by=['newdata'], axis=0).reset_index(drop=True)
+    df['datetime'] = pd.to_datetime(df['newdata'], unit='s')
+    df = df.drop_duplicates(subset=['datetime'])
+
+    df['date'] = df['datetime'].dt.strftime('%Y%m%d')
+    df['time'] = df['datetime'].dt.strftime('%H%M%S.%f').astype('str')
+
+    del df['datetime'], df['epochtime'], df['interp'], df['newdata']
+    return df
+
+
 
 
 